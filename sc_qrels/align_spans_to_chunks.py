@@ -1,9 +1,15 @@
 # sc_qrels/align_spans_to_chunks.py
 import json
+import bisect
+import random
+import sys
+import time
 from pathlib import Path
 from collections import defaultdict
 import argparse
 
+from chunk_manifest import discover_manifests, iter_doc_groups, strategy_name_from_path
+
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
@@ -40,11 +46,73 @@ def calculate_overlap_and_lengths(
     
     return l_span, l_chunk, l_overlap
 
+def passes_coverage_thresholds(l_span: float, l_chunk: float, l_overlap: float) -> bool:
+    """Applies the SME/chunk coverage thresholds to one span-chunk overlap."""
+    if l_span == 0 or l_chunk == 0 or l_overlap == 0:
+        return False
+    coverage_sme = l_overlap / l_span
+    coverage_chunk = l_overlap / l_chunk
+    return coverage_sme >= COVERAGE_SME_THRESHOLD and coverage_chunk >= COVERAGE_CHUNK_THRESHOLD
+
+# ---------------------------------------------------------------------------
+# Interval Index (sorted chunk starts + bisect)
+# ---------------------------------------------------------------------------
+def build_chunk_interval_index(doc_chunks: list[dict]) -> tuple[list[int], list[dict], int]:
+    """Sorts one document's chunks by start offset for bisect-based lookup.
+
+    Returns the sorted start offsets, the chunks in that same order, and the
+    length of the longest chunk. The longest length bounds how far to the left
+    of a span an overlapping chunk can start, which keeps the lookup exact even
+    for overlapping windows (CHARWIN, BGE512T) where chunk ends are not sorted.
+    """
+    sorted_chunks = sorted(doc_chunks, key=lambda c: c["start"])
+    starts = [c["start"] for c in sorted_chunks]
+    max_chunk_len = max((c["end"] - c["start"] for c in sorted_chunks), default=0)
+    return starts, sorted_chunks, max_chunk_len
+
+def iter_overlapping_chunks(chunk_index: tuple[list[int], list[dict], int], span_start: int, span_end: int):
+    """Yields only the chunks whose [start, end) range overlaps [span_start, span_end)."""
+    starts, sorted_chunks, max_chunk_len = chunk_index
+    # A chunk overlaps iff chunk_start < span_end and chunk_end > span_start.
+    # chunk_end <= chunk_start + max_chunk_len, so chunk_start must exceed span_start - max_chunk_len.
+    lo = bisect.bisect_right(starts, span_start - max_chunk_len)
+    hi = bisect.bisect_left(starts, span_end)
+    for i in range(lo, hi):
+        chunk = sorted_chunks[i]
+        if chunk["end"] > span_start:
+            yield chunk
+
+def align_doc_spans(doc_spans: list[dict], doc_chunks: list[dict]) -> list[tuple[str, str]]:
+    """Aligns one document's SME spans to its chunks using the interval index.
+
+    Returns one (qid, chunk_id) entry per successful span-to-chunk alignment.
+    """
+    chunk_index = build_chunk_interval_index(doc_chunks)
+    aligned = []
+    for sme_span in doc_spans:
+        s_qid, s_start, s_end = sme_span["qid"], sme_span["start"], sme_span["end"]
+        for chunk in iter_overlapping_chunks(chunk_index, s_start, s_end):
+            l_span, l_chunk, l_overlap = calculate_overlap_and_lengths(s_start, s_end, chunk["start"], chunk["end"])
+            if passes_coverage_thresholds(l_span, l_chunk, l_overlap):
+                aligned.append((s_qid, chunk["chunk_id"]))
+    return aligned
+
+def align_doc_spans_bruteforce(doc_spans: list[dict], doc_chunks: list[dict]) -> list[tuple[str, str]]:
+    """Reference O(spans x chunks) alignment, kept for benchmarking and parity checks."""
+    aligned = []
+    for sme_span in doc_spans:
+        s_qid, s_start, s_end = sme_span["qid"], sme_span["start"], sme_span["end"]
+        for chunk in doc_chunks:
+            l_span, l_chunk, l_overlap = calculate_overlap_and_lengths(s_start, s_end, chunk["start"], chunk["end"])
+            if passes_coverage_thresholds(l_span, l_chunk, l_overlap):
+                aligned.append((s_qid, chunk["chunk_id"]))
+    return aligned
+
 # ---------------------------------------------------------------------------
 # Main Alignment Logic
 # ---------------------------------------------------------------------------
 def align_spans_to_strategy(chunk_manifest_path: Path):
-    strategy_name = chunk_manifest_path.stem.replace("chunks_", "")
+    strategy_name = strategy_name_from_path(chunk_manifest_path)
     print(f"\n--- Aligning Spans to Chunks for Strategy: {strategy_name} ---")
     print(f"Using chunk manifest: {chunk_manifest_path}")
     print(f"Using merged annotations: {ANNOTATIONS_MERGED_FILE}")
@@ -73,78 +141,44 @@ def align_spans_to_strategy(chunk_manifest_path: Path):
         else:
             print(f"  ⚠️ Skipping invalid or zero-length span in merged annotations: QID={ann.get('qid')}, DOCID={ann.get('docid')}, Start={ann.get('start')}, End={ann.get('end')}", file=sys.stderr)
 
+    print(f"  Loaded {len(all_merged_annotations)} merged annotations.")
 
-    # 2. Load Chunks for the given strategy
-    chunks_for_strategy_by_docid = defaultdict(list)
+    # 2. Stream the chunks one document at a time and 3. align each document's spans
+    # Store relevant (qid, chunk_id) pairs to ensure uniqueness in qrels output
+    relevant_qid_chunk_id_pairs = set()
+    alignments_count = 0
     total_chunks_loaded = 0
     try:
-        with open(chunk_manifest_path, "r", encoding="utf-8") as f:
-            for line in f:
-                chunk = json.loads(line)
-                # Ensure chunks are valid (start < end)
-                if chunk.get("start") is not None and chunk.get("end") is not None and chunk["start"] < chunk["end"]:
-                    chunks_for_strategy_by_docid[chunk["original_doc_id"]].append(chunk)
-                    total_chunks_loaded += 1
+        for docid, doc_chunks in iter_doc_groups(chunk_manifest_path):
+            # Ensure chunks are valid (start < end)
+            valid_doc_chunks = []
+            for chunk in doc_chunks:
+                if chunk["start"] < chunk["end"]:
+                    valid_doc_chunks.append(chunk)
                 else:
-                     print(f"  ⚠️ Skipping invalid or zero-length chunk in {chunk_manifest_path.name}: CHUNK_ID={chunk.get('chunk_id')}, DOCID={chunk.get('original_doc_id')}, Start={chunk.get('start')}, End={chunk.get('end')}", file=sys.stderr)
+                    print(f"  ⚠️ Skipping invalid or zero-length chunk in {chunk_manifest_path.name}: CHUNK_ID={chunk['chunk_id']}, DOCID={docid}, Start={chunk['start']}, End={chunk['end']}", file=sys.stderr)
+            total_chunks_loaded += len(valid_doc_chunks)
+
+            # Documents without SME annotations contribute no alignments. The reverse case (spans but
+            # no chunks) is possible if, e.g., a document was empty after normalization or too short
+            # for the chunker; such a document simply never shows up here.
+            if docid not in spans_by_docid or not valid_doc_chunks:
+                continue
+            doc_alignments = align_doc_spans(spans_by_docid[docid], valid_doc_chunks)
+            relevant_qid_chunk_id_pairs.update(doc_alignments)
+            alignments_count += len(doc_alignments) # Counts each successful span-to-chunk alignment event
     except FileNotFoundError:
         print(f"❌ ERROR: Chunk manifest file not found: {chunk_manifest_path}", file=sys.stderr)
         return
-    except json.JSONDecodeError as e:
-        print(f"❌ ERROR: Could not decode JSON from {chunk_manifest_path}: {e}", file=sys.stderr)
+    except (ValueError, KeyError) as e:
+        print(f"❌ ERROR: Could not read chunk manifest {chunk_manifest_path}: {e}", file=sys.stderr)
         return
-        
+
     if total_chunks_loaded == 0:
         print(f"ℹ️ No valid chunks loaded from {chunk_manifest_path.name}. No qrels will be generated.", file=sys.stderr)
         return
-    
-    print(f"  Loaded {len(all_merged_annotations)} merged annotations.")
-    print(f"  Loaded {total_chunks_loaded} chunks for strategy {strategy_name}.")
-
-    # 3. Perform Alignment
-    # Store relevant (qid, chunk_id) pairs to ensure uniqueness in qrels output
-    relevant_qid_chunk_id_pairs = set()
-    alignments_count = 0
 
-    # Iterate through docids that have annotations
-    for docid, doc_spans in spans_by_docid.items():
-        if docid not in chunks_for_strategy_by_docid:
-            # This means a document had SME annotations but no chunks were generated for it by this strategy
-            # This is possible if, e.g., a document was empty after normalization or too short for the chunker
-            # print(f"  ℹ️ No chunks found for document {docid} in strategy {strategy_name}, though it has {len(doc_spans)} SME spans.", file=sys.stderr)
-            continue
-
-        doc_chunks_for_strategy = chunks_for_strategy_by_docid[docid]
-
-        for sme_span in doc_spans:
-            s_qid = sme_span["qid"]
-            s_start = sme_span["start"]
-            s_end = sme_span["end"]
-
-            for chunk in doc_chunks_for_strategy:
-                c_id = chunk["chunk_id"]
-                c_start = chunk["start"]
-                c_end = chunk["end"]
-
-                l_span, l_chunk, l_overlap = calculate_overlap_and_lengths(s_start, s_end, c_start, c_end)
-
-                if l_span == 0: # Should have been filtered, but double check
-                    # print(f"  ⚠️ Skipping SME span with zero length: QID={s_qid} Start={s_start} End={s_end}", file=sys.stderr)
-                    continue
-                if l_chunk == 0: # Should have been filtered
-                    # print(f"  ⚠️ Skipping chunk with zero length: CHUNK_ID={c_id} Start={c_start} End={c_end}", file=sys.stderr)
-                    continue
-                
-                if l_overlap == 0: # No overlap, no need to calculate coverage
-                    continue
-
-                coverage_sme = l_overlap / l_span
-                coverage_chunk = l_overlap / l_chunk
-
-                if coverage_sme >= COVERAGE_SME_THRESHOLD and coverage_chunk >= COVERAGE_CHUNK_THRESHOLD:
-                    relevant_qid_chunk_id_pairs.add((s_qid, c_id))
-                    alignments_count +=1 # Counts each successful span-to-chunk alignment event
-    
+    print(f"  Streamed {total_chunks_loaded} chunks for strategy {strategy_name}.")
     print(f"  Found {alignments_count} individual span-to-chunk alignments.")
     print(f"  Resulting in {len(relevant_qid_chunk_id_pairs)} unique (qid, chunk_id) relevant pairs.")
 
@@ -160,8 +194,52 @@ def align_spans_to_strategy(chunk_manifest_path: Path):
         print(f"ℹ️ No relevant (qid, chunk_id) pairs found for strategy {strategy_name}. No qrels file generated.")
 
 
+# ---------------------------------------------------------------------------
+# Benchmark: interval index vs. brute-force double loop
+# ---------------------------------------------------------------------------
+BENCHMARK_CHUNK_COUNTS = [250, 1000, 4000, 16000]
+BENCHMARK_SPANS_PER_DOC = 200
+
+def make_synthetic_doc(num_chunks: int, num_spans: int, overlapping: bool, seed: int = 13):
+    """Builds SENT-like (or windowed) chunks and random SME spans over one synthetic document."""
+    rng = random.Random(seed)
+    chunks = []
+    pos = 0
+    for i in range(num_chunks):
+        length = rng.randint(40, 300)
+        end = pos + (length * 3 if overlapping else length)
+        chunks.append({"chunk_id": f"BENCH-{i:06d}", "start": pos, "end": end})
+        pos += length + 1
+    spans = []
+    for i in range(num_spans):
+        s_start = rng.randint(0, max(0, pos - 400))
+        spans.append({"qid": f"q_{i:05d}", "start": s_start, "end": s_start + rng.randint(20, 400)})
+    return spans, chunks
+
+def run_alignment_benchmark(chunk_counts: list[int] = BENCHMARK_CHUNK_COUNTS, num_spans: int = BENCHMARK_SPANS_PER_DOC):
+    print(f"--- Alignment Benchmark ({num_spans} spans per document) ---")
+    print(f"{'layout':<12}{'chunks':>8}{'bruteforce_s':>14}{'indexed_s':>12}{'speedup':>10}{'alignments':>12}")
+    for overlapping in (False, True):
+        layout = "windowed" if overlapping else "sentences"
+        for num_chunks in chunk_counts:
+            spans, chunks = make_synthetic_doc(num_chunks, num_spans, overlapping)
+
+            t0 = time.perf_counter()
+            expected = align_doc_spans_bruteforce(spans, chunks)
+            t_brute = time.perf_counter() - t0
+
+            t0 = time.perf_counter()
+            actual = align_doc_spans(spans, chunks)
+            t_indexed = time.perf_counter() - t0
+
+            if sorted(expected) != sorted(actual):
+                print(f"❌ ERROR: Indexed alignment differs from brute force ({layout}, {num_chunks} chunks).", file=sys.stderr)
+                sys.exit(1)
+            speedup = t_brute / t_indexed if t_indexed > 0 else float("inf")
+            print(f"{layout:<12}{num_chunks:>8}{t_brute:>14.4f}{t_indexed:>12.4f}{speedup:>9.1f}x{len(actual):>12}")
+
 def run_all_strategies():
-    manifest_files = sorted(CHUNK_MANIFESTS_DIR.glob("*.jsonl"))
+    manifest_files = discover_manifests(CHUNK_MANIFESTS_DIR)
     if not manifest_files:
         print(f"No chunk manifest files found in {CHUNK_MANIFESTS_DIR} to process.", file=sys.stderr)
         return
@@ -174,10 +252,19 @@ if __name__ == "__main__":
     parser.add_argument(
         "--chunk_manifest", 
         type=str, 
-        help="Path to a specific chunk manifest file to process (e.g., data/processed/chunk_manifests/chunks_SENT.jsonl). If not provided, all manifests in the directory will be processed."
+        help="Path to a specific chunk manifest (.jsonl file or .cols bundle) to process (e.g., data/processed/chunk_manifests/chunks_SENT.jsonl). If not provided, all manifests in the directory will be processed."
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Time the interval-index alignment against the brute-force double loop on synthetic documents of growing chunk count, then exit."
     )
     args = parser.parse_args()
 
+    if args.benchmark:
+        run_alignment_benchmark()
+        sys.exit(0)
+
     if args.chunk_manifest:
         manifest_path = Path(args.chunk_manifest)
         if manifest_path.exists():
@@ -0,0 +1,135 @@
+# sc_qrels/annotation_journal.py
+"""Append-only, resumable storage for one SME's span annotations.
+
+``generate_synthetic_queries.py`` writes annotations question by question
+instead of holding them all until the end. For an output path such as
+``data/processed/annotations_sme1_openai.json`` there are:
+
+- ``annotations_sme1_openai.jsonl``           one annotation (span) per line
+- ``annotations_sme1_openai.progress.jsonl``  one ``{"sme_id", "qid", "spans"}`` line per finished question
+
+A question's spans are appended and fsynced before its progress line, so the
+progress file is the commit record: spans of a question without a progress
+line (a crash mid-question) are dropped when the journal is reopened, and the
+question is simply asked again. A restarted run skips every (sme_id, qid)
+already in the progress file.
+
+``consolidate()`` writes the final ``.json`` array (``indent=2``, in question
+order, byte-identical to ``json.dump``) by streaming the JSONL through a
+per-question offset index, so memory does not grow with the number of spans.
+"""
+
+import json
+import os
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Set
+
+
+def journal_paths(output_path: Path) -> Dict[str, Path]:
+    output_path = Path(output_path)
+    return {
+        "spans": output_path.with_suffix(".jsonl"),
+        "progress": output_path.with_name(f"{output_path.stem}.progress.jsonl"),
+    }
+
+
+def _iter_json_lines(path: Path):
+    """Yields (byte offset, record) per line; a torn last line from a crash is skipped."""
+    if not path.exists():
+        return
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            try:
+                yield offset, json.loads(line)
+            except ValueError:
+                pass
+            offset += len(line)
+
+
+class AnnotationJournal:
+    """Per-question append-only writer plus progress manifest for one SME's annotations."""
+
+    def __init__(self, output_path: Path, sme_id: str, resume: bool = False):
+        self.output_path = Path(output_path)
+        self.sme_id = sme_id
+        paths = journal_paths(self.output_path)
+        self.spans_path = paths["spans"]
+        self.progress_path = paths["progress"]
+        self.done: Set[str] = set()
+
+        if resume:
+            self.done = {record["qid"] for _, record in _iter_json_lines(self.progress_path)
+                         if record.get("sme_id") == sme_id and "qid" in record}
+            self._compact()
+        else:
+            self.spans_path.unlink(missing_ok=True)
+            self.progress_path.unlink(missing_ok=True)
+        self._spans_file = open(self.spans_path, "a", encoding="utf-8")
+        self._progress_file = open(self.progress_path, "a", encoding="utf-8")
+
+    def _compact(self) -> None:
+        """Drops spans of unfinished questions (and torn lines) left by an interrupted run."""
+        if not self.spans_path.exists():
+            return
+        tmp_path = self.spans_path.with_name(f"{self.spans_path.name}.tmp")
+        kept = dropped = 0
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            for _, record in _iter_json_lines(self.spans_path):
+                if record.get("qid") in self.done:
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    kept += 1
+                else:
+                    dropped += 1
+        os.replace(tmp_path, self.spans_path)
+        if dropped:
+            print(f"  ℹ️ {self.sme_id}: dropped {dropped} spans of unfinished questions from {self.spans_path.name}", file=sys.stderr)
+
+    @staticmethod
+    def _sync(f) -> None:
+        f.flush()
+        os.fsync(f.fileno())
+
+    def is_done(self, qid: str) -> bool:
+        return qid in self.done
+
+    def record(self, qid: str, annotations: List[Dict]) -> None:
+        """Durably appends one finished question's spans, then marks the question done."""
+        if annotations:
+            self._spans_file.write("".join(json.dumps(a, ensure_ascii=False) + "\n" for a in annotations))
+            self._sync(self._spans_file)
+        self._progress_file.write(json.dumps({"sme_id": self.sme_id, "qid": qid, "spans": len(annotations)}) + "\n")
+        self._sync(self._progress_file)
+        self.done.add(qid)
+
+    def consolidate(self, question_order: Iterable[str]) -> int:
+        """Writes the .json array of all journaled spans in question order; returns the span count."""
+        self._spans_file.flush()
+        offsets_by_qid: Dict[str, List[int]] = defaultdict(list)
+        for offset, record in _iter_json_lines(self.spans_path):
+            offsets_by_qid[record.get("qid")].append(offset)
+
+        count = 0
+        tmp_path = self.output_path.with_name(f"{self.output_path.name}.tmp")
+        with open(self.spans_path, "rb") as spans, open(tmp_path, "w", encoding="utf-8") as out:
+            out.write("[")
+            for qid in question_order:
+                for offset in offsets_by_qid.get(qid, ()):
+                    spans.seek(offset)
+                    annotation = json.loads(spans.readline())
+                    # Same layout json.dump(list, indent=2) gives each element
+                    body = json.dumps(annotation, indent=2, ensure_ascii=False).replace("\n", "\n  ")
+                    out.write(("," if count else "") + "\n  " + body)
+                    count += 1
+            out.write("\n]" if count else "]")
+        if count:
+            os.replace(tmp_path, self.output_path)
+        else:
+            tmp_path.unlink()
+        return count
+
+    def close(self) -> None:
+        self._spans_file.close()
+        self._progress_file.close()
@@ -1,25 +1,22 @@
 # sc_qrels/chunk_documents.py
+import argparse
+import itertools
 import json
-import re
+import os
+import random
+import time
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
 from pathlib import Path
+import numpy as np
 import nltk # For sentence tokenization
+from nltk.tokenize.punkt import PunktTokenizer
 from transformers import AutoTokenizer # For token-based chunking
 import sys
 
-nltk.download('punkt_tab')
-
-# Ensure NLTK's punkt tokenizer is downloaded (user might need to run this once manually or add to setup)
-try:
-    nltk.data.find('tokenizers/punkt')
-except (LookupError, nltk.downloader.DownloadError): # Catch both if punkt not found or general download error
-    print("NLTK 'punkt' tokenizer not found. Attempting to download...", file=sys.stderr)
-    try:
-        nltk.download('punkt', quiet=False) # Set quiet=False to see download progress/errors
-        print("NLTK 'punkt' tokenizer downloaded successfully.", file=sys.stderr)
-    except Exception as e:
-        print(f"Error downloading NLTK 'punkt': {e}", file=sys.stderr)
-        print("Please ensure NLTK's 'punkt' model is available. You might need to run: import nltk; nltk.download('punkt')", file=sys.stderr)
-        # Depending on strictness, you might sys.exit(1) here if sentence tokenization is critical
+from chunk_manifest import load_manifest, write_columnar
+from document_store import get_default_store
 
 # ---------------------------------------------------------------------------
 # Configuration
@@ -31,128 +28,215 @@ CHUNK_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 # --- Tokenizer for Token-Based Strategy ---
 TOKENIZER_MODEL_NAME = "BAAI/bge-large-en-v1.5"
-try:
-    hf_tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_MODEL_NAME, use_fast=True)
-except Exception as e:
-    print(f"Error loading HuggingFace tokenizer {TOKENIZER_MODEL_NAME}: {e}", file=sys.stderr)
-    print("Token-based chunking will fail.", file=sys.stderr)
-    hf_tokenizer = None
+# Loaded by load_tokenizer(): once in the main process for serial runs, or once
+# per pool worker (via the pool initializer) with --workers N.
+hf_tokenizer = None
+
+def load_tokenizer():
+    global hf_tokenizer
+    try:
+        hf_tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_MODEL_NAME, use_fast=True)
+    except Exception as e:
+        print(f"Error loading HuggingFace tokenizer {TOKENIZER_MODEL_NAME}: {e}", file=sys.stderr)
+        print("Token-based chunking will fail.", file=sys.stderr)
+        hf_tokenizer = None
+    return hf_tokenizer
+
 
+# --- Sentence Tokenizer for the SENT Strategy ---
+SENTENCE_TOKENIZER_LANGUAGE = "english"
+_sentence_tokenizer = None
+
+def ensure_punkt_data():
+    """Downloads NLTK's punkt_tab model on first use if it is not installed yet."""
+    try:
+        nltk.data.find('tokenizers/punkt_tab')
+    except LookupError:
+        print("NLTK 'punkt_tab' tokenizer not found. Attempting to download...", file=sys.stderr)
+        if nltk.download('punkt_tab', quiet=False): # Set quiet=False to see download progress/errors
+            print("NLTK 'punkt_tab' tokenizer downloaded successfully.", file=sys.stderr)
+        else:
+            print("Please ensure NLTK's 'punkt_tab' model is available. You might need to run: import nltk; nltk.download('punkt_tab')", file=sys.stderr)
+
+def get_sentence_tokenizer() -> PunktTokenizer:
+    """The punkt model behind nltk.sent_tokenize, loaded once per process."""
+    global _sentence_tokenizer
+    if _sentence_tokenizer is None:
+        ensure_punkt_data()
+        _sentence_tokenizer = PunktTokenizer(SENTENCE_TOKENIZER_LANGUAGE)
+    return _sentence_tokenizer
+
+# --- SENT Benchmark (synthetic corpus) ---
+BENCHMARK_SENT_NUM_DOCS = 200
+BENCHMARK_SENT_SENTENCES_PER_DOC = 2000
 
 # ---------------------------------------------------------------------------
-# Text Normalization Function (MUST BE IDENTICAL ACROSS ALL SCRIPTS)
+# Shared Per-Document Analysis
 # ---------------------------------------------------------------------------
-def normalize_text_for_chunking(text: str) -> str:
-    text = text.replace('’', "'").replace('‘', "'")
-    text = text.replace('”', '"').replace('“', '"')
-    text = text.replace('—', '-').replace('–', '-')
-    text = re.sub(r'\s+', ' ', text).strip() # Collapses all whitespace (newlines, tabs, multiple spaces) to single space
-    return text
+class PreparedDocument:
+    """A document loaded and normalized once, shared by every chunking strategy.
+
+    Token offsets and sentences are computed lazily and at most once per
+    document, so all token-window strategies reuse one tokenization, all
+    sentence strategies reuse one sentence split, and character strategies
+    pay for neither.
+    """
+    def __init__(self, doc_id: str, normalized_text: str, tokenizer=None):
+        self.doc_id = doc_id
+        self.text = normalized_text
+        self.tokenizer = tokenizer
+
+    @cached_property
+    def token_offsets(self) -> np.ndarray:
+        """(num_tokens, 2) int64 array of token (char_start, char_end) in the normalized text."""
+        # add_special_tokens=False is important for not adding CLS/SEP to the content itself
+        tokenized_output = self.tokenizer.encode_plus(
+            self.text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_tensors="np", # Offsets come back as one array instead of a list of tuples
+            truncation=False # We handle chunking manually
+        )
+        return np.asarray(tokenized_output["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+
+    @cached_property
+    def sentence_spans(self) -> list[tuple[int, int]]:
+        """(char_start, char_end) of every sentence, straight from punkt's span_tokenize.
+
+        sent_tokenize returns exactly text[start:end] for these spans, so the
+        offsets need no searching to recover.
+        """
+        return list(get_sentence_tokenizer().span_tokenize(self.text))
+
+def load_prepared_document(doc_file_path: Path, tokenizer) -> PreparedDocument | None:
+    """Takes one document's normalized text from the document store; returns None if it has nothing to chunk."""
+    document_store = get_default_store(doc_file_path.parent)
+    # The store keys documents by the "docid" inside the JSON, not by file name
+    doc_id = document_store.doc_id_for_source(doc_file_path.name)
+    normalized_text = document_store.get(doc_id)
+    if not normalized_text: # Missing/empty 'text', or empty after normalization
+        print(f"  Normalized text for {doc_id} is empty. Skipping chunking.", file=sys.stderr)
+        return None
+    return PreparedDocument(doc_id, normalized_text, tokenizer)
 
 # ---------------------------------------------------------------------------
 # Chunking Strategy Implementations
 # ---------------------------------------------------------------------------
 
 # Strategy 1: Token-Based Sliding Window (BGE512T)
-def chunk_strategy_token_window(normalized_doc_text: str, doc_id: str, 
-                                tokenizer, chunk_size_tokens: int, stride_tokens: int):
-    if not tokenizer:
-        print(f"  [TokenWindow] Tokenizer not available for {doc_id}. Skipping.", file=sys.stderr)
-        return []
-        
-    chunks = []
-    # Tokenize the entire normalized document to get input_ids and offset_mappings
-    # add_special_tokens=False is important for not adding CLS/SEP to the content itself
-    tokenized_output = tokenizer.encode_plus(
-        normalized_doc_text,
-        add_special_tokens=False, 
-        return_offsets_mapping=True,
-        truncation=False # We handle chunking manually
-    )
-    
-    all_token_ids = tokenized_output["input_ids"]
-    all_offset_mapping = tokenized_output["offset_mapping"] # List of (char_start, char_end)
-
-    if not all_token_ids: # Handle empty text after normalization/tokenization
-        return []
+def token_window_bounds(token_offsets: np.ndarray, chunk_size_tokens: int, stride_tokens: int):
+    """Character (starts, ends) of every token window, computed with array slicing.
 
-    chunk_index = 0
-    for i in range(0, len(all_token_ids), stride_tokens):
-        current_chunk_token_ids = all_token_ids[i : i + chunk_size_tokens]
-        current_chunk_offset_mapping = all_offset_mapping[i : i + chunk_size_tokens]
+    Windows start every stride_tokens tokens and span up to chunk_size_tokens
+    tokens; the sequence stops after the first window that reaches the last
+    token. Windows with an empty character span are dropped.
+    """
+    num_tokens = len(token_offsets)
+    if num_tokens == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
 
-        if not current_chunk_token_ids: # Should not happen if loop condition is correct
-            continue
+    first_tokens = np.arange(0, num_tokens, stride_tokens)
+    reaches_end = first_tokens + chunk_size_tokens >= num_tokens
+    if reaches_end.any():
+        first_tokens = first_tokens[: int(np.argmax(reaches_end)) + 1]
+    last_tokens = np.minimum(first_tokens + chunk_size_tokens, num_tokens) - 1
 
-        # Character start is from the first token of this chunk
-        char_start = current_chunk_offset_mapping[0][0]
-        # Character end is from the last token of this chunk
-        char_end = current_chunk_offset_mapping[-1][1]
-        
-        # The text for the manifest is the slice from the *normalized document* using these char offsets
-        chunk_text_from_normalized_doc = normalized_doc_text[char_start:char_end]
+    # Character start is from the first token of each window, end from its last token
+    char_starts = token_offsets[first_tokens, 0]
+    char_ends = token_offsets[last_tokens, 1]
+    non_empty = char_ends > char_starts
+    return char_starts[non_empty], char_ends[non_empty]
 
-        if not chunk_text_from_normalized_doc.strip(): # Avoid empty or all-whitespace chunks
+def iter_token_window_chunks(doc: PreparedDocument, char_starts: np.ndarray, char_ends: np.ndarray,
+                             chunk_size_tokens: int, stride_tokens: int):
+    """Yields token-window chunk records one at a time from the precomputed bounds."""
+    chunk_index = 0
+    for char_start, char_end in zip(char_starts.tolist(), char_ends.tolist()):
+        # The text for the manifest is the slice from the *normalized document* using these char offsets
+        chunk_text_from_normalized_doc = doc.text[char_start:char_end]
+        if not chunk_text_from_normalized_doc.strip(): # Avoid all-whitespace chunks
             continue
-
-        chunks.append({
-            "original_doc_id": doc_id,
-            "chunk_id": f"TOKWIN{chunk_size_tokens}S{stride_tokens}-{doc_id}-{chunk_index:04d}",
+        yield {
+            "original_doc_id": doc.doc_id,
+            "chunk_id": f"TOKWIN{chunk_size_tokens}S{stride_tokens}-{doc.doc_id}-{chunk_index:04d}",
             "start": char_start,
             "end": char_end,
             "text": chunk_text_from_normalized_doc
-        })
+        }
         chunk_index += 1
-        
-        # Stop if this chunk already covers up to or beyond the end of the token list
-        if (i + chunk_size_tokens) >= len(all_token_ids):
-            break
-            
-    return chunks
+
+def chunk_strategy_token_window(doc: PreparedDocument, chunk_size_tokens: int, stride_tokens: int):
+    if not doc.tokenizer:
+        print(f"  [TokenWindow] Tokenizer not available for {doc.doc_id}. Skipping.", file=sys.stderr)
+        return []
+    # Offsets come from the document's single shared tokenization. The bounds are
+    # computed here; the records are built lazily as the manifest writer consumes them.
+    char_starts, char_ends = token_window_bounds(doc.token_offsets, chunk_size_tokens, stride_tokens)
+    return iter_token_window_chunks(doc, char_starts, char_ends, chunk_size_tokens, stride_tokens)
 
 # Strategy 2: Sentence-Based Chunking (SENT)
-def chunk_strategy_sentences(normalized_doc_text: str, doc_id: str):
+def chunk_strategy_sentences(doc: PreparedDocument):
     chunks = []
+    normalized_doc_text, doc_id = doc.text, doc.doc_id
     try:
-        sentences = nltk.sent_tokenize(normalized_doc_text)
+        sentence_spans = doc.sentence_spans
     except Exception as e:
-        print(f"  [SentenceChunker] NLTK sent_tokenize error for {doc_id}: {e}. Skipping sentence chunking for this doc.", file=sys.stderr)
+        print(f"  [SentenceChunker] NLTK sentence tokenization error for {doc_id}: {e}. Skipping sentence chunking for this doc.", file=sys.stderr)
         return []
 
+    # Offsets come directly from the tokenizer in one linear pass; i counts every
+    # sentence (including skipped blank ones) so chunk ids stay stable.
+    for i, (char_start, char_end) in enumerate(sentence_spans):
+        sentence_text = normalized_doc_text[char_start:char_end]
+        if not sentence_text.strip():
+            continue
+
+        chunks.append({
+            "original_doc_id": doc_id,
+            "chunk_id": f"SENT-{doc_id}-{i:04d}", # Using index as part of ID
+            "start": char_start,
+            "end": char_end,
+            "text": sentence_text # Text is the sentence itself
+        })
+    return chunks
+
+def chunk_strategy_sentences_by_search(doc: PreparedDocument):
+    """Previous SENT implementation, kept as the reference for --benchmark_sent.
+
+    Re-locates every sentence returned by sent_tokenize (the same punkt model's
+    tokenize) with str.index from the previous sentence's end, falling back to
+    a find from position 0.
+    """
+    chunks = []
+    normalized_doc_text, doc_id = doc.text, doc.doc_id
+    sentences = get_sentence_tokenizer().tokenize(normalized_doc_text)
+
     current_search_offset = 0
     for i, sentence_text in enumerate(sentences):
         if not sentence_text.strip():
             continue
-        
         try:
-            # Find the sentence in the normalized text to get its accurate start offset
-            # This is important because sent_tokenize might handle some punctuation slightly differently
-            # or if there are identical sentences.
             char_start = normalized_doc_text.index(sentence_text, current_search_offset)
         except ValueError:
-            # Fallback if sentence not found from current_search_offset (e.g. due to very subtle modifications by tokenizer)
-            # This should be rare if normalized_doc_text is stable.
             char_start = normalized_doc_text.find(sentence_text)
             if char_start == -1:
-                print(f"  [SentenceChunker] Warning: Could not reliably find sentence in {doc_id}: '{sentence_text[:50]}...'", file=sys.stderr)
-                continue # Skip this problematic sentence
-        
+                continue
         char_end = char_start + len(sentence_text)
-        
         chunks.append({
             "original_doc_id": doc_id,
-            "chunk_id": f"SENT-{doc_id}-{i:04d}", # Using index as part of ID
+            "chunk_id": f"SENT-{doc_id}-{i:04d}",
             "start": char_start,
             "end": char_end,
-            "text": sentence_text # Text is the sentence itself
+            "text": sentence_text
         })
-        current_search_offset = char_end # Ensure next search starts after this sentence
+        current_search_offset = char_end
     return chunks
 
 # Strategy 3: Fixed-Character Window (CHAR_WIN_500_OV50)
-def chunk_strategy_char_window(normalized_doc_text: str, doc_id: str, 
-                               window_size_chars: int, overlap_chars: int):
+def chunk_strategy_char_window(doc: PreparedDocument, window_size_chars: int, overlap_chars: int):
     chunks = []
+    normalized_doc_text, doc_id = doc.text, doc.doc_id
     step = window_size_chars - overlap_chars
     if step <= 0:
         print(f"  [CharWindow] Error: Window size ({window_size_chars}) must be greater than overlap ({overlap_chars}). Skipping for {doc_id}.", file=sys.stderr)
@@ -181,75 +265,474 @@ def chunk_strategy_char_window(normalized_doc_text: str, doc_id: str,
     return chunks
 
 # Strategy 4: Large Character Blocks (Non-Overlapping, CHAR_BLOCK_1000_NOV0)
-def chunk_strategy_char_blocks(normalized_doc_text: str, doc_id: str, 
-                               block_size_chars: int): # Overlap is 0
+def chunk_strategy_char_blocks(doc: PreparedDocument, block_size_chars: int): # Overlap is 0
     # This is a special case of char_window with overlap=0
-    return chunk_strategy_char_window(normalized_doc_text, doc_id, 
-                                      window_size_chars=block_size_chars, 
-                                      overlap_chars=0)
+    return chunk_strategy_char_window(doc, window_size_chars=block_size_chars, overlap_chars=0)
+
+
+# ---------------------------------------------------------------------------
+# Strategy Registry
+# ---------------------------------------------------------------------------
+# Each entry: (strategy_name, function_to_call, args_for_function (excluding the PreparedDocument))
+DEFAULT_STRATEGIES = [
+    ("BGE512T_S128", chunk_strategy_token_window, (512, 128)),
+    ("SENT", chunk_strategy_sentences, ()),
+    ("CHARWIN500_OV50", chunk_strategy_char_window, (500, 50)),
+    ("CHARBLOCK1000_NOV0", chunk_strategy_char_blocks, (1000,)), # Only block_size needed
+]
+
+# --- Incremental Rebuild ---
+# Each manifest gets a chunks_<strategy>.index.json sidecar recording the strategy
+# parameters and, per source document, its content hash and the byte range of its
+# chunks in the manifest. Bump CHUNKER_VERSION whenever a strategy's output
+# changes for the same parameters, so existing indexes stop being reused.
+CHUNK_INDEX_FORMAT = "sc-qrels-chunk-index/1"
+CHUNKER_VERSION = 1
+
+# --- Parameter Sweep ---
+SWEEP_OUTPUT_DIR = CHUNK_OUTPUT_DIR / "sweep" # Kept apart so chunk_manifests/*.jsonl globs only see the defaults
+SWEEP_SUMMARY_FILENAME = "sweep_summary.tsv"
+MAX_STRATEGIES_FOR_PER_DOC_COUNTS = 8 # Above this, per-document progress lines only show totals
 
+def parse_char_window(value: str) -> tuple[int, int]:
+    """Parses a WINDOW:OVERLAP pair such as '500:50' (argparse type)."""
+    try:
+        window_str, overlap_str = value.split(":")
+        window_size_chars, overlap_chars = int(window_str), int(overlap_str)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected WINDOW:OVERLAP (e.g. 500:50), got {value!r}")
+    if window_size_chars <= overlap_chars or overlap_chars < 0:
+        raise argparse.ArgumentTypeError(f"Window size must exceed a non-negative overlap, got {value!r}")
+    return window_size_chars, overlap_chars
+
+def build_sweep_strategies(window_sizes: list[int], strides: list[int],
+                           char_windows: list[tuple[int, int]], include_sentences: bool = False):
+    """Expands size/stride and char-window lists into registry entries, one per configuration.
+
+    Token configurations whose stride exceeds the window size would leave tokens
+    uncovered and are skipped.
+    """
+    strategies = []
+    for chunk_size_tokens in window_sizes:
+        for stride_tokens in strides:
+            if stride_tokens > chunk_size_tokens:
+                print(f"ℹ️ Skipping token window {chunk_size_tokens} with stride {stride_tokens} (stride exceeds window).")
+                continue
+            strategies.append((f"BGE{chunk_size_tokens}T_S{stride_tokens}", chunk_strategy_token_window,
+                               (chunk_size_tokens, stride_tokens)))
+    for window_size_chars, overlap_chars in char_windows:
+        strategies.append((f"CHARWIN{window_size_chars}_OV{overlap_chars}", chunk_strategy_char_window,
+                           (window_size_chars, overlap_chars)))
+    if include_sentences:
+        strategies.append(("SENT", chunk_strategy_sentences, ()))
+    return strategies
 
 # ---------------------------------------------------------------------------
 # Main Orchestration
 # ---------------------------------------------------------------------------
-def main():
+def chunk_prepared_document(doc: PreparedDocument, strategies) -> dict[str, Iterable[dict]]:
+    """Runs every strategy over one prepared document and returns chunks per strategy name.
+
+    A strategy may return a lazy iterable (the token window does); it is consumed
+    exactly once, by ManifestWriters.write.
+    """
+    chunks_by_strategy = {}
+    for strategy_name, chunk_func, func_args in strategies:
+        try:
+            chunks_by_strategy[strategy_name] = chunk_func(doc, *func_args)
+        except Exception as e:
+            print(f"  Error chunking document {doc.doc_id} for strategy {strategy_name}: {e}", file=sys.stderr)
+            import traceback
+            traceback.print_exc()
+            chunks_by_strategy[strategy_name] = []
+    return chunks_by_strategy
+
+def chunk_document_file(doc_file_path: Path, strategies,
+                        materialize: bool = False) -> tuple[str | None, dict[str, Iterable[dict]]]:
+    """Loads, normalizes and chunks one document file with the process-wide tokenizer.
+
+    Returns (doc_id, chunks per strategy name), or (None, {}) if the document was
+    skipped. This is the unit of work shipped to pool workers, which pass
+    materialize=True because lazy strategy output cannot be pickled back.
+    """
+    try:
+        doc = load_prepared_document(doc_file_path, hf_tokenizer)
+    except Exception as e:
+        print(f"  Error loading document {doc_file_path}: {e}", file=sys.stderr)
+        return None, {}
+    if doc is None:
+        return None, {}
+    chunks_by_strategy = chunk_prepared_document(doc, strategies)
+    if materialize:
+        chunks_by_strategy = {name: list(chunks) for name, chunks in chunks_by_strategy.items()}
+    return doc.doc_id, chunks_by_strategy
+
+def iter_chunked_documents(doc_files: list[Path], strategies_per_doc: list, workers: int = 1):
+    """Yields (doc_id, chunks per strategy) for every document, in doc_files order.
+
+    strategies_per_doc[i] lists the strategies to run on doc_files[i]. With
+    workers > 1 the documents are sharded across a process pool whose workers
+    each load the tokenizer once at start-up; executor.map hands the results
+    back in submission order, so the output is deterministic.
+    """
+    if not doc_files:
+        return
+    if workers <= 1:
+        load_tokenizer()
+        for doc_file_path, strategies in zip(doc_files, strategies_per_doc):
+            yield chunk_document_file(doc_file_path, strategies)
+        return
+
+    # A few tasks per worker keeps the pool busy without per-document IPC overhead
+    chunksize = max(1, len(doc_files) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, initializer=load_tokenizer) as executor:
+        yield from executor.map(chunk_document_file, doc_files, strategies_per_doc,
+                                itertools.repeat(True), chunksize=chunksize)
+
+# ---------------------------------------------------------------------------
+# Manifest Indexes (Incremental Rebuild)
+# ---------------------------------------------------------------------------
+def strategy_params(chunk_func, func_args, offsets_only: bool = False) -> dict:
+    """Everything that determines a strategy's output besides the document text."""
+    params = {"chunker_version": CHUNKER_VERSION, "function": chunk_func.__name__, "args": list(func_args)}
+    if chunk_func is chunk_strategy_token_window:
+        params["tokenizer"] = TOKENIZER_MODEL_NAME
+    if offsets_only:
+        params["offsets_only"] = True
+    return params
+
+def manifest_index_path(manifest_path: Path) -> Path:
+    return manifest_path.with_name(manifest_path.name.removesuffix(".jsonl") + ".index.json")
+
+def load_reusable_entries(manifest_path: Path, params: dict) -> dict[str, dict]:
+    """Returns the previous index entries (by source file name) that can be spliced back in.
+
+    Nothing is reusable if the manifest or its index is missing, the parameters
+    changed, or the manifest size no longer matches what the index recorded.
+    """
+    index_path = manifest_index_path(manifest_path)
+    if not manifest_path.exists() or not index_path.exists():
+        return {}
+    try:
+        index = json.loads(index_path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"  ⚠️ Ignoring unreadable index {index_path}: {e}", file=sys.stderr)
+        return {}
+    if index.get("format") != CHUNK_INDEX_FORMAT or index.get("params") != params:
+        return {}
+    entries = index.get("documents", [])
+    if sum(entry["length"] for entry in entries) != manifest_path.stat().st_size:
+        print(f"  ⚠️ {manifest_path.name} does not match its index; rebuilding it from scratch.", file=sys.stderr)
+        return {}
+    return {entry["source"]: entry for entry in entries}
+
+class ManifestWriters:
+    """Writes one chunks_<strategy>.jsonl (plus its .index.json) per strategy, document by document.
+
+    Each document's chunks are either freshly chunked or, when the document is
+    unchanged, copied as raw bytes from the previous manifest. Output goes to a
+    temporary file that replaces the manifest on close. A strategy that yields
+    no chunks at all leaves any existing manifest untouched. With offsets_only
+    the records omit "text" (it is always normalized_doc[start:end]).
+    """
+    def __init__(self, strategies, output_dir: Path = CHUNK_OUTPUT_DIR, offsets_only: bool = False):
+        self.output_dir = output_dir
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.offsets_only = offsets_only
+        strategy_names = [name for name, _, _ in strategies]
+        self.params = {name: strategy_params(chunk_func, func_args, offsets_only)
+                       for name, chunk_func, func_args in strategies}
+        self.counts = {name: 0 for name in strategy_names}
+        self.doc_counts = {name: 0 for name in strategy_names}
+        self.char_totals = {name: 0 for name in strategy_names}
+        self.reused_docs = {name: 0 for name in strategy_names}
+        self.index_entries = {name: [] for name in strategy_names}
+        self.positions = {name: 0 for name in strategy_names}
+        self.files = {}
+        self.previous_files = {}
+
+    def manifest_path(self, strategy_name: str) -> Path:
+        return self.output_dir / f"chunks_{strategy_name}.jsonl"
+
+    def reusable_entries(self, strategy_name: str) -> dict[str, dict]:
+        return load_reusable_entries(self.manifest_path(strategy_name), self.params[strategy_name])
+
+    def _append(self, strategy_name: str, data: bytes, entry: dict):
+        fout = self.files.get(strategy_name)
+        if fout is None:
+            tmp_path = self.manifest_path(strategy_name).with_suffix(".jsonl.tmp")
+            fout = open(tmp_path, "wb")
+            self.files[strategy_name] = fout
+        fout.write(data)
+        entry["offset"] = self.positions[strategy_name]
+        entry["length"] = len(data)
+        self.positions[strategy_name] += len(data)
+        self.index_entries[strategy_name].append(entry)
+        self.counts[strategy_name] += entry["num_chunks"]
+        self.char_totals[strategy_name] += entry["chars"]
+        if entry["num_chunks"]:
+            self.doc_counts[strategy_name] += 1
+
+    def write(self, strategy_name: str, source: str, sha256: str, doc_id: str | None,
+              chunks: Iterable[dict]) -> int:
+        """Serializes one document's chunks in a single pass and returns how many were written."""
+        lines, num_chunks, chars = [], 0, 0
+        for chunk in chunks:
+            num_chunks += 1
+            chars += chunk["end"] - chunk["start"]
+            if self.offsets_only:
+                chunk = {key: value for key, value in chunk.items() if key != "text"}
+            lines.append(json.dumps(chunk) + "\n")
+        data = "".join(lines).encode("utf-8")
+        entry = {"source": source, "sha256": sha256, "docid": doc_id, "num_chunks": num_chunks, "chars": chars}
+        self._append(strategy_name, data, entry)
+        return num_chunks
+
+    def copy_previous(self, strategy_name: str, previous_entry: dict):
+        """Splices an unchanged document's chunks from the previous manifest."""
+        fin = self.previous_files.get(strategy_name)
+        if fin is None:
+            fin = open(self.manifest_path(strategy_name), "rb")
+            self.previous_files[strategy_name] = fin
+        fin.seek(previous_entry["offset"])
+        data = fin.read(previous_entry["length"])
+        entry = {key: previous_entry[key] for key in ("source", "sha256", "docid", "num_chunks", "chars")}
+        self._append(strategy_name, data, entry)
+        self.reused_docs[strategy_name] += 1
+
+    def close(self):
+        for fin in self.previous_files.values():
+            fin.close()
+        for fout in self.files.values():
+            fout.close()
+        for strategy_name, count in self.counts.items():
+            output_path = self.manifest_path(strategy_name)
+            tmp_path = output_path.with_suffix(".jsonl.tmp")
+            if not count:
+                tmp_path.unlink(missing_ok=True)
+                print(f"ℹ️ No chunks generated for strategy {strategy_name}.")
+                continue
+            os.replace(tmp_path, output_path)
+            index = {"format": CHUNK_INDEX_FORMAT, "strategy": strategy_name,
+                     "params": self.params[strategy_name], "documents": self.index_entries[strategy_name]}
+            manifest_index_path(output_path).write_text(json.dumps(index, indent=2), encoding="utf-8")
+            reused = self.reused_docs[strategy_name]
+            reused_note = f", {reused} documents reused" if reused else ""
+            print(f"✔ Saved {strategy_name} manifest to {output_path} ({count} total chunks{reused_note})")
+
+# ---------------------------------------------------------------------------
+# SENT Parity Check and Benchmark
+# ---------------------------------------------------------------------------
+def sentence_chunk_offsets(docs_dir: Path = DOCS_DIR) -> list[tuple[str, int, int]]:
+    """(doc id, start, end) of every SENT chunk, re-chunked from the documents in ``docs_dir``."""
+    offsets = []
+    for doc_file_path in sorted(Path(docs_dir).glob("alice:ch*.json")):
+        doc = load_prepared_document(doc_file_path, tokenizer=None)
+        if doc is not None:
+            offsets.extend((c["original_doc_id"], c["start"], c["end"]) for c in chunk_strategy_sentences(doc))
+    return offsets
+
+def check_sentence_parity(manifest_path: Path = CHUNK_OUTPUT_DIR / "chunks_SENT.jsonl", docs_dir: Path = DOCS_DIR) -> bool:
+    """Re-chunks every document with the SENT strategy and compares offsets to an existing manifest.
+
+    Only (doc id, start, end) are compared, so full-text and offset-only
+    manifests (JSONL or .cols) are checked the same way.
+    """
+    print(f"--- SENT Parity Check against {manifest_path} ---")
+    try:
+        manifest = load_manifest(manifest_path)
+    except (OSError, ValueError) as e:
+        print(f"❌ ERROR: Could not load manifest {manifest_path}: {e}", file=sys.stderr)
+        return False
+    expected = [(r["original_doc_id"], r["start"], r["end"]) for r in manifest.iter_records(include_text=False)]
+    actual = sentence_chunk_offsets(docs_dir)
+
+    mismatches = [i for i, (a, e) in enumerate(zip(actual, expected)) if a != e]
+    if len(actual) != len(expected) or mismatches:
+        print(f"❌ Mismatch: {len(actual)} chunks generated vs {len(expected)} in manifest, "
+              f"{len(mismatches)} differing records.", file=sys.stderr)
+        if mismatches:
+            i = mismatches[0]
+            print(f"  First difference at record {i}:\n    manifest:  {expected[i]}\n    generated: {actual[i]}", file=sys.stderr)
+        return False
+    print(f"✔ All {len(actual)} SENT chunks match the manifest.")
+    return True
+
+def make_synthetic_sentence_doc(doc_index: int, num_sentences: int, rng: random.Random) -> PreparedDocument:
+    """Builds a long normalized document of short sentences, with frequent exact repeats."""
+    vocab = ["alice", "rabbit", "queen", "hatter", "garden", "door", "key", "tea", "cat", "time",
+             "said", "went", "looked", "very", "curious", "little", "down", "the", "a", "of"]
+    sentences = []
+    for _ in range(num_sentences):
+        if sentences and rng.random() < 0.2:
+            sentences.append(rng.choice(sentences)) # Repeated sentences stress the search-based locator
+            continue
+        words = [rng.choice(vocab) for _ in range(rng.randint(4, 20))]
+        sentences.append(" ".join(words).capitalize() + rng.choice([".", "!", "?"]))
+    return PreparedDocument(f"bench:doc{doc_index:05d}", " ".join(sentences))
+
+def run_sentence_benchmark(num_docs: int = BENCHMARK_SENT_NUM_DOCS,
+                           sentences_per_doc: int = BENCHMARK_SENT_SENTENCES_PER_DOC):
+    print(f"--- SENT Benchmark ({num_docs} synthetic docs x {sentences_per_doc} sentences) ---")
+    rng = random.Random(13)
+    docs = [make_synthetic_sentence_doc(i, sentences_per_doc, rng) for i in range(num_docs)]
+    total_chars = sum(len(doc.text) for doc in docs)
+
+    t0 = time.perf_counter()
+    legacy = [chunk_strategy_sentences_by_search(doc) for doc in docs]
+    t_legacy = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    spans = [chunk_strategy_sentences(doc) for doc in docs]
+    t_spans = time.perf_counter() - t0
+
+    num_chunks = sum(len(c) for c in spans)
+    print(f"{'method':<22}{'seconds':>10}{'MB/s':>10}{'sentences/s':>14}")
+    for label, elapsed in (("sent_tokenize + index", t_legacy), ("span_tokenize", t_spans)):
+        print(f"{label:<22}{elapsed:>10.3f}{total_chars / 1e6 / elapsed:>10.2f}{num_chunks / elapsed:>14.0f}")
+    print(f"Speedup: {t_legacy / t_spans:.2f}x over {total_chars / 1e6:.1f}M characters, {num_chunks} sentences")
+    if legacy != spans:
+        print("ℹ️ The search-based locator disagrees with span_tokenize on some synthetic sentences "
+              "(repeated text matched at the wrong occurrence).")
+
+def print_sweep_summary(writers: ManifestWriters, strategies):
+    """Prints chunk counts per configuration and saves them as a TSV next to the manifests."""
+    header = ["strategy", "params", "documents", "chunks", "mean_chunk_chars"]
+    rows = []
+    for strategy_name, _, func_args in strategies:
+        count = writers.counts[strategy_name]
+        mean_chars = writers.char_totals[strategy_name] / count if count else 0.0
+        params = ",".join(str(arg) for arg in func_args) or "-"
+        rows.append([strategy_name, params, str(writers.doc_counts[strategy_name]), str(count), f"{mean_chars:.1f}"])
+
+    print("\n--- Sweep Summary ---")
+    print(f"{'strategy':<24}{'params':>12}{'docs':>8}{'chunks':>10}{'mean_chars':>12}")
+    for row in rows:
+        print(f"{row[0]:<24}{row[1]:>12}{row[2]:>8}{row[3]:>10}{row[4]:>12}")
+
+    summary_path = writers.output_dir / SWEEP_SUMMARY_FILENAME
+    with open(summary_path, "w", encoding="utf-8") as f:
+        f.write("\t".join(header) + "\n")
+        for row in rows:
+            f.write("\t".join(row) + "\n")
+    print(f"✔ Saved sweep summary to {summary_path}")
+
+def main(strategies_to_run=DEFAULT_STRATEGIES, output_dir: Path = CHUNK_OUTPUT_DIR, workers: int = 1,
+         full_rebuild: bool = False, columnar: bool = False, offsets_only: bool = False):
     print("--- Starting Document Chunking for SC-Qrels ---")
     doc_files = sorted(DOCS_DIR.glob("alice:ch*.json"))
     if not doc_files:
         print(f"No document files found in {DOCS_DIR}. Exiting.", file=sys.stderr)
-        return
+        return None
+
+    strategy_names = [name for name, _, _ in strategies_to_run]
+    print(f"Strategies ({len(strategy_names)}): {', '.join(strategy_names)}")
 
-    # Define strategies to run
-    # Each entry: (strategy_name, function_to_call, args_for_function (excluding text, doc_id))
-    strategies_to_run = [
-        ("BGE512T_S128", chunk_strategy_token_window, (hf_tokenizer, 512, 128)), # Using global hf_tokenizer
-        ("SENT", chunk_strategy_sentences, ()),
-        ("CHARWIN500_OV50", chunk_strategy_char_window, (500, 50)),
-        ("CHARBLOCK1000_NOV0", chunk_strategy_char_blocks, (1000,)), # Only block_size needed
-    ]
-
-    for strategy_name, chunk_func, func_args in strategies_to_run:
-        print(f"\n-- Running Strategy: {strategy_name} --")
-        all_chunks_for_strategy = []
+    # Incremental rebuild: only documents whose content hash changed (or that are
+    # new) are re-chunked, and only for the strategies whose index is stale.
+    writers = ManifestWriters(strategies_to_run, output_dir, offsets_only)
+    # The document store re-normalizes changed files up front and records each
+    # file's SHA-256; pool workers then map the same store instead of parsing JSON.
+    document_store = get_default_store(DOCS_DIR)
+    document_store.refresh()
+    doc_hashes = {doc_file_path.name: document_store.content_hash(document_store.doc_id_for_source(doc_file_path.name)) for doc_file_path in doc_files}
+    reusable = {name: {} if full_rebuild else writers.reusable_entries(name) for name in strategy_names}
+    stale_strategies = {}
+    for doc_file_path in doc_files:
+        sha256 = doc_hashes[doc_file_path.name]
+        stale = [strategy for strategy in strategies_to_run
+                 if reusable[strategy[0]].get(doc_file_path.name, {}).get("sha256") != sha256]
+        if stale:
+            stale_strategies[doc_file_path] = stale
+    docs_to_chunk = [doc_file_path for doc_file_path in doc_files if doc_file_path in stale_strategies]
+    print(f"Re-chunking {len(docs_to_chunk)} of {len(doc_files)} documents "
+          f"({len(doc_files) - len(docs_to_chunk)} unchanged)")
+    if workers > 1 and docs_to_chunk:
+        print(f"Using {workers} worker processes for {len(docs_to_chunk)} documents")
+
+    # Single pass: each document is loaded, normalized, tokenized and sentence-split
+    # once, and every strategy is derived from that shared analysis.
+    results = iter_chunked_documents(docs_to_chunk, [stale_strategies[d] for d in docs_to_chunk], workers)
+    try:
         for doc_file_path in doc_files:
-            try:
-                with open(doc_file_path, "r", encoding="utf-8") as f:
-                    doc_content = json.load(f)
-                doc_id = doc_content.get("docid")
-                original_text = doc_content.get("text")
-
-                if not doc_id or not original_text:
-                    print(f"  Skipping {doc_file_path}, missing 'docid' or 'text'.", file=sys.stderr)
-                    continue
-                
-                print(f"  Processing document for {strategy_name}: {doc_id}")
-                normalized_text = normalize_text_for_chunking(original_text)
-                
-                if not normalized_text: # Handle cases where normalization results in empty text
-                    print(f"  Normalized text for {doc_id} is empty. Skipping chunking.", file=sys.stderr)
-                    continue
-
-                # Call the chunking function with normalized_text, doc_id, and its specific args
-                chunks = chunk_func(normalized_text, doc_id, *func_args)
-                all_chunks_for_strategy.extend(chunks)
-                print(f"    Generated {len(chunks)} chunks for {doc_id} using {strategy_name}.")
-
-            except Exception as e:
-                print(f"  Error processing document {doc_file_path} for strategy {strategy_name}: {e}", file=sys.stderr)
-                import traceback
-                traceback.print_exc()
-
-
-        if all_chunks_for_strategy:
-            output_path = CHUNK_OUTPUT_DIR / f"chunks_{strategy_name}.jsonl"
-            with open(output_path, "w", encoding="utf-8") as fout:
-                for chunk in all_chunks_for_strategy:
-                    fout.write(json.dumps(chunk) + "\n")
-            print(f"✔ Saved {strategy_name} manifest to {output_path} ({len(all_chunks_for_strategy)} total chunks)")
-        else:
-            print(f"ℹ️ No chunks generated for strategy {strategy_name}.")
-            
+            sha256 = doc_hashes[doc_file_path.name]
+            doc_id, doc_chunks_by_strategy = None, {}
+            if doc_file_path in stale_strategies:
+                doc_id, doc_chunks_by_strategy = next(results)
+                if doc_id is not None:
+                    print(f"  Processing document: {doc_id}")
+
+            # Strategy output may be lazy, so chunk counts are known only once written
+            written_counts = {}
+            for strategy_name in strategy_names:
+                previous_entry = reusable[strategy_name].get(doc_file_path.name)
+                if previous_entry is not None and previous_entry["sha256"] == sha256:
+                    writers.copy_previous(strategy_name, previous_entry)
+                else:
+                    written_counts[strategy_name] = writers.write(strategy_name, doc_file_path.name, sha256, doc_id,
+                                                                  doc_chunks_by_strategy.get(strategy_name, []))
+            if doc_id is not None:
+                if len(written_counts) <= MAX_STRATEGIES_FOR_PER_DOC_COUNTS:
+                    print("    " + ", ".join(f"{name}: {count}" for name, count in written_counts.items()))
+                else:
+                    print(f"    {sum(written_counts.values())} chunks across {len(written_counts)} strategies")
+    finally:
+        results.close()
+        writers.close()
+
+    if columnar:
+        for strategy_name, count in writers.counts.items():
+            if count:
+                bundle_dir = write_columnar(writers.manifest_path(strategy_name))
+                print(f"✔ Saved columnar {strategy_name} manifest to {bundle_dir}")
     print("\n--- Document Chunking Finished ---")
+    return writers
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chunk the processed documents with every registered strategy.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help=f"Number of worker processes to shard documents across (default: 1; this machine has {os.cpu_count()} CPUs).")
+    parser.add_argument("--full_rebuild", action="store_true",
+                        help="Ignore the manifest indexes and re-chunk every document.")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Also write each manifest as a columnar chunks_<strategy>.cols bundle (see chunk_manifest.py).")
+    parser.add_argument("--offsets_only", action="store_true",
+                        help="Write manifests without the per-chunk 'text' field; readers slice it from the normalized documents.")
+    parser.add_argument("--check_sent_parity", action="store_true",
+                        help="Re-chunk with the SENT strategy, compare against the existing chunks_SENT.jsonl, then exit.")
+    parser.add_argument("--benchmark_sent", action="store_true",
+                        help="Time span_tokenize against the previous sent_tokenize + str.index locator on a synthetic corpus, then exit.")
+    sweep_group = parser.add_argument_group("parameter sweep")
+    sweep_group.add_argument("--sweep", action="store_true",
+                             help="Instead of the default strategies, emit one manifest per size/stride and char-window configuration.")
+    sweep_group.add_argument("--window_sizes", type=int, nargs="+", default=[128, 256, 512],
+                             help="Token window sizes to sweep (default: 128 256 512).")
+    sweep_group.add_argument("--strides", type=int, nargs="+", default=[64, 128, 256],
+                             help="Token strides to sweep; strides larger than a window are skipped (default: 64 128 256).")
+    sweep_group.add_argument("--char_windows", type=parse_char_window, nargs="*", default=[(500, 50), (1000, 0)],
+                             metavar="WINDOW:OVERLAP", help="Character windows to sweep (default: 500:50 1000:0).")
+    sweep_group.add_argument("--include_sentences", action="store_true", help="Also emit the SENT manifest in the sweep.")
+    sweep_group.add_argument("--sweep_output_dir", type=Path, default=SWEEP_OUTPUT_DIR,
+                             help=f"Where sweep manifests and {SWEEP_SUMMARY_FILENAME} are written (default: {SWEEP_OUTPUT_DIR}).")
+    args = parser.parse_args()
+
+    if args.check_sent_parity:
+        sys.exit(0 if check_sentence_parity() else 1)
+    if args.benchmark_sent:
+        run_sentence_benchmark()
+        sys.exit(0)
+
+    if args.sweep:
+        if any(value <= 0 for value in args.window_sizes + args.strides):
+            parser.error("--window_sizes and --strides must be positive")
+        sweep_strategies = build_sweep_strategies(args.window_sizes, args.strides, args.char_windows, args.include_sentences)
+        if not sweep_strategies:
+            parser.error("The sweep configuration produced no strategies")
+        writers = main(sweep_strategies, output_dir=args.sweep_output_dir, workers=args.workers,
+                       full_rebuild=args.full_rebuild, columnar=args.columnar,
+                       offsets_only=args.offsets_only)
+        if writers is not None:
+            print_sweep_summary(writers, sweep_strategies)
+    else:
+        main(workers=args.workers, full_rebuild=args.full_rebuild, columnar=args.columnar,
+             offsets_only=args.offsets_only)
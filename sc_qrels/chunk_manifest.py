@@ -0,0 +1,475 @@
+# sc_qrels/chunk_manifest.py
+"""Shared loader for chunk manifests, with a columnar on-disk format.
+
+``chunk_documents.py`` writes ``chunks_<strategy>.jsonl`` (one JSON record per
+chunk). Parsing those line by line is the slow part of every consumer, so a
+manifest can also be stored as a columnar bundle, the directory
+``chunks_<strategy>.cols/`` next to the JSONL:
+
+- ``start.npy`` / ``end.npy``               int64 character offsets into the normalized document
+- ``doc_codes.npy`` + ``doc_ids.json``      dictionary-encoded ``original_doc_id`` column
+- ``chunk_ids.npy``                         fixed-width unicode array of chunk ids
+- ``text.bin`` + ``text_offsets.npy``       UTF-8 text blob and its (num_chunks + 1) byte offsets
+- ``header.json``                           format, chunk count and the JSONL it was built from
+
+Offset-only manifests (``chunk_documents.py --offsets_only``) omit the chunk
+text entirely, in the JSONL records and in the bundle (no text.bin). Their
+texts are sliced on demand from the normalized document store, since every
+chunk text is exactly ``normalized_doc[start:end]``.
+
+Every array is a plain ``.npy`` opened with ``mmap_mode="r"``, so loading a
+bundle costs a few file opens regardless of its size. The header is written
+last and records the source JSONL's size and mtime; ``load_manifest`` ignores a
+bundle that is incomplete or older than its JSONL.
+
+Usage:
+    python sc_qrels/chunk_manifest.py --to_columnar             # every manifest in chunk_manifests/
+    python sc_qrels/chunk_manifest.py --to_jsonl path/to/chunks_SENT.cols
+    python sc_qrels/chunk_manifest.py --benchmark data/processed/chunk_manifests/chunks_SENT.jsonl
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from document_store import NormalizedDocumentStore, get_default_store
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+CHUNK_MANIFESTS_DIR = BASE_DIR / "data" / "processed" / "chunk_manifests"
+
+COLUMNAR_FORMAT = "sc-qrels-chunk-manifest/1"
+COLUMNAR_SUFFIX = ".cols"
+REQUIRED_FIELDS = ("original_doc_id", "chunk_id", "start", "end") # "text" is absent in offset-only manifests
+
+
+def strategy_name_from_path(manifest_path: Path) -> str:
+    """chunks_SENT.jsonl / chunks_SENT.cols -> SENT"""
+    return Path(manifest_path).name.removesuffix(".jsonl").removesuffix(COLUMNAR_SUFFIX).removeprefix("chunks_")
+
+
+def columnar_path(manifest_path: Path) -> Path:
+    manifest_path = Path(manifest_path)
+    if manifest_path.suffix == COLUMNAR_SUFFIX:
+        return manifest_path
+    return manifest_path.with_name(manifest_path.name.removesuffix(".jsonl") + COLUMNAR_SUFFIX)
+
+
+def _column_paths(bundle_dir: Path) -> Dict[str, Path]:
+    return {
+        "start": bundle_dir / "start.npy",
+        "end": bundle_dir / "end.npy",
+        "doc_codes": bundle_dir / "doc_codes.npy",
+        "doc_ids": bundle_dir / "doc_ids.json",
+        "chunk_ids": bundle_dir / "chunk_ids.npy",
+        "text": bundle_dir / "text.bin",
+        "text_offsets": bundle_dir / "text_offsets.npy",
+        "header": bundle_dir / "header.json",
+    }
+
+
+def _source_stamp(jsonl_path: Path) -> dict:
+    stat = jsonl_path.stat()
+    return {"name": jsonl_path.name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class ChunkManifest:
+    """Column-oriented view of one chunk manifest.
+
+    ``starts``, ``ends``, ``doc_codes`` and ``chunk_ids`` are NumPy arrays (memory
+    maps when loaded from a bundle); ``doc_ids[doc_codes[i]]`` is chunk i's
+    document. Texts are decoded from the blob only when asked for, or, for an
+    offset-only manifest (``text_offsets`` is None), sliced from
+    ``document_store``.
+    """
+
+    def __init__(
+        self,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        doc_codes: np.ndarray,
+        doc_ids: List[str],
+        chunk_ids: np.ndarray,
+        text_blob,
+        text_offsets: Optional[np.ndarray],
+        path: Optional[Path] = None,
+        document_store: Optional[NormalizedDocumentStore] = None,
+    ):
+        if not (len(starts) == len(ends) == len(doc_codes) == len(chunk_ids)):
+            raise ValueError("Chunk manifest columns differ in length")
+        if text_offsets is not None and len(text_offsets) != len(starts) + 1:
+            raise ValueError("Chunk manifest text offsets do not match the number of chunks")
+        self.starts = starts
+        self.ends = ends
+        self.doc_codes = doc_codes
+        self.doc_ids = doc_ids
+        self.chunk_ids = chunk_ids
+        self.text_blob = text_blob
+        self.text_offsets = text_offsets
+        self.path = path
+        self._document_store = document_store
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @property
+    def strategy_name(self) -> str:
+        return strategy_name_from_path(self.path) if self.path else ""
+
+    @property
+    def has_text(self) -> bool:
+        return self.text_offsets is not None
+
+    @property
+    def document_store(self) -> NormalizedDocumentStore:
+        if self._document_store is None:
+            self._document_store = get_default_store()
+        return self._document_store
+
+    # -- construction -----------------------------------------------------
+    @classmethod
+    def from_records(cls, records, path: Optional[Path] = None) -> "ChunkManifest":
+        """Builds the columns from chunk dicts; either every record carries "text" or none does."""
+        starts, ends, doc_codes, chunk_ids, text_parts, text_offsets = [], [], [], [], [], [0]
+        doc_code_by_id: Dict[str, int] = {}
+        has_text = None
+        for record in records:
+            if has_text is None:
+                has_text = "text" in record
+            elif has_text != ("text" in record):
+                raise ValueError(f"Chunk {record.get('chunk_id')} mixes offset-only and full-text records")
+            starts.append(record["start"])
+            ends.append(record["end"])
+            doc_codes.append(doc_code_by_id.setdefault(record["original_doc_id"], len(doc_code_by_id)))
+            chunk_ids.append(record["chunk_id"])
+            if has_text:
+                text_bytes = record["text"].encode("utf-8")
+                text_parts.append(text_bytes)
+                text_offsets.append(text_offsets[-1] + len(text_bytes))
+        if has_text is False:
+            text_offsets = None
+        return cls(
+            starts=np.asarray(starts, dtype=np.int64),
+            ends=np.asarray(ends, dtype=np.int64),
+            doc_codes=np.asarray(doc_codes, dtype=np.int32),
+            doc_ids=list(doc_code_by_id),
+            chunk_ids=np.asarray(chunk_ids, dtype=str),
+            text_blob=b"".join(text_parts),
+            text_offsets=np.asarray(text_offsets, dtype=np.int64) if text_offsets is not None else None,
+            path=path,
+        )
+
+    @classmethod
+    def from_jsonl(cls, jsonl_path: Path) -> "ChunkManifest":
+        """Parses a JSONL manifest; raises ValueError naming the line of a malformed record."""
+        jsonl_path = Path(jsonl_path)
+
+        def iter_records():
+            with open(jsonl_path, "r", encoding="utf-8") as f:
+                for line_num, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"{jsonl_path.name} line {line_num}: invalid JSON ({e})") from e
+                    missing = [field for field in REQUIRED_FIELDS if field not in record]
+                    if missing:
+                        raise ValueError(f"{jsonl_path.name} line {line_num}: missing fields {', '.join(missing)}")
+                    yield record
+
+        return cls.from_records(iter_records(), path=jsonl_path)
+
+    @classmethod
+    def from_columnar(cls, bundle_dir: Path) -> "ChunkManifest":
+        bundle_dir = Path(bundle_dir)
+        paths = _column_paths(bundle_dir)
+        if not paths["header"].exists():
+            raise FileNotFoundError(f"Columnar manifest header not found: {paths['header']}")
+        header = json.loads(paths["header"].read_text(encoding="utf-8"))
+        if header.get("format") != COLUMNAR_FORMAT:
+            raise ValueError(f"Unsupported chunk manifest format {header.get('format')!r} in {paths['header']}")
+
+        text_offsets, text_blob = None, b""
+        if header.get("has_text", True):
+            text_offsets = np.load(paths["text_offsets"], mmap_mode="r")
+            if text_offsets[-1] > 0: # np.memmap cannot map an empty file
+                text_blob = np.memmap(paths["text"], dtype=np.uint8, mode="r")
+        manifest = cls(
+            starts=np.load(paths["start"], mmap_mode="r"),
+            ends=np.load(paths["end"], mmap_mode="r"),
+            doc_codes=np.load(paths["doc_codes"], mmap_mode="r"),
+            doc_ids=json.loads(paths["doc_ids"].read_text(encoding="utf-8")),
+            chunk_ids=np.load(paths["chunk_ids"], mmap_mode="r"),
+            text_blob=text_blob,
+            text_offsets=text_offsets,
+            path=bundle_dir,
+        )
+        if len(manifest) != header["num_chunks"]:
+            raise ValueError(f"Columnar manifest {bundle_dir} does not match its header {header}")
+        return manifest
+
+    # -- export -------------------------------------------------------------
+    def save_columnar(self, bundle_dir: Path, source_jsonl: Optional[Path] = None) -> Path:
+        """Writes the column files and finally the header (which marks the bundle complete)."""
+        bundle_dir = Path(bundle_dir)
+        bundle_dir.mkdir(parents=True, exist_ok=True)
+        paths = _column_paths(bundle_dir)
+        paths["header"].unlink(missing_ok=True)  # Mark the bundle incomplete while rewriting it
+
+        np.save(paths["start"], np.asarray(self.starts, dtype=np.int64))
+        np.save(paths["end"], np.asarray(self.ends, dtype=np.int64))
+        np.save(paths["doc_codes"], np.asarray(self.doc_codes, dtype=np.int32))
+        paths["doc_ids"].write_text(json.dumps(self.doc_ids), encoding="utf-8")
+        np.save(paths["chunk_ids"], np.asarray(self.chunk_ids, dtype=str))
+        if self.has_text:
+            paths["text"].write_bytes(bytes(self.text_blob))
+            np.save(paths["text_offsets"], np.asarray(self.text_offsets, dtype=np.int64))
+        else:
+            paths["text"].unlink(missing_ok=True)
+            paths["text_offsets"].unlink(missing_ok=True)
+
+        header = {
+            "format": COLUMNAR_FORMAT,
+            "strategy": self.strategy_name,
+            "num_chunks": len(self),
+            "num_docs": len(self.doc_ids),
+            "has_text": self.has_text,
+            "source": _source_stamp(Path(source_jsonl)) if source_jsonl else None,
+        }
+        paths["header"].write_text(json.dumps(header, indent=2), encoding="utf-8")
+        return bundle_dir
+
+    def to_jsonl(self, jsonl_path: Path, include_text: Optional[bool] = None) -> int:
+        """Writes the manifest back out as JSONL (same field order as chunk_documents.py).
+
+        ``include_text`` defaults to whether the manifest stores text; pass True to
+        export an offset-only manifest with texts filled in from the document store.
+        """
+        include_text = self.has_text if include_text is None else include_text
+        with open(jsonl_path, "w", encoding="utf-8") as fout:
+            for record in self.iter_records(include_text):
+                fout.write(json.dumps(record) + "\n")
+        return len(self)
+
+    # -- access ---------------------------------------------------------------
+    def doc_id(self, i: int) -> str:
+        return self.doc_ids[int(self.doc_codes[i])]
+
+    def text(self, i: int) -> str:
+        if not self.has_text:
+            return self.document_store.slice(self.doc_id(i), int(self.starts[i]), int(self.ends[i]))
+        return bytes(self.text_blob[int(self.text_offsets[i]) : int(self.text_offsets[i + 1])]).decode("utf-8")
+
+    def texts(self) -> List[str]:
+        if not self.has_text:
+            store = self.document_store
+            doc_texts = [store.get(doc_id) for doc_id in self.doc_ids]
+            return [doc_texts[code][start:end] for code, start, end in zip(
+                np.asarray(self.doc_codes).tolist(), np.asarray(self.starts).tolist(), np.asarray(self.ends).tolist())]
+        blob = bytes(self.text_blob)
+        offsets = np.asarray(self.text_offsets).tolist()
+        return [blob[a:b].decode("utf-8") for a, b in zip(offsets[:-1], offsets[1:])]
+
+    def chunk_id_list(self) -> List[str]:
+        return np.asarray(self.chunk_ids).tolist()
+
+    def record(self, i: int, include_text: bool = True) -> dict:
+        record = {
+            "original_doc_id": self.doc_id(i),
+            "chunk_id": str(self.chunk_ids[i]),
+            "start": int(self.starts[i]),
+            "end": int(self.ends[i]),
+        }
+        if include_text:
+            record["text"] = self.text(i)
+        return record
+
+    def iter_records(self, include_text: bool = True) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self.record(i, include_text)
+
+    def spans_by_doc(self, valid_only: bool = True) -> Dict[str, List[dict]]:
+        """{doc_id: [{"chunk_id", "start", "end"}, ...]} without touching the text blob."""
+        chunks_by_doc: Dict[str, List[dict]] = {}
+        starts, ends = np.asarray(self.starts).tolist(), np.asarray(self.ends).tolist()
+        for code, chunk_id, start, end in zip(np.asarray(self.doc_codes).tolist(), self.chunk_id_list(), starts, ends):
+            if valid_only and not start < end:
+                continue
+            chunks_by_doc.setdefault(self.doc_ids[code], []).append({"chunk_id": chunk_id, "start": start, "end": end})
+        return chunks_by_doc
+
+
+def columnar_is_fresh(jsonl_path: Path) -> bool:
+    """True if a complete bundle exists next to the JSONL and was built from its current contents."""
+    header_path = _column_paths(columnar_path(jsonl_path))["header"]
+    if not header_path.exists():
+        return False
+    try:
+        header = json.loads(header_path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return False
+    return header.get("format") == COLUMNAR_FORMAT and header.get("source") == _source_stamp(Path(jsonl_path))
+
+
+def load_manifest(manifest_path: Path, prefer_columnar: bool = True) -> ChunkManifest:
+    """Loads a manifest from a .jsonl file or a .cols bundle.
+
+    For a .jsonl path, an up-to-date sibling bundle is used instead of parsing
+    the JSON when ``prefer_columnar`` is set.
+    """
+    manifest_path = Path(manifest_path)
+    if manifest_path.suffix == COLUMNAR_SUFFIX:
+        return ChunkManifest.from_columnar(manifest_path)
+    if prefer_columnar and columnar_is_fresh(manifest_path):
+        manifest = ChunkManifest.from_columnar(columnar_path(manifest_path))
+        manifest.path = manifest_path
+        return manifest
+    return ChunkManifest.from_jsonl(manifest_path)
+
+
+def iter_doc_groups(manifest_path: Path, include_text: bool = False,
+                    valid_only: bool = False) -> Iterator[Tuple[str, List[dict]]]:
+    """Streams a manifest as (doc_id, chunks) groups, one document at a time.
+
+    Manifests are written grouped by document, so only one document's chunks
+    are held in memory: a JSONL manifest is read line by line, a bundle is
+    walked through its memory-mapped columns. Chunk dicts carry chunk_id, start
+    and end (plus "text" with ``include_text``); ``valid_only`` drops chunks
+    with start >= end. Raises ValueError if a document's chunks are not
+    contiguous, since callers rely on each document appearing once.
+    """
+    manifest_path = Path(manifest_path)
+    seen_doc_ids = set()
+
+    def check_new_doc(doc_id: str):
+        if doc_id in seen_doc_ids:
+            raise ValueError(f"{manifest_path.name}: chunks of document {doc_id} are not contiguous")
+        seen_doc_ids.add(doc_id)
+
+    if manifest_path.suffix == COLUMNAR_SUFFIX or columnar_is_fresh(manifest_path):
+        manifest = ChunkManifest.from_columnar(columnar_path(manifest_path))
+        doc_codes = np.asarray(manifest.doc_codes)
+        boundaries = np.flatnonzero(np.diff(doc_codes)) + 1
+        for lo, hi in zip([0, *boundaries.tolist()], [*boundaries.tolist(), len(manifest)]):
+            if lo == hi:
+                continue
+            doc_id = manifest.doc_ids[int(doc_codes[lo])]
+            check_new_doc(doc_id)
+            chunks = []
+            for i, (chunk_id, start, end) in enumerate(zip(
+                    manifest.chunk_ids[lo:hi].tolist(), manifest.starts[lo:hi].tolist(), manifest.ends[lo:hi].tolist()), lo):
+                if valid_only and not start < end:
+                    continue
+                chunk = {"chunk_id": chunk_id, "start": start, "end": end}
+                if include_text:
+                    chunk["text"] = manifest.text(i)
+                chunks.append(chunk)
+            yield doc_id, chunks
+        return
+
+    store = None
+    current_doc_id, current_chunks = None, []
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{manifest_path.name} line {line_num}: invalid JSON ({e})") from e
+            doc_id = record["original_doc_id"]
+            if doc_id != current_doc_id:
+                if current_doc_id is not None:
+                    yield current_doc_id, current_chunks
+                check_new_doc(doc_id)
+                current_doc_id, current_chunks = doc_id, []
+            if valid_only and not record["start"] < record["end"]:
+                continue
+            chunk = {"chunk_id": record["chunk_id"], "start": record["start"], "end": record["end"]}
+            if include_text:
+                if "text" not in record: # Offset-only manifest
+                    store = store or get_default_store()
+                    record["text"] = store.slice(doc_id, record["start"], record["end"])
+                chunk["text"] = record["text"]
+            current_chunks.append(chunk)
+    if current_doc_id is not None:
+        yield current_doc_id, current_chunks
+
+
+def discover_manifests(manifest_dir: Path = CHUNK_MANIFESTS_DIR) -> List[Path]:
+    """chunks_*.jsonl manifests in a directory, plus bundles that have no JSONL, sorted by name."""
+    manifest_dir = Path(manifest_dir)
+    jsonl_paths = sorted(manifest_dir.glob("chunks_*.jsonl"))
+    jsonl_names = {path.name.removesuffix(".jsonl") for path in jsonl_paths}
+    bundle_only = [
+        path for path in sorted(manifest_dir.glob(f"chunks_*{COLUMNAR_SUFFIX}"))
+        if path.is_dir() and path.name.removesuffix(COLUMNAR_SUFFIX) not in jsonl_names
+    ]
+    return sorted(jsonl_paths + bundle_only, key=lambda path: path.name)
+
+
+def write_columnar(jsonl_path: Path) -> Path:
+    """Builds (or rebuilds) the bundle next to a JSONL manifest."""
+    jsonl_path = Path(jsonl_path)
+    manifest = ChunkManifest.from_jsonl(jsonl_path)
+    return manifest.save_columnar(columnar_path(jsonl_path), source_jsonl=jsonl_path)
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+def run_load_benchmark(jsonl_path: Path, repeats: int = 3):
+    jsonl_path = Path(jsonl_path)
+    if not columnar_is_fresh(jsonl_path):
+        write_columnar(jsonl_path)
+    print(f"--- Manifest Load Benchmark: {jsonl_path.name} ---")
+    for label, loader in (
+        ("jsonl", lambda: ChunkManifest.from_jsonl(jsonl_path)),
+        ("columnar", lambda: ChunkManifest.from_columnar(columnar_path(jsonl_path))),
+    ):
+        timings = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            manifest = loader()
+            timings.append(time.perf_counter() - t0)
+        print(f"  {label:<10} {min(timings) * 1000:>10.2f} ms  ({len(manifest)} chunks, best of {repeats})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert chunk manifests between JSONL and the columnar bundle format.")
+    parser.add_argument("paths", nargs="*", type=Path,
+                        help=f"Manifests to convert (default: every chunks_*.jsonl in {CHUNK_MANIFESTS_DIR}).")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--to_columnar", action="store_true", help="Write a chunks_<strategy>.cols bundle next to each JSONL manifest.")
+    mode.add_argument("--to_jsonl", action="store_true", help="Export each .cols bundle back to chunks_<strategy>.jsonl.")
+    parser.add_argument("--with_text", action="store_true",
+                        help="With --to_jsonl, fill in chunk texts from the document store for offset-only bundles.")
+    mode.add_argument("--benchmark", action="store_true", help="Time loading each manifest from JSONL and from its bundle.")
+    args = parser.parse_args()
+
+    if args.to_jsonl:
+        for bundle_dir in args.paths or sorted(CHUNK_MANIFESTS_DIR.glob(f"chunks_*{COLUMNAR_SUFFIX}")):
+            jsonl_path = bundle_dir.with_name(bundle_dir.name.removesuffix(COLUMNAR_SUFFIX) + ".jsonl")
+            count = ChunkManifest.from_columnar(bundle_dir).to_jsonl(jsonl_path, include_text=args.with_text or None)
+            print(f"✔ Exported {count} chunks from {bundle_dir.name} to {jsonl_path}")
+        return
+
+    jsonl_paths = args.paths or sorted(CHUNK_MANIFESTS_DIR.glob("chunks_*.jsonl"))
+    if not jsonl_paths:
+        print(f"No chunk manifest files found in {CHUNK_MANIFESTS_DIR}.", file=sys.stderr)
+        sys.exit(1)
+    for jsonl_path in jsonl_paths:
+        if args.benchmark:
+            run_load_benchmark(jsonl_path)
+        else:
+            bundle_dir = write_columnar(jsonl_path)
+            print(f"✔ Wrote columnar manifest {bundle_dir}")
+
+
+if __name__ == "__main__":
+    main()
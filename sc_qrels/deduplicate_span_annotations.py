@@ -2,10 +2,11 @@
 import json
 from pathlib import Path
 from collections import defaultdict
-import re
 from typing import List, Dict, Tuple, Optional, Any
 import sys
 
+from document_store import get_default_store
+
 # ---------------------------------------------------------------------------
 # Configuration
 # ---------------------------------------------------------------------------
@@ -21,38 +22,20 @@ CONFLICT_LOG_FILE = PROCESSED_DATA_DIR / "deduplication_conflicts.log"
 
 IOU_THRESHOLD = 0.5
 
-# Cache for normalized document text
-normalized_doc_cache_dedup: Dict[str, str] = {}
-
 # ---------------------------------------------------------------------------
 # Helper Functions
 # ---------------------------------------------------------------------------
-def normalize_text_for_dedup(text: str) -> str:
-    """Applies the same normalization as used in generate_synthetic_queries.py"""
-    text = text.replace('’', "'").replace('‘', "'")
-    text = text.replace('”', '"').replace('“', '"')
-    text = text.replace('—', '-').replace('–', '-')
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
-
 def get_normalized_doc_text_for_dedup(docid: str) -> Optional[str]:
-    """Loads and normalizes document text, using a cache."""
-    if docid in normalized_doc_cache_dedup:
-        return normalized_doc_cache_dedup[docid]
-
-    doc_path = CHAPTER_DIR_FOR_DEDUP / f"{docid}.json"
-    if not doc_path.exists():
-        print(f"⚠️ Document file not found for deduplication: {doc_path}", file=sys.stderr)
+    """Normalized document text from the shared document store."""
+    document_store = get_default_store(CHAPTER_DIR_FOR_DEDUP)
+    if docid not in document_store:
+        print(f"⚠️ Document file not found for deduplication: {CHAPTER_DIR_FOR_DEDUP / f'{docid}.json'}", file=sys.stderr)
         return None
     try:
-        with open(doc_path, "r", encoding="utf-8") as f:
-            content = json.load(f)
-        original_text = content.get("text")
-        if not original_text:
+        normalized_text = document_store.get(docid)
+        if not normalized_text:
             print(f"⚠️ Document {docid} has no text or text is empty.", file=sys.stderr)
             return None
-        normalized_text = normalize_text_for_dedup(original_text)
-        normalized_doc_cache_dedup[docid] = normalized_text
         return normalized_text
     except Exception as e:
         print(f"⚠️ Error loading or normalizing document {docid} for deduplication: {e}", file=sys.stderr)
@@ -0,0 +1,76 @@
+# sc_qrels/dense_retrieval.py
+"""Blocked top-k retrieval over dense chunk embeddings.
+
+All queries are scored together: the query matrix is split into blocks of
+``block_size`` rows, each block is multiplied against the full chunk matrix
+and reduced with ``torch.topk`` before the next block is scored. Peak memory
+for the score matrix is therefore ``block_size x num_chunks`` floats, however
+many queries there are.
+"""
+
+from pathlib import Path
+from typing import List, Sequence, Tuple
+
+import torch
+
+DEFAULT_QUERY_BLOCK_SIZE = 256
+
+
+def topk_blocked(
+    query_vecs: torch.Tensor,
+    chunk_vecs: torch.Tensor,
+    k: int,
+    block_size: int = DEFAULT_QUERY_BLOCK_SIZE,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Returns the top-k (scores, chunk indices) for every query, both shaped (num_queries, k).
+
+    ``k`` is capped at the number of chunks. Results are moved to the CPU block
+    by block so only one score block lives on the device at a time.
+    """
+    if block_size <= 0:
+        raise ValueError(f"block_size must be positive, got {block_size}")
+
+    num_queries = query_vecs.shape[0]
+    k = min(k, chunk_vecs.shape[0])
+    if num_queries == 0 or k == 0:
+        return torch.empty((num_queries, k)), torch.empty((num_queries, k), dtype=torch.long)
+
+    query_vecs = query_vecs.to(device=chunk_vecs.device, dtype=chunk_vecs.dtype)
+    all_scores, all_indices = [], []
+    with torch.no_grad():
+        for start in range(0, num_queries, block_size):
+            block_scores = torch.matmul(query_vecs[start : start + block_size], chunk_vecs.T)
+            top_scores, top_indices = torch.topk(block_scores, k=k, dim=1)
+            all_scores.append(top_scores.float().cpu())
+            all_indices.append(top_indices.cpu())
+    return torch.cat(all_scores, dim=0), torch.cat(all_indices, dim=0)
+
+
+def format_trec_run_lines(
+    qids: Sequence[str],
+    chunk_ids: Sequence[str],
+    top_scores: torch.Tensor,
+    top_indices: torch.Tensor,
+    run_name: str,
+) -> List[str]:
+    """Formats top-k results as TREC run lines: ``qid Q0 chunk_id rank score run_name``."""
+    lines = []
+    for qid, scores_row, indices_row in zip(qids, top_scores.tolist(), top_indices.tolist()):
+        for rank, (score_val, chunk_idx) in enumerate(zip(scores_row, indices_row)):
+            lines.append(f"{qid}\tQ0\t{chunk_ids[chunk_idx]}\t{rank + 1}\t{score_val:.8f}\t{run_name}\n")
+    return lines
+
+
+def write_trec_run(
+    run_file_path: Path,
+    qids: Sequence[str],
+    chunk_ids: Sequence[str],
+    top_scores: torch.Tensor,
+    top_indices: torch.Tensor,
+    run_name: str,
+) -> int:
+    """Writes a whole TREC run file in one pass and returns the number of lines written."""
+    lines = format_trec_run_lines(qids, chunk_ids, top_scores, top_indices, run_name)
+    with open(run_file_path, "w", encoding="utf-8") as fout:
+        fout.write("".join(lines))
+    return len(lines)
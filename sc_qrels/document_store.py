@@ -0,0 +1,333 @@
+# sc_qrels/document_store.py
+"""Normalized document texts, built once and shared by every pipeline stage.
+
+Chunk and span offsets all index into the *normalized* document text, so any
+chunk or span text can be recovered as ``store.slice(doc_id, start, end)``. This is
+what lets offset-only chunk manifests (``chunk_documents.py --offsets_only``)
+drop the per-chunk ``text`` field, and what the dedup, sanity-check, chunking
+and generation scripts read instead of parsing and normalizing the document
+JSON themselves.
+
+The store for ``data/processed/documents`` lives in ``data/processed/document_store``:
+
+- ``texts.<hash>.u32``  every normalized text back to back, as little-endian
+  UTF-32 code units, so character offsets are array offsets and a slice never
+  decodes more than the characters it returns
+- ``index.json``        format, normalization fingerprint, blob name and, per
+  doc id, its (offset, length) in the blob plus the source file's name,
+  SHA-256, size and mtime
+
+Documents are keyed by the ``docid`` field inside each JSON file, the id that
+annotations and chunk manifests use, not by the file name. A file without a
+``docid`` is stored under its file stem with an error, and two files claiming
+the same ``docid`` make ``refresh`` raise ValueError.
+
+Opening the store stats the source files. Unchanged stamps mean the index is
+used as is. For files whose stamps changed, the SHA-256 decides whether the
+text is re-normalized or copied from the previous blob. The blob is memory-mapped
+read-only, so concurrent processes (e.g. chunking workers) share its pages. A
+rebuild writes a new blob under a new name and then replaces the index, so a
+reader never pairs an index with the wrong blob.
+
+Usage:
+    python sc_qrels/document_store.py               # build/refresh the store and print stats
+    python sc_qrels/document_store.py --rebuild     # rebuild from scratch
+    python sc_qrels/document_store.py --benchmark   # store lookups vs. JSON parse + normalize
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from text_normalization import CHARACTER_REPLACEMENTS, normalize_text
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DOCS_DIR = BASE_DIR / "data" / "processed" / "documents"
+
+STORE_FORMAT = "sc-qrels-document-store/2"
+BLOB_DTYPE = np.dtype("<u4")
+BLOB_ENCODING = "utf-32-le"
+INDEX_FILENAME = "index.json"
+# Changes to the character mapping invalidate every stored text
+NORMALIZATION_FINGERPRINT = hashlib.sha256(repr(CHARACTER_REPLACEMENTS).encode("utf-8")).hexdigest()[:16]
+
+
+def default_store_dir(docs_dir: Path) -> Path:
+    """``data/processed/documents`` -> ``data/processed/document_store``."""
+    docs_dir = Path(docs_dir)
+    if docs_dir.name == "documents":
+        return docs_dir.with_name("document_store")
+    return docs_dir.with_name(f"{docs_dir.name}_store")
+
+
+class NormalizedDocumentStore:
+    """Memory-mapped normalized texts of ``<docs_dir>/*.json`` by ``docid``, refreshed on first use."""
+
+    def __init__(self, docs_dir: Path = DOCS_DIR, store_dir: Optional[Path] = None):
+        self.docs_dir = Path(docs_dir)
+        self.store_dir = Path(store_dir) if store_dir is not None else default_store_dir(self.docs_dir)
+        self._entries: Optional[Dict[str, dict]] = None
+        self._doc_ids_by_source: Dict[str, str] = {}
+        self._blob: Optional[np.ndarray] = None
+        self._texts: Dict[str, str] = {}
+        self.last_refresh: Dict[str, int] = {}
+
+    # --- Building ------------------------------------------------------------
+    def _read_index(self) -> Optional[dict]:
+        index_path = self.store_dir / INDEX_FILENAME
+        if not index_path.exists():
+            return None
+        try:
+            index = json.loads(index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if index.get("format") != STORE_FORMAT or index.get("normalization") != NORMALIZATION_FINGERPRINT:
+            return None
+        blob_path = self.store_dir / index.get("blob", "")
+        if not blob_path.is_file() or blob_path.stat().st_size != index.get("num_chars", -1) * BLOB_DTYPE.itemsize:
+            return None
+        return index
+
+    def _open_blob(self, index: dict) -> np.ndarray:
+        if index["num_chars"] == 0:
+            return np.zeros(0, dtype=BLOB_DTYPE)
+        return np.memmap(self.store_dir / index["blob"], dtype=BLOB_DTYPE, mode="r")
+
+    def refresh(self, rebuild: bool = False) -> bool:
+        """Validates the store against the source files and rebuilds what changed.
+
+        Returns True if the store was (re)written. ``rebuild=True`` re-normalizes every document.
+        Raises ValueError if two source files have the same ``docid``.
+        """
+        sources = {path.name: path.stat() for path in sorted(self.docs_dir.glob("*.json"))}
+        index = None if rebuild else self._read_index()
+        previous = index["docs"] if index else {}
+        previous_by_source = {entry["source"]: (doc_id, entry) for doc_id, entry in previous.items()}
+        if index and previous_by_source.keys() == sources.keys() and all(
+            previous_by_source[source][1]["size"] == stat.st_size
+            and previous_by_source[source][1]["mtime_ns"] == stat.st_mtime_ns
+            for source, stat in sources.items()
+        ):
+            self._set_contents(index)
+            self.last_refresh = {"documents": len(sources), "normalized": 0, "reused": len(sources)}
+            return False
+
+        previous_blob = self._open_blob(index) if index else None
+        entries: Dict[str, dict] = {}
+        texts: List[str] = []
+        offset = normalized = 0
+        for source, stat in sources.items():
+            source_path = self.docs_dir / source
+            old_doc_id, old = previous_by_source.get(source, (None, None))
+            entry = {"source": source, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            if old is not None and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+                sha256 = old["sha256"]
+            else:
+                sha256 = hashlib.sha256(source_path.read_bytes()).hexdigest()
+            entry["sha256"] = sha256
+
+            if old is not None and old["sha256"] == sha256:
+                doc_id = old_doc_id
+                text = previous_blob[old["offset"]:old["offset"] + old["length"]].tobytes().decode(BLOB_ENCODING)
+                if "error" in old:
+                    entry["error"] = old["error"]
+            else:
+                normalized += 1
+                doc_id = source_path.stem # Only used when the file has no readable docid
+                try:
+                    doc_content = json.loads(source_path.read_text(encoding="utf-8"))
+                    text = normalize_text(doc_content.get("text") or "")
+                    if doc_content.get("docid"):
+                        doc_id = doc_content["docid"]
+                    else:
+                        text, entry["error"] = "", "missing 'docid'"
+                except (OSError, ValueError) as e:
+                    text, entry["error"] = "", str(e)
+            if doc_id in entries:
+                raise ValueError(f"Documents {entries[doc_id]['source']} and {source} in {self.docs_dir} "
+                                 f"both have docid {doc_id!r}")
+            entry["offset"], entry["length"] = offset, len(text)
+            offset += len(text)
+            entries[doc_id] = entry
+            texts.append(text)
+        previous_blob = None  # Release the old map before its file is removed
+
+        self._write(entries, "".join(texts))
+        self.last_refresh = {"documents": len(sources), "normalized": normalized, "reused": len(sources) - normalized}
+        return True
+
+    def _write(self, entries: Dict[str, dict], all_text: str) -> None:
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        data = all_text.encode(BLOB_ENCODING)
+        blob_name = f"texts.{hashlib.sha256(data).hexdigest()[:16]}.u32"
+        blob_path = self.store_dir / blob_name
+        if not blob_path.exists():
+            tmp_blob = blob_path.with_name(f"{blob_name}.{os.getpid()}.tmp")
+            tmp_blob.write_bytes(data)
+            os.replace(tmp_blob, blob_path)
+
+        index = {
+            "format": STORE_FORMAT,
+            "normalization": NORMALIZATION_FINGERPRINT,
+            "encoding": BLOB_ENCODING,
+            "blob": blob_name,
+            "num_chars": len(all_text),
+            "docs": entries,
+        }
+        index_path = self.store_dir / INDEX_FILENAME
+        tmp_index = index_path.with_name(f"{INDEX_FILENAME}.{os.getpid()}.tmp")
+        tmp_index.write_text(json.dumps(index, indent=1), encoding="utf-8")
+        os.replace(tmp_index, index_path)
+
+        # Blobs no longer referenced by the index; open maps elsewhere keep their pages
+        for stale_blob in self.store_dir.glob("texts.*.u32"):
+            if stale_blob.name != blob_name:
+                stale_blob.unlink(missing_ok=True)
+        self._set_contents(index)
+
+    def _set_contents(self, index: dict) -> None:
+        self._entries = index["docs"]
+        self._doc_ids_by_source = {entry["source"]: doc_id for doc_id, entry in self._entries.items()}
+        self._blob = self._open_blob(index)
+        self._texts.clear()
+
+    # --- Reading -------------------------------------------------------------
+    @property
+    def entries(self) -> Dict[str, dict]:
+        if self._entries is None:
+            self.refresh()
+        return self._entries
+
+    def _entry(self, doc_id: str) -> dict:
+        entry = self.entries.get(doc_id)
+        if entry is None:
+            raise KeyError(f"Document {doc_id} not found in {self.docs_dir}")
+        if "error" in entry:
+            raise ValueError(f"Document {doc_id} could not be read: {entry['error']}")
+        return entry
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def doc_ids(self) -> List[str]:
+        return list(self.entries)
+
+    def doc_id_for_source(self, source: str) -> str:
+        """Doc id stored for the file ``<docs_dir>/<source>``; raises KeyError for an unknown file."""
+        entries = self.entries
+        doc_id = self._doc_ids_by_source.get(source)
+        if doc_id is None or doc_id not in entries:
+            raise KeyError(f"Document file not found: {self.docs_dir / source}")
+        return doc_id
+
+    def content_hash(self, doc_id: str) -> str:
+        """SHA-256 of the source JSON file the stored text was built from."""
+        entry = self.entries.get(doc_id)
+        if entry is None:
+            raise KeyError(f"Document {doc_id} not found in {self.docs_dir}")
+        return entry["sha256"]
+
+    def length(self, doc_id: str) -> int:
+        return self._entry(doc_id)["length"]
+
+    def get(self, doc_id: str) -> str:
+        """Normalized text of a document; raises KeyError if it does not exist."""
+        text = self._texts.get(doc_id)
+        if text is None:
+            entry = self._entry(doc_id)
+            offset = entry["offset"]
+            text = self._blob[offset:offset + entry["length"]].tobytes().decode(BLOB_ENCODING)
+            self._texts[doc_id] = text
+        return text
+
+    def slice(self, doc_id: str, start: int, end: int) -> str:
+        """``get(doc_id)[start:end]``, decoding only the requested characters."""
+        text = self._texts.get(doc_id)
+        if text is not None or start < 0 or end < 0:
+            return (text if text is not None else self.get(doc_id))[start:end]
+        entry = self._entry(doc_id)
+        length = entry["length"]
+        start, end = min(start, length), min(end, length)
+        if end <= start:
+            return ""
+        offset = entry["offset"]
+        return self._blob[offset + start:offset + end].tobytes().decode(BLOB_ENCODING)
+
+    def clear(self) -> None:
+        """Drops decoded texts and the map; the next access re-validates the store."""
+        self._texts.clear()
+        self._entries = None
+        self._doc_ids_by_source = {}
+        self._blob = None
+
+
+_default_stores: Dict[Path, NormalizedDocumentStore] = {}
+
+
+def get_default_store(docs_dir: Path = DOCS_DIR) -> NormalizedDocumentStore:
+    """Process-wide store over ``docs_dir`` (DOCS_DIR by default), created on first use."""
+    key = Path(docs_dir).resolve()
+    if key not in _default_stores:
+        _default_stores[key] = NormalizedDocumentStore(key)
+    return _default_stores[key]
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+def run_lookup_benchmark(docs_dir: Path = DOCS_DIR, lookups_per_doc: int = 50) -> None:
+    """Times repeated per-lookup JSON parse + normalize (the old per-question path) against the store."""
+    doc_paths = sorted(Path(docs_dir).glob("*.json"))
+    print(f"--- Document lookup benchmark: {len(doc_paths) * lookups_per_doc} lookups over {len(doc_paths)} documents ---")
+
+    t0 = time.perf_counter()
+    for doc_path in doc_paths * lookups_per_doc:
+        doc_content = json.loads(doc_path.read_text(encoding="utf-8"))
+        normalize_text(doc_content.get("text") or "")
+    parse_elapsed = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    store = NormalizedDocumentStore(docs_dir)
+    store.refresh()
+    open_elapsed = time.perf_counter() - t0
+    lookups = [store.doc_id_for_source(doc_path.name) for doc_path in doc_paths] * lookups_per_doc
+    t0 = time.perf_counter()
+    for doc_id in lookups:
+        store.get(doc_id)
+        store.slice(doc_id, 100, 200)
+    lookup_elapsed = time.perf_counter() - t0
+
+    print(f"  JSON parse + normalize per lookup  {parse_elapsed:>8.3f}s")
+    print(f"  store open (validate stamps)       {open_elapsed:>8.3f}s")
+    print(f"  store get + slice                  {lookup_elapsed:>8.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or refresh the normalized document store.")
+    parser.add_argument("--docs_dir", type=Path, default=DOCS_DIR, help="Directory of document .json files.")
+    parser.add_argument("--rebuild", action="store_true", help="Re-normalize every document instead of reusing unchanged texts.")
+    parser.add_argument("--benchmark", action="store_true", help="Compare store lookups with parsing and normalizing the JSON per lookup.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        run_lookup_benchmark(args.docs_dir)
+        sys.exit(0)
+
+    store = NormalizedDocumentStore(args.docs_dir)
+    t0 = time.perf_counter()
+    store.refresh(rebuild=args.rebuild)
+    elapsed = time.perf_counter() - t0
+    stats = store.last_refresh
+    total_chars = sum(entry["length"] for entry in store.entries.values())
+    print(f"✔ {len(store)} documents, {total_chars} normalized characters in {store.store_dir} "
+          f"({stats['normalized']} normalized, {stats['reused']} reused, {elapsed:.3f}s)", file=sys.stderr)
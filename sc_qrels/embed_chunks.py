@@ -1,6 +1,9 @@
 # sc_qrels/embed_chunks.py
 
 import json
+import sys
+import time
+import argparse
 import torch
 import numpy as np
 from pathlib import Path
@@ -9,6 +12,8 @@ from transformers import AutoTokenizer, AutoModel
 
 # Import your portable device selection logic
 from utils import get_torch_device
+from embedding_cache import EmbeddingCache
+from embedding_store import save_embedding_store, store_paths
 
 # ------------------------------------------------------------------
 # Configuration
@@ -16,8 +21,13 @@ from utils import get_torch_device
 
 MODEL_NAME = "BAAI/bge-large-en-v1.5"
 CHUNKS_PATH = Path("data/processed/chunks.jsonl")
-OUT_PATH = Path("data/processed/chunk_embeddings.npz")
-OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+# Memory-mappable store: chunk_embeddings.npy + .ids.npy + .docids.npy + .header.json
+OUT_PREFIX = Path("data/processed/chunk_embeddings")
+OUT_PREFIX.parent.mkdir(parents=True, exist_ok=True)
+
+MAX_LENGTH = 512
+# Upper bound on padded tokens (batch_size x longest sequence) per forward pass
+BATCH_TOKEN_BUDGET = 16384
 
 DEVICE = get_torch_device()
 print(f"🖥️  Using device: {DEVICE}")
@@ -41,35 +51,106 @@ def mean_pooling(model_output, attention_mask):
     return pooled
 
 # ------------------------------------------------------------------
-# Load chunks
-# ------------------------------------------------------------------
-
-with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
-    chunks = [json.loads(line) for line in f]
-
-# ------------------------------------------------------------------
-# Encode each chunk
+# Embedding paths
 # ------------------------------------------------------------------
 
-ids, docids, embeddings = [], [], []
-
-for chunk in tqdm(chunks, desc="📡 Embedding chunks"):
-    text = chunk["text"]
-    encoded = tokenizer(text, padding=True, truncation=True, max_length=512, return_tensors="pt")
-    encoded = {k: v.to(DEVICE) for k, v in encoded.items()}
-
-    with torch.no_grad():
-        output = model(**encoded)
-        emb = mean_pooling(output, encoded["attention_mask"])
-        emb = torch.nn.functional.normalize(emb, p=2, dim=1)
-        embeddings.append(emb.cpu().numpy()[0])
-
-    ids.append(chunk["chunk_id"])
-    docids.append(chunk["docid"])
+def embed_texts_per_chunk(texts):
+    """Original path: one forward pass per chunk (batch size 1)."""
+    embeddings = []
+    for text in tqdm(texts, desc="📡 Embedding chunks"):
+        encoded = tokenizer(text, padding=True, truncation=True, max_length=MAX_LENGTH, return_tensors="pt")
+        encoded = {k: v.to(DEVICE) for k, v in encoded.items()}
+
+        with torch.no_grad():
+            output = model(**encoded)
+            emb = mean_pooling(output, encoded["attention_mask"])
+            emb = torch.nn.functional.normalize(emb, p=2, dim=1)
+            embeddings.append(emb.cpu().numpy()[0])
+    return np.stack(embeddings)
+
+def make_length_buckets(lengths, token_budget=BATCH_TOKEN_BUDGET):
+    """Groups indices into batches of similar token length under a padded-token budget.
+
+    Indices are sorted by length so each batch pads only up to its own longest
+    sequence; a batch is closed once adding the next (longer) sequence would
+    push batch_size x max_len over the budget.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    batches, current, current_max = [], [], 0
+    for i in order:
+        new_max = max(current_max, lengths[i])
+        if current and new_max * (len(current) + 1) > token_budget:
+            batches.append(current)
+            current, new_max = [], lengths[i]
+        current.append(i)
+        current_max = new_max
+    if current:
+        batches.append(current)
+    return batches
+
+def embed_texts_bucketed(texts, token_budget=BATCH_TOKEN_BUDGET):
+    """Embeds texts in length-bucketed batches and returns them in input order."""
+    encodings = tokenizer(texts, truncation=True, max_length=MAX_LENGTH)
+    lengths = [len(ids) for ids in encodings["input_ids"]]
+    batches = make_length_buckets(lengths, token_budget)
+
+    hidden_size = getattr(model.config, "hidden_size", 1024)
+    embeddings = np.empty((len(texts), hidden_size), dtype=np.float32)
+
+    for batch in tqdm(batches, desc="📡 Embedding chunk batches"):
+        features = [{k: encodings[k][i] for k in encodings.keys()} for i in batch]
+        encoded = tokenizer.pad(features, padding=True, return_tensors="pt")
+        encoded = {k: v.to(DEVICE) for k, v in encoded.items()}
+
+        with torch.no_grad():
+            output = model(**encoded)
+            emb = mean_pooling(output, encoded["attention_mask"])
+            emb = torch.nn.functional.normalize(emb, p=2, dim=1)
+        # Scatter back to the original chunk order
+        embeddings[batch] = emb.cpu().numpy()
+    return embeddings
 
 # ------------------------------------------------------------------
-# Save
+# Main
 # ------------------------------------------------------------------
 
-np.savez_compressed(OUT_PATH, ids=ids, docids=docids, embeddings=np.stack(embeddings))
-print(f"✔ Saved {len(embeddings)} embeddings to {OUT_PATH}")
+def main(per_chunk: bool, token_budget: int, use_cache: bool, dtype: str):
+    with open(CHUNKS_PATH, "r", encoding="utf-8") as f:
+        chunks = [json.loads(line) for line in f]
+
+    texts = [chunk["text"] for chunk in chunks]
+    ids = [chunk["chunk_id"] for chunk in chunks]
+    docids = [chunk["docid"] for chunk in chunks]
+    if not texts:
+        print(f"⚠️ No chunks found in {CHUNKS_PATH}. Nothing to embed.", file=sys.stderr)
+        return
+
+    if per_chunk:
+        embed_fn = embed_texts_per_chunk
+    else:
+        embed_fn = lambda batch_texts: embed_texts_bucketed(batch_texts, token_budget)
+
+    t0 = time.perf_counter()
+    if use_cache:
+        cache = EmbeddingCache(MODEL_NAME, pooling="mean", max_length=MAX_LENGTH)
+        embeddings = cache.embed(texts, embed_fn)
+        cache.report()
+        cache.close()
+    else:
+        embeddings = embed_fn(texts)
+    elapsed = time.perf_counter() - t0
+    mode = "per-chunk" if per_chunk else f"bucketed (budget {token_budget} tokens)"
+    rate = f"{len(texts) / elapsed:.1f} chunks/sec" if elapsed > 0 else "n/a chunks/sec"
+    print(f"⏱️  Embedded {len(texts)} chunks in {elapsed:.1f}s [{mode}]: {rate}")
+
+    save_embedding_store(OUT_PREFIX, ids, docids, embeddings, model_name=MODEL_NAME, dtype=dtype)
+    print(f"✔ Saved {len(embeddings)} {dtype} embeddings to {store_paths(OUT_PREFIX)['embeddings']} (+ ids/docids/header sidecars)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed chunks with BGE-large and save them to a memory-mappable embedding store.")
+    parser.add_argument("--per_chunk", action="store_true", help="Use the original one-chunk-per-forward-pass loop (for speed comparison).")
+    parser.add_argument("--batch_token_budget", type=int, default=BATCH_TOKEN_BUDGET, help="Maximum padded tokens per batch in the bucketed path.")
+    parser.add_argument("--no_cache", action="store_true", help="Bypass the shared on-disk embedding cache and embed every chunk.")
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32", help="Storage dtype of the embedding matrix (float16 halves disk and page-cache use).")
+    args = parser.parse_args()
+    main(per_chunk=args.per_chunk, token_budget=args.batch_token_budget, use_cache=not args.no_cache, dtype=args.dtype)
@@ -0,0 +1,147 @@
+# sc_qrels/embedding_cache.py
+"""Content-addressed on-disk cache of text embeddings.
+
+Entries are keyed by (model name, pooling, max_length, sha256 of the text), so
+any script embedding the same text with the same model settings reuses the
+stored vector: a sentence that appears in several manifests, or a question
+embedded by both retrieval scripts, goes through the model only once.
+
+The cache is a single SQLite file. Every lookup refreshes an entry's
+``last_used`` stamp, and once the stored vectors exceed ``max_bytes`` the least
+recently used entries are evicted.
+"""
+
+import hashlib
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE_PATH = BASE_DIR / "data" / "processed" / "embedding_cache.sqlite"
+DEFAULT_MAX_BYTES = 2 * 1024**3  # 2 GiB of stored vectors
+
+SQLITE_MAX_VARIABLES = 500  # Keys per IN (...) query
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite-backed LRU cache of float32 embeddings for one (model, pooling, max_length) setting."""
+
+    def __init__(
+        self,
+        model_name: str,
+        pooling: str,
+        max_length: int,
+        path: Path = DEFAULT_CACHE_PATH,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.namespace = f"{model_name}|{pooling}|{max_length}"
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=60)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                   namespace   TEXT NOT NULL,
+                   text_sha256 TEXT NOT NULL,
+                   dim         INTEGER NOT NULL,
+                   vector      BLOB NOT NULL,
+                   nbytes      INTEGER NOT NULL,
+                   last_used   REAL NOT NULL,
+                   PRIMARY KEY (namespace, text_sha256)
+               )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self.conn.commit()
+
+    # -- lookups ---------------------------------------------------------
+    def get_many(self, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Returns the cached vectors for the given text hashes and marks them as used."""
+        found: Dict[str, np.ndarray] = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique_hashes), SQLITE_MAX_VARIABLES):
+            batch = unique_hashes[i : i + SQLITE_MAX_VARIABLES]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT text_sha256, dim, vector FROM embeddings WHERE namespace = ? AND text_sha256 IN ({placeholders})",
+                [self.namespace, *batch],
+            ).fetchall()
+            for sha, dim, blob in rows:
+                found[sha] = np.frombuffer(blob, dtype=np.float32, count=dim)
+        if found:
+            now = time.time()
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE namespace = ? AND text_sha256 = ?",
+                [(now, self.namespace, sha) for sha in found],
+            )
+            self.conn.commit()
+        return found
+
+    def put_many(self, hashes: Sequence[str], vectors: np.ndarray) -> None:
+        """Stores one vector per text hash, then evicts least recently used entries over the size cap."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (namespace, text_sha256, dim, vector, nbytes, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+            [(self.namespace, sha, vec.shape[0], vec.tobytes(), vec.nbytes, now) for sha, vec in zip(hashes, vectors)],
+        )
+        self.conn.commit()
+        self.evict_to_size()
+
+    def evict_to_size(self) -> int:
+        """Deletes least recently used entries (across all namespaces) until under max_bytes."""
+        total_bytes = self.conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+        excess = total_bytes - self.max_bytes
+        if excess <= 0:
+            return 0
+        to_delete, freed = [], 0
+        for rowid, nbytes in self.conn.execute("SELECT rowid, nbytes FROM embeddings ORDER BY last_used ASC"):
+            to_delete.append((rowid,))
+            freed += nbytes
+            if freed >= excess:
+                break
+        self.conn.executemany("DELETE FROM embeddings WHERE rowid = ?", to_delete)
+        self.conn.commit()
+        return len(to_delete)
+
+    # -- main entry point ------------------------------------------------
+    def embed(self, texts: List[str], embed_fn: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Returns embeddings for ``texts`` in order, calling ``embed_fn`` only on unseen texts.
+
+        ``embed_fn`` receives a list of distinct texts and must return one row
+        per text (a NumPy array or a CPU torch tensor).
+        """
+        hashes = [text_sha256(t) for t in texts]
+        cached = self.get_many(hashes)
+
+        missing: Dict[str, str] = {}
+        for sha, text in zip(hashes, texts):
+            if sha not in cached and sha not in missing:
+                missing[sha] = text
+        self.hits += len(texts) - sum(1 for sha in hashes if sha in missing)
+        self.misses += len(missing)
+
+        if missing:
+            new_vectors = np.asarray(embed_fn(list(missing.values())), dtype=np.float32)
+            self.put_many(list(missing.keys()), new_vectors)
+            cached.update(zip(missing.keys(), new_vectors))
+
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([cached[sha] for sha in hashes])
+
+    def report(self, label: str = "Embedding cache") -> None:
+        print(f"  🗄️  {label}: {self.hits} hits, {self.misses} misses ({self.path.name})", file=sys.stderr)
+
+    def close(self) -> None:
+        self.conn.close()
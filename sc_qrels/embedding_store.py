@@ -0,0 +1,108 @@
+# sc_qrels/embedding_store.py
+"""Memory-mappable on-disk layout for a chunk embedding matrix.
+
+A store with prefix ``data/processed/chunk_embeddings`` consists of:
+
+- ``chunk_embeddings.npy``         raw (num_vectors, dim) float32 or float16 matrix
+- ``chunk_embeddings.ids.npy``     fixed-width unicode array of chunk ids
+- ``chunk_embeddings.docids.npy``  fixed-width unicode array of document ids
+- ``chunk_embeddings.header.json`` model name, dtype, shape and whether rows are L2-normalized
+
+All three arrays are plain ``.npy`` files, so consumers open them with
+``np.load(mmap_mode="r")``: startup does not decompress anything, pages are
+read on demand, and several processes share one page-cached matrix. The header
+is written last, so a store without a header is treated as incomplete.
+"""
+
+import json
+import warnings
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+import torch
+
+STORE_FORMAT = "sc-qrels-embeddings/1"
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+def store_paths(prefix: Path) -> Dict[str, Path]:
+    prefix = Path(prefix)
+    stem = prefix.name
+    return {
+        "embeddings": prefix.with_name(f"{stem}.npy"),
+        "ids": prefix.with_name(f"{stem}.ids.npy"),
+        "docids": prefix.with_name(f"{stem}.docids.npy"),
+        "header": prefix.with_name(f"{stem}.header.json"),
+    }
+
+
+def store_exists(prefix: Path) -> bool:
+    return store_paths(prefix)["header"].exists()
+
+
+def save_embedding_store(
+    prefix: Path,
+    ids: Sequence[str],
+    docids: Sequence[str],
+    embeddings: np.ndarray,
+    model_name: str,
+    dtype: str = "float32",
+    normalized: bool = True,
+) -> Dict[str, Path]:
+    """Writes the matrix, the id/docid sidecars and finally the header."""
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"dtype must be one of {SUPPORTED_DTYPES}, got {dtype!r}")
+    if not (len(ids) == len(docids) == len(embeddings)):
+        raise ValueError(f"ids ({len(ids)}), docids ({len(docids)}) and embeddings ({len(embeddings)}) differ in length")
+
+    paths = store_paths(prefix)
+    paths["header"].unlink(missing_ok=True)  # Mark the store incomplete while rewriting it
+
+    matrix = np.ascontiguousarray(embeddings, dtype=dtype)
+    np.save(paths["embeddings"], matrix)
+    np.save(paths["ids"], np.asarray(ids, dtype=str))
+    np.save(paths["docids"], np.asarray(docids, dtype=str))
+
+    header = {
+        "format": STORE_FORMAT,
+        "model_name": model_name,
+        "dtype": dtype,
+        "num_vectors": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "normalized": normalized,
+    }
+    paths["header"].write_text(json.dumps(header, indent=2), encoding="utf-8")
+    return paths
+
+
+def load_embedding_store(prefix: Path, mmap: bool = True) -> Tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+    """Opens a store and returns (ids, docids, embeddings, header).
+
+    With ``mmap=True`` (the default) the arrays are read-only memory maps.
+    """
+    paths = store_paths(prefix)
+    if not paths["header"].exists():
+        raise FileNotFoundError(f"Embedding store header not found: {paths['header']}")
+    header = json.loads(paths["header"].read_text(encoding="utf-8"))
+    if header.get("format") != STORE_FORMAT:
+        raise ValueError(f"Unsupported embedding store format {header.get('format')!r} in {paths['header']}")
+
+    mmap_mode = "r" if mmap else None
+    embeddings = np.load(paths["embeddings"], mmap_mode=mmap_mode)
+    ids = np.load(paths["ids"], mmap_mode=mmap_mode)
+    docids = np.load(paths["docids"], mmap_mode=mmap_mode)
+    if embeddings.shape != (header["num_vectors"], header["dim"]) or str(embeddings.dtype) != header["dtype"]:
+        raise ValueError(f"Embedding matrix {paths['embeddings']} does not match its header {header}")
+    return ids, docids, embeddings, header
+
+
+def as_torch_tensor(embeddings: np.ndarray) -> torch.Tensor:
+    """Wraps a (possibly read-only, memory-mapped) array as a CPU tensor without copying.
+
+    The tensor shares memory with the map, so it must be treated as read-only.
+    """
+    with warnings.catch_warnings():
+        # torch warns that the array is not writable; the tensor is only read.
+        warnings.simplefilter("ignore", UserWarning)
+        return torch.from_numpy(embeddings)
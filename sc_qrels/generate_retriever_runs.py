@@ -1,5 +1,6 @@
 # sc_qrels/generate_retriever_runs.py
 import json
+import argparse
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm
@@ -7,8 +8,12 @@ import torch
 from transformers import AutoTokenizer, AutoModel
 import os 
 import sys # For utils.py path adjustment if needed
+import hashlib
 from typing import List, Optional, Dict, Tuple # CORRECTED: Added List and other common types
 
+from chunk_manifest import discover_manifests, load_manifest, strategy_name_from_path
+from dense_retrieval import topk_blocked, write_trec_run
+from embedding_cache import EmbeddingCache
 
 # Attempt to import get_torch_device from utils.py
 try:
@@ -39,8 +44,11 @@ RUN_FILES_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 
 MODEL_NAME = "BAAI/bge-large-en-v1.5" 
+MAX_LENGTH = 512
 TOP_K = 20 
+QUERY_BLOCK_SIZE = 256 # Queries scored per matmul block; caps the score matrix at QUERY_BLOCK_SIZE x num_chunks
 YOUR_RUN_NAME_PREFIX = "BGE_DenseRun" 
+MODEL_SLUG = MODEL_NAME.replace("/", "__")
 
 DEVICE = get_torch_device()
 print(f"🖥️  Using device: {DEVICE}")
@@ -73,7 +81,7 @@ def embed_texts(texts_to_embed: List[str], batch_size: int = 32) -> torch.Tensor
             batch_texts, 
             padding=True, 
             truncation=True, 
-            max_length=512, 
+            max_length=MAX_LENGTH, 
             return_tensors="pt"
         ).to(DEVICE)
 
@@ -90,10 +98,87 @@ def embed_texts(texts_to_embed: List[str], batch_size: int = 32) -> torch.Tensor
         
     return torch.cat(all_embeddings_list, dim=0)
 
+# Shared content-addressed cache (also used by embed_chunks.py and retrieve_topk_chunks.py)
+embedding_cache = EmbeddingCache(MODEL_NAME, pooling="mean", max_length=MAX_LENGTH)
+
+def embed_texts_cached(texts_to_embed: List[str]) -> torch.Tensor:
+    """Like embed_texts, but only texts missing from the shared embedding cache go through the model."""
+    vecs = embedding_cache.embed(texts_to_embed, lambda missing: embed_texts(missing).numpy())
+    embedding_cache.report()
+    return torch.from_numpy(vecs)
+
+def get_question_embeddings(questions: List[Dict]) -> torch.Tensor:
+    """Embeds all questions once; unchanged questions are served from the shared embedding cache.
+
+    Row i of the returned tensor is the embedding of questions[i].
+    """
+    print(f"  Embedding {len(questions)} questions with {MODEL_NAME}...")
+    return embed_texts_cached([q["question"] for q in questions])
+
+def manifest_content_hash(manifest_path: Path, manifest=None) -> str:
+    """SHA-256 of the manifest file contents (of every column file for a .cols bundle).
+
+    An offset-only manifest does not contain its texts, so the normalized texts
+    of the documents it references are hashed in as well.
+    """
+    h = hashlib.sha256()
+    # The bundle header only holds bookkeeping (source mtime), not content
+    files = sorted(p for p in manifest_path.iterdir() if p.name != "header.json") if manifest_path.is_dir() else [manifest_path]
+    for file_path in files:
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    if manifest is not None and not manifest.has_text:
+        for doc_id in manifest.doc_ids:
+            h.update(manifest.document_store.get(doc_id).encode("utf-8"))
+    return h.hexdigest()
+
+def strategy_embeddings_path(strategy_name: str, manifest_hash: str) -> Path:
+    return EMBEDDINGS_OUTPUT_DIR / f"{strategy_name}__{MODEL_SLUG}__{manifest_hash[:16]}.npz"
+
+def get_strategy_chunk_embeddings(strategy_name: str, manifest_path: Path,
+                                  chunk_ids: List[str], chunk_texts: List[str], manifest=None) -> torch.Tensor:
+    """Returns chunk embeddings for one manifest, embedding only if the manifest changed.
+
+    Embeddings are stored per (model, manifest content hash) in
+    EMBEDDINGS_OUTPUT_DIR; an unchanged manifest is served from that store.
+    Older stores for the same strategy and model are removed when a new one is
+    written.
+    """
+    manifest_hash = manifest_content_hash(manifest_path, manifest)
+    store_path = strategy_embeddings_path(strategy_name, manifest_hash)
+
+    if store_path.exists():
+        try:
+            stored = np.load(store_path)
+            if str(stored["manifest_sha256"]) == manifest_hash and stored["ids"].tolist() == chunk_ids:
+                print(f"  ✔ Loaded {len(chunk_ids)} stored chunk embeddings from {store_path.name}")
+                return torch.from_numpy(stored["embeddings"])
+            print(f"  ⚠️ Stored embeddings in {store_path.name} do not match the manifest. Re-embedding.", file=sys.stderr)
+        except Exception as e:
+            print(f"  ⚠️ Could not read stored embeddings {store_path.name}: {e}. Re-embedding.", file=sys.stderr)
+
+    print(f"  Embedding {len(chunk_texts)} chunks for {strategy_name}...")
+    chunk_vecs = embed_texts_cached(chunk_texts)
+    if chunk_vecs.numel() == 0:
+        return chunk_vecs
+
+    for stale_path in EMBEDDINGS_OUTPUT_DIR.glob(f"{strategy_name}__{MODEL_SLUG}__*.npz"):
+        stale_path.unlink()
+    np.savez(
+        store_path,
+        manifest_sha256=np.array(manifest_hash),
+        model_name=np.array(MODEL_NAME),
+        ids=np.array(chunk_ids),
+        embeddings=chunk_vecs.numpy(),
+    )
+    print(f"  ✔ Stored chunk embeddings for {strategy_name} in {store_path.name}")
+    return chunk_vecs
+
 # ---------------------------------------------------------------------------
 # Main Processing Logic
 # ---------------------------------------------------------------------------
-def main():
+def main(query_block_size: int = QUERY_BLOCK_SIZE):
     print("--- Starting Retriever Run File Generation ---")
 
     try:
@@ -107,39 +192,41 @@ def main():
         print(f"❌ Error loading questions from {QUESTIONS_FILE}: {e}", file=sys.stderr)
         return
 
-    chunk_manifest_files = sorted(CHUNK_MANIFESTS_DIR.glob("chunks_*.jsonl"))
+    chunk_manifest_files = discover_manifests(CHUNK_MANIFESTS_DIR)
     if not chunk_manifest_files:
         print(f"No chunk manifest files found in {CHUNK_MANIFESTS_DIR}. Exiting.", file=sys.stderr)
         return
     
     print(f"Found {len(chunk_manifest_files)} chunk manifest strategies to process.")
 
+    # Questions are the same for every strategy: embed them once, up front
+    question_vecs = get_question_embeddings(questions).to(DEVICE)
+    qids = [q["qid"] for q in questions]
+
     for manifest_path in chunk_manifest_files:
-        strategy_name = manifest_path.stem.replace("chunks_", "")
+        strategy_name = strategy_name_from_path(manifest_path)
         print(f"\n📄 Processing Strategy: {strategy_name} (from {manifest_path.name})")
 
-        current_strategy_chunks = []
         try:
-            with open(manifest_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    current_strategy_chunks.append(json.loads(line))
-            if not current_strategy_chunks:
+            manifest = load_manifest(manifest_path)
+            if len(manifest) == 0:
                 print(f"  ℹ️ No chunks found in {manifest_path.name}. Skipping this strategy.", file=sys.stderr)
                 continue
-            print(f"  Loaded {len(current_strategy_chunks)} chunks for {strategy_name}.")
+            print(f"  Loaded {len(manifest)} chunks for {strategy_name}.")
         except Exception as e:
             print(f"  ❌ Error loading chunks from {manifest_path.name}: {e}", file=sys.stderr)
             continue
             
-        chunk_texts = [chunk['text'] for chunk in current_strategy_chunks]
-        chunk_ids_for_strategy = [chunk['chunk_id'] for chunk in current_strategy_chunks]
+        chunk_texts = manifest.texts()
+        chunk_ids_for_strategy = manifest.chunk_id_list()
 
         if not chunk_texts:
              print(f"  No text found in chunks for {strategy_name}. Skipping embedding and retrieval.", file=sys.stderr)
              continue
         
-        print(f"  Embedding {len(chunk_texts)} chunks for {strategy_name}...")
-        chunk_vecs_strategy = embed_texts(chunk_texts).to(DEVICE) 
+        chunk_vecs_strategy = get_strategy_chunk_embeddings(
+            strategy_name, manifest_path, chunk_ids_for_strategy, chunk_texts, manifest
+        ).to(DEVICE)
         
         if chunk_vecs_strategy.numel() == 0: 
             print(f"  Embedding resulted in an empty tensor for {strategy_name}. Skipping retrieval.", file=sys.stderr)
@@ -148,31 +235,18 @@ def main():
         run_file_path = RUN_FILES_OUTPUT_DIR / f"run_{YOUR_RUN_NAME_PREFIX}_{strategy_name}.txt"
         run_name_for_trec = f"{YOUR_RUN_NAME_PREFIX}_{strategy_name}"
 
-        with open(run_file_path, "w", encoding="utf-8") as fout:
-            for q_data in tqdm(questions, desc=f"  Retrieving for {strategy_name}", leave=False, ncols=80):
-                qid = q_data["qid"]
-                question_text = q_data["question"]
-
-                q_vec = embed_texts([question_text]).to(DEVICE)
-
-                if q_vec.numel() == 0:
-                    print(f"    ⚠️ Embedding for QID {qid} resulted in empty tensor. Skipping.", file=sys.stderr)
-                    continue
-
-                scores = torch.matmul(q_vec, chunk_vecs_strategy.T).squeeze(0) 
-                
-                actual_k = min(TOP_K, len(chunk_ids_for_strategy)) 
-                if actual_k == 0 : continue
-
-                top_k_scores, top_k_indices = torch.topk(scores, k=actual_k)
-
-                for rank, (score_val, chunk_orig_idx) in enumerate(zip(top_k_scores.tolist(), top_k_indices.tolist())):
-                    retrieved_chunk_id = chunk_ids_for_strategy[chunk_orig_idx]
-                    fout.write(f"{qid}\tQ0\t{retrieved_chunk_id}\t{rank + 1}\t{score_val:.8f}\t{run_name_for_trec}\n")
-        
+        top_k_scores, top_k_indices = topk_blocked(question_vecs, chunk_vecs_strategy, k=TOP_K, block_size=query_block_size)
+        num_lines = write_trec_run(
+            run_file_path, qids, chunk_ids_for_strategy, top_k_scores, top_k_indices, run_name_for_trec
+        )
+        print(f"  Retrieved top-{top_k_indices.shape[1]} for {len(qids)} questions ({num_lines} run lines).")
         print(f"  ✔ Saved TREC run file for {strategy_name} to: {run_file_path}")
 
     print("\n--- Retriever Run File Generation Finished ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate TREC run files for every chunking strategy with dense retrieval.")
+    parser.add_argument("--query_block_size", type=int, default=QUERY_BLOCK_SIZE,
+                        help="Questions scored per matmul block; peak score-matrix memory is block size x number of chunks.")
+    args = parser.parse_args()
+    main(query_block_size=args.query_block_size)
\ No newline at end of file
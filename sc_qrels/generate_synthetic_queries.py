@@ -1,22 +1,41 @@
 # sc_qrels/generate_synthetic_queries.py
 """Generate synthetic QA pairs and exact span annotations for each Alice chapter.
 SME1 uses OpenAI. SME2 (optional pass) uses Google Gemini.
+
+LLM calls run concurrently through llm_engine.LLMEngine (concurrency limit,
+per-provider rate limits, retries on 429/5xx); outputs keep chapter and question
+order. Point --openai_base_url / --gemini_base_url at mock_llm_server.py to run
+the whole pipeline locally. Validated responses are cached on disk
+(llm_response_cache.py), so reruns with unchanged prompts make no API calls.
+--batched_extraction asks all questions about a chapter in one request;
+--pipelined overlaps SME1 question generation with both SMEs' answer passes.
 """
 
 from dotenv import load_dotenv
 load_dotenv()
 
+import asyncio
 import json
 import os
 import re
 import sys
+import tempfile
+import time
 import argparse # For command-line arguments
+from collections import Counter, defaultdict
 from pathlib import Path
 from uuid import uuid4
 from typing import List, Optional, Tuple, Dict
 
-from openai import OpenAI
+from openai import AsyncOpenAI
 from google import genai as google_genai_client # Use your working import for Gemini
+from google.genai import types as google_genai_types
+
+from document_store import get_default_store
+from llm_engine import DEFAULT_CONCURRENCY, DEFAULT_MAX_RETRIES, LLMEngine
+from llm_response_cache import DEFAULT_CACHE_PATH as LLM_CACHE_PATH, LLMResponseCache
+from annotation_journal import AnnotationJournal
+from text_normalization import normalize_characters, normalize_text
 
 # ---------------------------------------------------------------------------
 # Configuration
@@ -41,20 +60,51 @@ MAX_TOKENS_LLM_CALL_OPENAI = 15000
 
 SNAP_SPANS_TO_WHOLE_WORDS = True
 
-client_openai = OpenAI() 
+# --- Batched answer extraction (--batched_extraction) ---
+# Questions about the same chapter asked in one request, so the chapter text is sent once
+BATCHED_EXTRACTION_MAX_QUESTIONS = 10
+
+# --- Concurrency and Rate Limits (see llm_engine.py) ---
+LLM_CONCURRENCY = DEFAULT_CONCURRENCY # Requests in flight per provider
+OPENAI_REQUESTS_PER_MINUTE = 500
+GEMINI_REQUESTS_PER_MINUTE = 300
+LLM_MAX_RETRIES = DEFAULT_MAX_RETRIES
+
+# Created by init_llm_clients() / main()
+client_openai = None
+client_gemini_legacy = None
+llm_engine: Optional[LLMEngine] = None
+llm_response_cache: Optional[LLMResponseCache] = None # None when run with --no_llm_cache
+# Provider names used as cache keys; a base URL override gets its own namespace
+# so responses from e.g. the mock server never stand in for real API answers.
+llm_cache_providers = {"openai": "openai", "gemini": "gemini"}
+# Tokens reported by the APIs per provider (see record_token_usage)
+llm_token_usage: Dict[str, Counter] = defaultdict(Counter)
+
+def init_llm_clients(openai_base_url: Optional[str] = None, gemini_base_url: Optional[str] = None):
+    """Creates the async SDK clients. A base URL override (e.g. mock_llm_server.py) needs no real API key."""
+    global client_openai, client_gemini_legacy
+    llm_cache_providers["openai"] = f"openai@{openai_base_url}" if openai_base_url else "openai"
+    llm_cache_providers["gemini"] = f"gemini@{gemini_base_url}" if gemini_base_url else "gemini"
+    try:
+        # SDK-level retries are off: LLMEngine owns retries and backoff
+        client_openai = AsyncOpenAI(base_url=openai_base_url, max_retries=0,
+                                    api_key=os.getenv("OPENAI_API_KEY") or ("local" if openai_base_url else None))
+    except Exception as e:
+        print(f"⚠️ Error initializing OpenAI client: {e}. SME1 generation will fail.", file=sys.stderr)
+        client_openai = None
 
-try:
-    google_api_key = os.getenv("GOOGLE_API_KEY")
-    if not google_api_key:
-        print("⚠️ GOOGLE_API_KEY not found in .env file. SME2 (Gemini) generation will fail if attempted.", file=sys.stderr)
+    try:
+        google_api_key = os.getenv("GOOGLE_API_KEY") or ("local" if gemini_base_url else None)
+        if not google_api_key:
+            print("⚠️ GOOGLE_API_KEY not found in .env file. SME2 (Gemini) generation will fail if attempted.", file=sys.stderr)
+            client_gemini_legacy = None
+        else:
+            http_options = google_genai_types.HttpOptions(base_url=gemini_base_url) if gemini_base_url else None
+            client_gemini_legacy = google_genai_client.Client(api_key=google_api_key, http_options=http_options)
+    except Exception as e:
+        print(f"⚠️ Error initializing Google Gemini client (using google.genai.Client): {e}. SME2 generation will fail.", file=sys.stderr)
         client_gemini_legacy = None
-    else:
-        client_gemini_legacy = google_genai_client.Client(api_key=google_api_key)
-except Exception as e:
-    print(f"⚠️ Error initializing Google Gemini client (using google.genai.Client): {e}. SME2 generation will fail.", file=sys.stderr)
-    client_gemini_legacy = None
-
-normalized_doc_cache: Dict[str, str] = {}
 
 # ---------------------------------------------------------------------------
 # Helper Function: Load Chapters
@@ -141,13 +191,7 @@ Output:
 }
 '''
 
-def build_answer_extraction_logic_prompt(chapter: dict, question: str) -> str:
-    return f"""
-You are an expert annotator specializing in precise, verbatim text extraction and logical analysis.
-Given the document and a specific question, your tasks are:
-1.  Find and extract the **exact, continuous verbatim substring(s)** from the document that directly answer the question.
-2.  Determine the **logical relationship** between these answer spans relative to the question. The logic can be 'COMPLETE_SPAN', 'OR', or 'AND'.
-**CRITICAL INSTRUCTIONS FOR ANSWERS & LOGIC:**
+ANSWER_EXTRACT_LOGIC_RULES = """**CRITICAL INSTRUCTIONS FOR ANSWERS & LOGIC:**
 -   **Answers**:
     1.  Each answer **must be an EXACT, continuous verbatim substring** copied character-for-character.
     2.  Do NOT paraphrase, summarize, reword, or add non-document text.
@@ -158,7 +202,15 @@ Given the document and a specific question, your tasks are:
 -   **Logic**:
     1.  `COMPLETE_SPAN`: Use if a single, self-contained answer span fully addresses the question.
     2.  `OR`: Use if multiple distinct answer spans are found, and **any ONE of these spans, if presented alone, would be a complete and sufficient answer to the question.**
-    3.  `AND`: Use if multiple distinct answer spans are found, and **ALL of them are required together** to comprehensively answer the question.
+    3.  `AND`: Use if multiple distinct answer spans are found, and **ALL of them are required together** to comprehensively answer the question."""
+
+def build_answer_extraction_logic_prompt(chapter: dict, question: str) -> str:
+    return f"""
+You are an expert annotator specializing in precise, verbatim text extraction and logical analysis.
+Given the document and a specific question, your tasks are:
+1.  Find and extract the **exact, continuous verbatim substring(s)** from the document that directly answer the question.
+2.  Determine the **logical relationship** between these answer spans relative to the question. The logic can be 'COMPLETE_SPAN', 'OR', or 'AND'.
+{ANSWER_EXTRACT_LOGIC_RULES}
 Your entire output **must be a single JSON object**. This object must contain:
 -   A key named "answers": a JSON array of extracted verbatim answer strings.
 -   A key named "logic": a string, either "COMPLETE_SPAN", "OR", or "AND".
@@ -171,115 +223,163 @@ Question: "{question}"
 Document: \"\"\"{chapter['text']}\"\"\"
 """
 
+def build_batched_answer_extraction_logic_prompt(chapter: dict, questions: List[str]) -> str:
+    """One prompt for several questions about the same chapter, so the chapter text is sent once."""
+    numbered_questions = "\n".join(f'Question {i}: "{question}"' for i, question in enumerate(questions))
+    return f"""
+You are an expert annotator specializing in precise, verbatim text extraction and logical analysis.
+Given the document and a numbered list of questions, for EACH question your tasks are:
+1.  Find and extract the **exact, continuous verbatim substring(s)** from the document that directly answer the question.
+2.  Determine the **logical relationship** between these answer spans relative to the question. The logic can be 'COMPLETE_SPAN', 'OR', or 'AND'.
+{ANSWER_EXTRACT_LOGIC_RULES}
+Your entire output **must be a single JSON object** with a key named "results". Its value is a JSON object with one entry per question, keyed by the question number as a string ("0", "1", ...). Each entry must contain:
+-   A key named "answers": a JSON array of extracted verbatim answer strings for that question.
+-   A key named "logic": a string, either "COMPLETE_SPAN", "OR", or "AND".
+Return JSON ONLY (no markdown) in this structure: {{ "results": {{ "0": {{ "answers": ["exact span..."], "logic": "COMPLETE_SPAN" }}, "1": {{ "answers": ["exact span...", "exact span..."], "logic": "AND" }} }} }}
+Here are a few single-question examples; answer every numbered question the same way: {ANSWER_EXTRACT_LOGIC_FEWSHOTS}
+Now, process:
+Title: {chapter['title']}
+Document ID: {chapter['docid']}
+{numbered_questions}
+Document: \"\"\"{chapter['text']}\"\"\"
+"""
+
 # ---------------------------------------------------------------------------
 # LLM Call Helpers
 # ---------------------------------------------------------------------------
-def call_openai_llm_for_json(prompt_str: str, model: str, temperature: float, purpose: str) -> Optional[Dict]:
+# Top-level key each purpose's JSON object must contain as a list
+PURPOSE_LIST_KEYS = {
+    "questions_sme1": "questions",
+    "answers_logic_sme1": "answers",
+    "answers_logic_sme2": "answers",
+}
+# Batched purposes: top-level key that must hold a JSON object keyed by question index
+PURPOSE_OBJECT_KEYS = {
+    "batched_answers_logic_sme1": "results",
+    "batched_answers_logic_sme2": "results",
+}
+
+def parse_llm_json_response(content: str, purpose: str, provider_label: str) -> Optional[Dict]:
+    """Parses and validates a model's JSON answer; shared by both providers."""
+    content = content.strip()
+    if content.startswith("```json"): content = content[len("```json"):].strip()
+    if content.startswith("```"): content = content[len("```"):].strip()
+    if content.endswith("```"): content = content[:-len("```")].strip()
+
     try:
-        messages = [{"role": "user", "content": prompt_str}]
-        completion_params = {
-            "model": model, "messages": messages, "max_tokens": MAX_TOKENS_LLM_CALL_OPENAI,
-            "response_format": {"type": "json_object"}, "temperature": temperature
-        }
-        resp = client_openai.chat.completions.create(**completion_params)
-        content = resp.choices[0].message.content.strip()
         loaded_json = json.loads(content)
-
-        if not isinstance(loaded_json, dict):
-            print(f"❌ OpenAI ({purpose}) response was not a JSON object: {content[:300]}...", file=sys.stderr)
-            return None
-        if purpose == "questions_sme1":
-            key_to_check = "questions"
-            if key_to_check not in loaded_json or not isinstance(loaded_json[key_to_check], list):
-                print(f"❌ OpenAI ({purpose}) response missing '{key_to_check}' key or not a list: {content[:300]}...", file=sys.stderr)
-                return None
-        elif purpose == "answers_logic_sme1":
-            if "answers" not in loaded_json or not isinstance(loaded_json["answers"], list):
-                print(f"❌ OpenAI ({purpose}) response missing 'answers' key or not a list: {content[:300]}...", file=sys.stderr)
-                return None
-            if "logic" not in loaded_json or loaded_json["logic"] not in ["COMPLETE_SPAN", "OR", "AND"]:
-                print(f"⚠️ OpenAI ({purpose}) response missing 'logic' key or invalid: '{loaded_json.get('logic', 'MISSING')}'. Defaulting later. Content: {content[:300]}...", file=sys.stderr)
-        else:
-            print(f"❌ Unknown purpose '{purpose}' for OpenAI LLM call.", file=sys.stderr)
-            return None
-        return loaded_json
     except json.JSONDecodeError as e:
-        raw_content = "OpenAI Response content not available";
-        if 'resp' in locals() and hasattr(resp, 'choices') and resp.choices and hasattr(resp.choices[0], 'message') and resp.choices[0].message: raw_content = resp.choices[0].message.content.strip()
-        print(f"❌ JSONDecodeError in OpenAI ({purpose}) response: {e}. Raw content: {raw_content[:500]}...", file=sys.stderr); return None
-    except Exception as e:
-        print(f"❌ Error calling OpenAI LLM ({purpose}): {e}", file=sys.stderr); return None
+        print(f"❌ JSONDecodeError in {provider_label} ({purpose}) response: {e}. Raw content: {content[:500]}...", file=sys.stderr)
+        return None
+
+    if not isinstance(loaded_json, dict):
+        print(f"❌ {provider_label} ({purpose}) response was not a JSON object: {content[:300]}...", file=sys.stderr)
+        return None
+    key_to_check = PURPOSE_LIST_KEYS.get(purpose) or PURPOSE_OBJECT_KEYS.get(purpose)
+    if key_to_check is None:
+        print(f"❌ Unknown purpose '{purpose}' for {provider_label} LLM call.", file=sys.stderr)
+        return None
+    expected_type, type_name = (list, "a list") if purpose in PURPOSE_LIST_KEYS else (dict, "an object")
+    if key_to_check not in loaded_json or not isinstance(loaded_json[key_to_check], expected_type):
+        print(f"❌ {provider_label} ({purpose}) response missing '{key_to_check}' key or not {type_name}: {content[:300]}...", file=sys.stderr)
+        return None
+    if key_to_check == "answers" and loaded_json.get("logic") not in ["COMPLETE_SPAN", "OR", "AND"]:
+        print(f"⚠️ {provider_label} ({purpose}) response missing 'logic' key or invalid: '{loaded_json.get('logic', 'MISSING')}'. Defaulting later. Content: {content[:300]}...", file=sys.stderr)
+    return loaded_json
+
+
+def record_token_usage(provider: str, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+    """Adds one API response's token counts (cache hits cost none) to llm_token_usage."""
+    usage = llm_token_usage[provider]
+    usage["responses"] += 1
+    usage["prompt_tokens"] += prompt_tokens or 0
+    usage["completion_tokens"] += completion_tokens or 0
+
+def report_token_usage() -> None:
+    for provider, usage in sorted(llm_token_usage.items()):
+        print(f"🔢 {provider}: {usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion tokens "
+              f"in {usage['responses']} responses")
+
+
+async def call_openai_llm_for_json(prompt_str: str, model: str, temperature: float, purpose: str) -> Optional[Dict]:
+    if llm_response_cache is not None:
+        cached_content = llm_response_cache.get(llm_cache_providers["openai"], model, temperature, prompt_str)
+        if cached_content is not None:
+            return parse_llm_json_response(cached_content, purpose, "OpenAI")
+    if not client_openai:
+        print("❌ OpenAI client not initialized. Cannot make SME1 call.", file=sys.stderr)
+        return None
+    messages = [{"role": "user", "content": prompt_str}]
+    completion_params = {
+        "model": model, "messages": messages, "max_tokens": MAX_TOKENS_LLM_CALL_OPENAI,
+        "response_format": {"type": "json_object"}, "temperature": temperature
+    }
+
+    async def request():
+        resp = await client_openai.chat.completions.create(**completion_params)
+        if resp.usage is not None:
+            record_token_usage("openai", resp.usage.prompt_tokens, resp.usage.completion_tokens)
+        return resp.choices[0].message.content or ""
+
+    content = await llm_engine.call("openai", request, description=f"OpenAI LLM ({purpose})")
+    if content is None:
+        return None
+    loaded_json = parse_llm_json_response(content, purpose, "OpenAI")
+    if loaded_json is not None and llm_response_cache is not None:
+        llm_response_cache.put(llm_cache_providers["openai"], model, temperature, prompt_str, content)
+    return loaded_json
 
 
-def call_gemini_client_llm_for_json(prompt_str: str, model_name: str, purpose: str) -> Optional[Dict]:
+async def call_gemini_client_llm_for_json(prompt_str: str, model_name: str, purpose: str) -> Optional[Dict]:
+    if llm_response_cache is not None:
+        cached_content = llm_response_cache.get(llm_cache_providers["gemini"], model_name, None, prompt_str)
+        if cached_content is not None:
+            return parse_llm_json_response(cached_content, purpose, "Gemini")
     if not client_gemini_legacy:
         print("❌ Gemini client (google.genai.Client) not initialized. Cannot make SME2 call.", file=sys.stderr)
         return None
-    try:
-        response = client_gemini_legacy.models.generate_content(
+
+    async def request():
+        response = await client_gemini_legacy.aio.models.generate_content(
             model=f"models/{model_name}", 
             contents=[prompt_str]
         )
+        if response.usage_metadata is not None:
+            record_token_usage("gemini", response.usage_metadata.prompt_token_count,
+                               response.usage_metadata.candidates_token_count)
+        return response
 
-        if not hasattr(response, 'text') or not response.text:
-            error_detail = "Unknown error or empty response"
-            if hasattr(response, 'prompt_feedback') and response.prompt_feedback and hasattr(response.prompt_feedback, 'block_reason'):
-                 error_detail = f"Block reason: {response.prompt_feedback.block_reason}"
-            elif hasattr(response, 'candidates') and not response.candidates:
-                 error_detail = "No candidates returned"
-            print(f"❌ Gemini ({purpose}) response empty or missing text. Detail: {error_detail}", file=sys.stderr)
-            return None
-
-        content = response.text.strip()
-        
-        if content.startswith("```json"): content = content[len("```json"):].strip()
-        if content.startswith("```"): content = content[len("```"):].strip()
-        if content.endswith("```"): content = content[:-len("```")].strip()
-            
-        loaded_json = json.loads(content)
-
-        if not isinstance(loaded_json, dict):
-            print(f"❌ Gemini ({purpose}) response was not a JSON object after parsing: {content[:300]}...", file=sys.stderr)
-            return None
-        
-        if purpose == "answers_logic_sme2": 
-            if "answers" not in loaded_json or not isinstance(loaded_json["answers"], list):
-                print(f"❌ Gemini ({purpose}) response missing 'answers' key or not a list: {content[:300]}...", file=sys.stderr)
-                return None
-            if "logic" not in loaded_json or loaded_json["logic"] not in ["COMPLETE_SPAN", "OR", "AND"]:
-                print(f"⚠️ Gemini ({purpose}) response missing 'logic' key or invalid: '{loaded_json.get('logic', 'MISSING')}'. Defaulting later. Content: {content[:300]}...", file=sys.stderr)
-        else:
-            print(f"❌ Unknown purpose '{purpose}' for Gemini LLM call.", file=sys.stderr)
-            return None
-        return loaded_json
-
-    except json.JSONDecodeError as e:
-        raw_content = "Gemini Response content not available";
-        if 'response' in locals() and hasattr(response, 'text'): raw_content = response.text.strip()
-        print(f"❌ JSONDecodeError in Gemini ({purpose}) response: {e}. Raw content: {raw_content[:500]}...", file=sys.stderr); return None
-    except Exception as e:
-        print(f"❌ Error calling Gemini LLM ({purpose}): {e}", file=sys.stderr)
-        import traceback; traceback.print_exc() 
+    response = await llm_engine.call("gemini", request, description=f"Gemini LLM ({purpose})")
+    if response is None:
         return None
+    if not getattr(response, 'text', None):
+        error_detail = "Unknown error or empty response"
+        if getattr(response, 'prompt_feedback', None) and getattr(response.prompt_feedback, 'block_reason', None):
+             error_detail = f"Block reason: {response.prompt_feedback.block_reason}"
+        elif hasattr(response, 'candidates') and not response.candidates:
+             error_detail = "No candidates returned"
+        print(f"❌ Gemini ({purpose}) response empty or missing text. Detail: {error_detail}", file=sys.stderr)
+        return None
+    loaded_json = parse_llm_json_response(response.text, purpose, "Gemini")
+    if loaded_json is not None and llm_response_cache is not None:
+        llm_response_cache.put(llm_cache_providers["gemini"], model_name, None, prompt_str, response.text)
+    return loaded_json
 
 # ---------------------------------------------------------------------------
 # Span Location and Normalization
 # ---------------------------------------------------------------------------
 def get_normalized_doc_text(docid: str, original_text: str) -> str:
-    if docid not in normalized_doc_cache:
-        text = original_text; text = text.replace('’', "'").replace('‘', "'"); text = text.replace('”', '"').replace('“', '"'); text = text.replace('—', '-').replace('–', '-'); text = re.sub(r'\s+', ' ', text).strip()
-        normalized_doc_cache[docid] = text
-    return normalized_doc_cache[docid]
+    document_store = get_default_store(CHAPTER_DIR)
+    if docid in document_store:
+        return document_store.get(docid)
+    return normalize_text(original_text) # Chapter without a <docid>.json file of its own
 
 def locate_span(normalized_doc_text: str, snippet_from_llm: str) -> Optional[Tuple[int, int, str]]:
     if not snippet_from_llm: return None
     
-    cleaned_snippet = snippet_from_llm.strip()
-    cleaned_snippet = cleaned_snippet.replace('’', "'").replace('‘', "'") 
-    cleaned_snippet = cleaned_snippet.replace('”', '"').replace('“', '"') 
-    cleaned_snippet = cleaned_snippet.replace('—', '-').replace('–', '-') 
+    cleaned_snippet = normalize_characters(snippet_from_llm.strip())
     cleaned_snippet = re.sub(r"\s*(\.\.\.|…|\.\.)$", "", cleaned_snippet).rstrip() 
-    cleaned_snippet = re.sub(r'\s+', ' ', cleaned_snippet).strip() 
+    cleaned_snippet = normalize_text(cleaned_snippet)
 
     temp_snippet_for_stripper = cleaned_snippet 
     punctuation_stripper = re.compile(r"^[,\.\"'\s]*(.*?)[,\.\"'\s]*$") 
@@ -346,62 +446,80 @@ def locate_span(normalized_doc_text: str, snippet_from_llm: str) -> Optional[Tup
 # ---------------------------------------------------------------------------
 # Core Generation Logic for a Single SME
 # ---------------------------------------------------------------------------
-def generate_annotations_for_sme(
+def group_questions_by_chapter(indexed_questions: List[Tuple[int, Dict]], max_per_batch: int) -> List[List[Tuple[int, Dict]]]:
+    """Batches of (index, question) sharing a docid, in order of each chapter's first question."""
+    by_docid: Dict[str, List[Tuple[int, Dict]]] = {}
+    for item in indexed_questions:
+        by_docid.setdefault(item[1]["docid"], []).append(item)
+    return [chapter_items[i:i + max_per_batch]
+            for chapter_items in by_docid.values()
+            for i in range(0, len(chapter_items), max_per_batch)]
+
+async def generate_annotations_for_sme(
     sme_id_str: str,
     chapters_data: List[dict], 
     questions_to_process: List[Dict], 
     llm_call_func, 
     llm_model_name_for_answers: str, 
     llm_temp_for_answers: Optional[float], 
-    output_annotations_path: Path
-    ):
-    
-    sme_final_annotations = []
+    output_annotations_path: Path,
+    resume: bool = False,
+    batched_extraction: bool = False,
+    question_queue: Optional[asyncio.Queue] = None
+    ) -> int:
+    """Extracts answer spans for every question concurrently and returns the number of spans.
+
+    Each answered question is appended to an AnnotationJournal as soon as it
+    finishes; with ``resume=True`` questions already in the journal's progress
+    manifest are skipped. The .json output is consolidated from the journal in
+    question order at the end.
+
+    With ``batched_extraction=True`` the questions of a chapter are asked in one
+    request (up to BATCHED_EXTRACTION_MAX_QUESTIONS); any question missing or
+    malformed in the batched answer is asked again on its own.
+
+    With a ``question_queue`` the questions arrive while this runs: each queue
+    item is a list of new question entries (one chapter's), and None ends the
+    stream. ``questions_to_process`` must then be the list the producer fills,
+    in its final order by the time None is queued; it sets the output order.
+    """
     chapters_lookup = {chap['docid']: chap for chap in chapters_data}
-
-    for q_entry_idx, q_entry in enumerate(questions_to_process):
-        qid = q_entry["qid"]
-        q_text = q_entry["question"]
-        docid = q_entry["docid"]
-
-        print(f"    ➡️ {sme_id_str} - Processing Q {q_entry_idx+1}/{len(questions_to_process)} (QID: {qid}, DOCID: {docid})", flush=True)
-
-        if docid not in chapters_lookup:
-            print(f"    ⚠️ Document {docid} not found for QID {qid}. Skipping.", file=sys.stderr)
-            continue
-        
-        chap = chapters_lookup[docid]
-        original_chapter_text = chap["text"]
-        normalized_chapter_text = get_normalized_doc_text(docid, original_chapter_text)
-
-        answer_logic_prompt_str = build_answer_extraction_logic_prompt(chap, q_text)
-        
-        answer_logic_response_json = None
+    journal = AnnotationJournal(output_annotations_path, sme_id_str, resume=resume)
+    pending_questions = [(q_entry_idx, q_entry) for q_entry_idx, q_entry in enumerate(questions_to_process)
+                         if not journal.is_done(q_entry["qid"])]
+    if resume and question_queue is not None:
+        print(f"  ↩️ {sme_id_str} - Resuming: {len(journal.done)} questions already answered in {journal.progress_path}")
+    elif resume:
+        print(f"  ↩️ {sme_id_str} - Resuming: {len(questions_to_process) - len(pending_questions)} of "
+              f"{len(questions_to_process)} questions already answered in {journal.progress_path}")
+
+    async def request_answer_json(prompt_str: str, purpose: str) -> Optional[Dict]:
         if llm_call_func == call_openai_llm_for_json:
-            purpose = "answers_logic_sme1"
-            answer_logic_response_json = llm_call_func(
-                answer_logic_prompt_str, 
+            return await llm_call_func(
+                prompt_str, 
                 llm_model_name_for_answers, 
                 llm_temp_for_answers,
-                purpose
+                f"{purpose}_sme1"
             )
         elif llm_call_func == call_gemini_client_llm_for_json:
-            purpose = "answers_logic_sme2"
-            answer_logic_response_json = llm_call_func(
-                answer_logic_prompt_str, 
+            return await llm_call_func(
+                prompt_str, 
                 llm_model_name_for_answers, # Pass Gemini model name
-                purpose
+                f"{purpose}_sme2"
             )
-        else:
-            print(f"    ❌ Unknown LLM call function for {sme_id_str}. Skipping.", file=sys.stderr)
-            continue
+        print(f"    ❌ Unknown LLM call function for {sme_id_str}. Skipping.", file=sys.stderr)
+        return None
 
-        if not answer_logic_response_json: 
-            print(f"    ❌ {sme_id_str} - Failed to get valid answer/logic structure for Q: '{q_text[:70]}...'.", file=sys.stderr)
-            continue 
+    def annotations_from_response(q_entry: Dict, answer_logic_response_json: Dict) -> List[Dict]:
+        """Locates one question's {"answers", "logic"} in its chapter text."""
+        question_annotations = []
+        qid = q_entry["qid"]
+        q_text = q_entry["question"]
+        docid = q_entry["docid"]
+        normalized_chapter_text = get_normalized_doc_text(docid, chapters_lookup[docid]["text"])
 
         extracted_answer_texts_from_llm = [str(a).strip() for a in answer_logic_response_json.get("answers",[]) if isinstance(a, str) and str(a).strip()]
-        
+    
         llm_determined_logic = answer_logic_response_json.get("logic")
         if llm_determined_logic not in ["COMPLETE_SPAN", "OR", "AND"]:
             print(f"    ⚠️ {sme_id_str} - LLM provided invalid or missing logic ('{llm_determined_logic}'). Defaulting for QID {qid}.", file=sys.stderr)
@@ -409,19 +527,19 @@ def generate_annotations_for_sme(
 
         if not extracted_answer_texts_from_llm:
             print(f"    ⚠️ {sme_id_str} - No answer spans extracted by LLM for Q: '{q_text[:70]}...'.", file=sys.stderr)
-            continue 
-        
+            return question_annotations 
+    
         located_spans_for_this_q_by_this_sme = 0
         for ans_text_single in extracted_answer_texts_from_llm:
             location_result = locate_span(normalized_chapter_text, ans_text_single)
-            
+        
             if not location_result:
                 print(f"    ⚠️ {sme_id_str} - Local span not found in {docid} for LLM ans: '{ans_text_single[:80]}...' (Q: '{q_text[:60]}...')", file=sys.stderr)
                 continue
 
             start, end, located_text_from_normalized = location_result
-            
-            sme_final_annotations.append({
+        
+            question_annotations.append({
                 "qid": qid, "docid": docid, "start": start, "end": end, 
                 "text": located_text_from_normalized, 
                 "logic": llm_determined_logic, 
@@ -429,76 +547,276 @@ def generate_annotations_for_sme(
                 "sme_id": sme_id_str 
             })
             located_spans_for_this_q_by_this_sme +=1
-        
+    
         if located_spans_for_this_q_by_this_sme > 0:
             print(f"    ✅ {sme_id_str} - Successfully located {located_spans_for_this_q_by_this_sme} span(s) with logic '{llm_determined_logic}' for Q: '{q_text[:60]}...'", file=sys.stderr)
         else:
              print(f"    ❌ {sme_id_str} - No valid local spans found by locate_span for Q: '{q_text[:60]}...' in {docid}.", file=sys.stderr)
+        return question_annotations
 
-    if sme_final_annotations:
-        with open(output_annotations_path, "w", encoding="utf-8") as fa:
-            json.dump(sme_final_annotations, fa, indent=2, ensure_ascii=False)
-        print(f"\n✔ {sme_id_str}: Generated {len(sme_final_annotations)} spans. Saved to {output_annotations_path}")
+    async def annotate_question(q_entry_idx: int, q_entry: Dict) -> Optional[List[Dict]]:
+        """Spans for one question; None if the question could not be answered (it is retried on resume)."""
+        qid = q_entry["qid"]
+        q_text = q_entry["question"]
+        docid = q_entry["docid"]
+
+        print(f"    ➡️ {sme_id_str} - Processing Q {q_entry_idx+1}/{len(questions_to_process)} (QID: {qid}, DOCID: {docid})", flush=True)
+
+        if docid not in chapters_lookup:
+            print(f"    ⚠️ Document {docid} not found for QID {qid}. Skipping.", file=sys.stderr)
+            return None
+
+        answer_logic_prompt_str = build_answer_extraction_logic_prompt(chapters_lookup[docid], q_text)
+        answer_logic_response_json = await request_answer_json(answer_logic_prompt_str, "answers_logic")
+
+        if not answer_logic_response_json: 
+            print(f"    ❌ {sme_id_str} - Failed to get valid answer/logic structure for Q: '{q_text[:70]}...'.", file=sys.stderr)
+            return None 
+        return annotations_from_response(q_entry, answer_logic_response_json)
+
+    async def annotate_and_record(q_entry_idx: int, q_entry: Dict) -> None:
+        question_annotations = await annotate_question(q_entry_idx, q_entry)
+        if question_annotations is not None:
+            journal.record(q_entry["qid"], question_annotations)
+
+    async def annotate_batch_and_record(batch: List[Tuple[int, Dict]]) -> None:
+        docid = batch[0][1]["docid"]
+        if docid not in chapters_lookup or len(batch) == 1:
+            await asyncio.gather(*(annotate_and_record(*item) for item in batch))
+            return
+
+        print(f"    ➡️ {sme_id_str} - Processing Q {', '.join(str(idx + 1) for idx, _ in batch)}/{len(questions_to_process)} "
+              f"in one request (DOCID: {docid})", flush=True)
+        batched_prompt_str = build_batched_answer_extraction_logic_prompt(
+            chapters_lookup[docid], [q_entry["question"] for _, q_entry in batch])
+        batched_response_json = await request_answer_json(batched_prompt_str, "batched_answers_logic")
+        results = batched_response_json["results"] if batched_response_json else {}
+
+        fallback_questions = []
+        for batch_idx, (q_entry_idx, q_entry) in enumerate(batch):
+            answer_logic_response_json = results.get(str(batch_idx))
+            if isinstance(answer_logic_response_json, dict) and isinstance(answer_logic_response_json.get("answers"), list):
+                journal.record(q_entry["qid"], annotations_from_response(q_entry, answer_logic_response_json))
+            else:
+                fallback_questions.append((q_entry_idx, q_entry))
+        if fallback_questions:
+            print(f"    ↪️ {sme_id_str} - {len(fallback_questions)} of {len(batch)} questions for {docid} missing or malformed "
+                  f"in the batched answer. Asking them one at a time.", file=sys.stderr)
+            await asyncio.gather(*(annotate_and_record(*item) for item in fallback_questions))
+
+    async def annotate_pending(indexed_questions: List[Tuple[int, Dict]]) -> None:
+        if batched_extraction:
+            batches = group_questions_by_chapter(indexed_questions, BATCHED_EXTRACTION_MAX_QUESTIONS)
+            await llm_engine.map(annotate_batch_and_record, batches)
+        else:
+            await llm_engine.map(lambda item: annotate_and_record(*item), indexed_questions)
+
+    async def annotate_from_queue() -> None:
+        """Starts on each group of questions as soon as it is queued, without waiting for the rest."""
+        tasks = []
+        num_received = 0
+        while True:
+            new_questions = await question_queue.get()
+            if new_questions is None:
+                break
+            indexed_questions = [(num_received + i, q_entry) for i, q_entry in enumerate(new_questions)
+                                 if not journal.is_done(q_entry["qid"])]
+            num_received += len(new_questions)
+            tasks.append(asyncio.create_task(annotate_pending(indexed_questions)))
+        await asyncio.gather(*tasks)
+
+    t0 = time.perf_counter()
+    try:
+        if question_queue is not None:
+            await annotate_from_queue()
+        else:
+            await annotate_pending(pending_questions)
+        num_spans = journal.consolidate(q_entry["qid"] for q_entry in questions_to_process)
+    finally:
+        journal.close()
+    elapsed = time.perf_counter() - t0
+
+    if num_spans:
+        print(f"\n✔ {sme_id_str}: Generated {num_spans} spans in {elapsed:.1f}s. Saved to {output_annotations_path}")
     else:
         print(f"\nℹ️ {sme_id_str}: No annotations generated or saved to {output_annotations_path}")
-    return sme_final_annotations
+    return num_spans
 
 # ---------------------------------------------------------------------------
 # Main Orchestration
 # ---------------------------------------------------------------------------
-def main(run_sme1: bool, run_sme2: bool):
-    global normalized_doc_cache
-    normalized_doc_cache = {} 
+async def generate_chapter_questions(chap_idx: int, chap: dict, num_chapters: int) -> List[str]:
+    docid = chap["docid"]
+    print(f"\n🧠 SME1 - Processing {docid} (Chapter {chap_idx+1}/{num_chapters}) …", flush=True)
+    print(f"  ➡️ SME1 - Generating questions for {docid} (Temp: {TEMP_SME1_QUESTION}) …", flush=True)
 
+    question_prompt = build_question_generation_prompt(chap)
+    questions_response_json = await call_openai_llm_for_json(question_prompt, MODEL_SME1_PRIMARY, TEMP_SME1_QUESTION, "questions_sme1")
+
+    if not questions_response_json: 
+        print(f"  ❌ SME1 - Failed to generate valid questions for {docid}. Skipping chapter.", file=sys.stderr)
+        return []
+
+    chapter_questions_text = [q for q in questions_response_json.get("questions", []) if isinstance(q, str) and q.strip()]
+    if not chapter_questions_text:
+        print(f"  ℹ️ SME1 - No questions generated or extracted for {docid}. Skipping chapter.", file=sys.stderr)
+        return []
+    print(f"  ✅ SME1 - Received {len(chapter_questions_text)} questions for {docid}.", file=sys.stderr)
+    return chapter_questions_text
+
+async def generate_sme1_questions(chapters_data: List[dict], on_chapter_questions=None) -> List[Dict]:
+    """Generates questions for every chapter concurrently.
+
+    ``on_chapter_questions(entries)`` is called with each chapter's question
+    entries as soon as they arrive; the returned list is in chapter order.
+    """
+    async def generate_chapter_entries(chap_idx: int, chap: dict) -> List[Dict]:
+        chapter_questions_text = await generate_chapter_questions(chap_idx, chap, len(chapters_data))
+        chapter_entries = [{"qid": f"q_{uuid4().hex[:8]}", "question": q_text, "docid": chap["docid"], "group": "g1"}
+                           for q_text in chapter_questions_text]
+        if chapter_entries and on_chapter_questions is not None:
+            on_chapter_questions(chapter_entries)
+        return chapter_entries
+
+    # All chapters are requested concurrently; the results are listed in chapter order
+    entries_per_chapter = await llm_engine.map(lambda item: generate_chapter_entries(*item), enumerate(chapters_data))
+    current_sme1_questions = [q_entry for chapter_entries in entries_per_chapter for q_entry in chapter_entries]
+
+    if current_sme1_questions:
+        print(f"\n✔ SME1 - Generated {len(current_sme1_questions)} total questions.")
+    return current_sme1_questions
+
+def save_sme1_questions(questions: List[Dict]) -> None:
+    """Replaces QUESTIONS_SME1_PATH atomically, so an interrupted write never truncates it."""
+    tmp_path = QUESTIONS_SME1_PATH.with_name(f"{QUESTIONS_SME1_PATH.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as fq:
+        json.dump(questions, fq, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, QUESTIONS_SME1_PATH)
+
+async def load_or_generate_sme1_questions(chapters_data: List[dict], resume: bool = False,
+                                          on_chapter_questions=None) -> List[Dict]:
+    """SME1 questions for every chapter, in chapter order, saved to QUESTIONS_SME1_PATH.
+
+    The file is rewritten as each chapter's questions arrive, before
+    ``on_chapter_questions(entries)`` hands them on, so the annotation journals
+    never refer to a qid that is not on disk. With ``resume`` the saved
+    questions keep their qids and are handed on first; only chapters without
+    any saved question are generated.
+    """
+    questions: List[Dict] = []
+
+    def add_chapter_questions(new_questions: List[Dict]) -> None:
+        questions.extend(new_questions)
+        save_sme1_questions(questions)
+        if on_chapter_questions is not None:
+            on_chapter_questions(new_questions)
+
+    if resume and QUESTIONS_SME1_PATH.exists():
+        # The journals refer to these qids, so a resumed run must not regenerate them
+        with open(QUESTIONS_SME1_PATH, "r", encoding="utf-8") as f:
+            loaded_questions = json.load(f)
+        print(f"↩️ SME1 - Resuming with {len(loaded_questions)} questions from {QUESTIONS_SME1_PATH}")
+        if loaded_questions:
+            add_chapter_questions(loaded_questions)
+
+    docids_with_questions = {q_entry["docid"] for q_entry in questions}
+    remaining_chapters = [chap for chap in chapters_data if chap["docid"] not in docids_with_questions]
+    if remaining_chapters:
+        if questions:
+            print(f"  ➡️ SME1 - Generating questions for the {len(remaining_chapters)} chapters without saved questions")
+        await generate_sme1_questions(remaining_chapters, on_chapter_questions=add_chapter_questions)
+
+    if questions:
+        chapter_order = {chap["docid"]: chap_idx for chap_idx, chap in enumerate(chapters_data)}
+        questions.sort(key=lambda q_entry: chapter_order.get(q_entry["docid"], len(chapter_order)))
+        save_sme1_questions(questions)
+        print(f"✔ SME1 - {len(questions)} questions saved to {QUESTIONS_SME1_PATH}")
+    return questions
+
+async def run_pipelined_generation(chapters_data: List[dict], resume: bool = False, batched_extraction: bool = False):
+    """SME1 questions feed the SME1 and SME2 answer passes chapter by chapter, so all three overlap.
+
+    Each chapter's questions are put on one queue per SME as soon as they are
+    generated, and both annotation passes consume their queue concurrently.
+    Wall-clock time approaches the slower of the two SMEs instead of their sum.
+    """
+    print(f"\n--- Starting pipelined SME1 (OpenAI: {MODEL_SME1_PRIMARY}) and SME2 (Google Gemini: {MODEL_SME2_GEMINI}) Annotation Generation ---")
+    sme1_queue, sme2_queue = asyncio.Queue(), asyncio.Queue()
+    questions_list: List[Dict] = [] # Shared by both passes; in chapter order once the queues are closed
+
+    def queue_questions(new_questions: List[Dict]) -> None:
+        questions_list.extend(new_questions)
+        sme1_queue.put_nowait(new_questions)
+        sme2_queue.put_nowait(new_questions)
+
+    async def produce_questions() -> None:
+        try:
+            # Each chapter's questions are saved before they are queued; the final list is in chapter order
+            questions_list[:] = await load_or_generate_sme1_questions(chapters_data, resume,
+                                                                      on_chapter_questions=queue_questions)
+        finally:
+            sme1_queue.put_nowait(None)
+            sme2_queue.put_nowait(None)
+
+    sme_passes = [
+        ("SME1_OpenAI", sme1_queue, call_openai_llm_for_json, MODEL_SME1_PRIMARY, TEMP_SME1_SPAN_AND_LOGIC, ANNOTATIONS_SME1_OPENAI_PATH),
+        ("SME2_Gemini", sme2_queue, call_gemini_client_llm_for_json, MODEL_SME2_GEMINI, None, ANNOTATIONS_SME2_GEMINI_PATH),
+    ]
+    t0 = time.perf_counter()
+    await asyncio.gather(produce_questions(), *(
+        generate_annotations_for_sme(
+            sme_id_str=sme_id_str,
+            chapters_data=chapters_data,
+            questions_to_process=questions_list,
+            llm_call_func=llm_call_func,
+            llm_model_name_for_answers=model_name,
+            llm_temp_for_answers=temperature,
+            output_annotations_path=output_path,
+            resume=resume,
+            batched_extraction=batched_extraction,
+            question_queue=queue
+        )
+        for sme_id_str, queue, llm_call_func, model_name, temperature, output_path in sme_passes
+    ))
+    print(f"\n✔ Pipelined SME1 + SME2 pass over {len(questions_list)} questions finished in {time.perf_counter() - t0:.1f}s")
+
+async def run_generation(run_sme1: bool, run_sme2: bool, resume: bool = False, batched_extraction: bool = False,
+                         pipelined: bool = False):
     chapters_data = load_chapters() 
     if not chapters_data:
         print("❌ No chapters loaded. Exiting.", file=sys.stderr)
         return
 
+    if pipelined and not (run_sme1 and run_sme2):
+        print("ℹ️ --pipelined needs both --run_sme1 and --run_sme2. Running the selected pass on its own.", file=sys.stderr)
+    elif pipelined and not client_gemini_legacy:
+        print("❌ SME2 (Gemini) run requested, but Gemini client is not initialized. Running SME1 without pipelining.", file=sys.stderr)
+        run_sme2 = False
+    elif pipelined:
+        await run_pipelined_generation(chapters_data, resume, batched_extraction)
+        print("\n--- Script Finished ---")
+        print(f"SME1 output (OpenAI): {QUESTIONS_SME1_PATH}, {ANNOTATIONS_SME1_OPENAI_PATH}")
+        print(f"SME2 output (Gemini): {ANNOTATIONS_SME2_GEMINI_PATH}")
+        return
+
     sme1_generated_questions_list = [] 
 
     if run_sme1:
         print(f"\n--- Starting SME1 (OpenAI: {MODEL_SME1_PRIMARY}) Annotation Generation ---")
-        current_sme1_questions = [] 
-
-        for chap_idx, chap in enumerate(chapters_data):
-            docid = chap["docid"]
-            print(f"\n🧠 SME1 - Processing {docid} (Chapter {chap_idx+1}/{len(chapters_data)}) …", flush=True)
-            print(f"  ➡️ SME1 - Generating questions for {docid} (Temp: {TEMP_SME1_QUESTION}) …", flush=True)
-            
-            question_prompt = build_question_generation_prompt(chap)
-            questions_response_json = call_openai_llm_for_json(question_prompt, MODEL_SME1_PRIMARY, TEMP_SME1_QUESTION, "questions_sme1")
-
-            if not questions_response_json: 
-                print(f"  ❌ SME1 - Failed to generate valid questions for {docid}. Skipping chapter.", file=sys.stderr)
-                continue
-            
-            chapter_questions_text = [q for q in questions_response_json.get("questions", []) if isinstance(q, str) and q.strip()]
-            if not chapter_questions_text:
-                print(f"  ℹ️ SME1 - No questions generated or extracted for {docid}. Skipping chapter.", file=sys.stderr)
-                continue
-            print(f"  ✅ SME1 - Received {len(chapter_questions_text)} questions for {docid}.", file=sys.stderr)
-
-            for q_text in chapter_questions_text:
-                qid = f"q_{uuid4().hex[:8]}"
-                current_sme1_questions.append({"qid": qid, "question": q_text, "docid": docid, "group": "g1"})
-        
-        sme1_generated_questions_list = current_sme1_questions
+        sme1_generated_questions_list = await load_or_generate_sme1_questions(chapters_data, resume)
 
         if sme1_generated_questions_list:
-            with open(QUESTIONS_SME1_PATH, "w", encoding="utf-8") as fq:
-                json.dump(sme1_generated_questions_list, fq, indent=2, ensure_ascii=False)
-            print(f"\n✔ SME1 - Generated {len(sme1_generated_questions_list)} total questions. Saved to {QUESTIONS_SME1_PATH}")
-            
             print(f"\n  ➡️ SME1 - Generating annotations for these questions (Model: {MODEL_SME1_PRIMARY}, Temp: {TEMP_SME1_SPAN_AND_LOGIC})")
-            generate_annotations_for_sme(
+            await generate_annotations_for_sme(
                 sme_id_str="SME1_OpenAI",
                 chapters_data=chapters_data,
                 questions_to_process=sme1_generated_questions_list,
                 llm_call_func=call_openai_llm_for_json,
                 llm_model_name_for_answers=MODEL_SME1_PRIMARY,
                 llm_temp_for_answers=TEMP_SME1_SPAN_AND_LOGIC,
-                output_annotations_path=ANNOTATIONS_SME1_OPENAI_PATH
+                output_annotations_path=ANNOTATIONS_SME1_OPENAI_PATH,
+                resume=resume,
+                batched_extraction=batched_extraction
             )
         else:
             print("\nℹ️ SME1 - No questions were generated. Skipping annotation generation for SME1.")
@@ -534,14 +852,16 @@ def main(run_sme1: bool, run_sme2: bool):
         print(f"\n--- Starting SME2 (Google Gemini: {MODEL_SME2_GEMINI}) Annotation Generation ---")
         print(f"  ➡️ SME2 - Generating annotations for {len(questions_for_sme2)} questions from SME1.")
         
-        generate_annotations_for_sme(
+        await generate_annotations_for_sme(
             sme_id_str="SME2_Gemini",
             chapters_data=chapters_data,
             questions_to_process=questions_for_sme2, 
             llm_call_func=call_gemini_client_llm_for_json,
             llm_model_name_for_answers=MODEL_SME2_GEMINI, 
             llm_temp_for_answers=None, 
-            output_annotations_path=ANNOTATIONS_SME2_GEMINI_PATH
+            output_annotations_path=ANNOTATIONS_SME2_GEMINI_PATH,
+            resume=resume,
+            batched_extraction=batched_extraction
         )
 
     print("\n--- Script Finished ---")
@@ -550,16 +870,135 @@ def main(run_sme1: bool, run_sme2: bool):
     if run_sme2:
         print(f"SME2 output (Gemini): {ANNOTATIONS_SME2_GEMINI_PATH}")
 
+# ---------------------------------------------------------------------------
+# Benchmark: Batched vs. Per-Question Extraction (against the mock server)
+# ---------------------------------------------------------------------------
+async def run_extraction_pass(chapters_data: List[dict], questions: List[Dict], output_path: Path,
+                              batched_extraction: bool, concurrency: int = LLM_CONCURRENCY) -> Dict:
+    """One SME1 answer-extraction pass with a fresh engine; returns its requests, tokens, spans and seconds.
+
+    Uses the current OpenAI client, so call init_llm_clients() first.
+    """
+    global llm_engine
+    llm_engine = LLMEngine(concurrency=concurrency)
+    llm_token_usage.pop("openai", None)
+    t0 = time.perf_counter()
+    num_spans = await generate_annotations_for_sme(
+        sme_id_str="SME1_OpenAI",
+        chapters_data=chapters_data,
+        questions_to_process=questions,
+        llm_call_func=call_openai_llm_for_json,
+        llm_model_name_for_answers=MODEL_SME1_PRIMARY,
+        llm_temp_for_answers=TEMP_SME1_SPAN_AND_LOGIC,
+        output_annotations_path=output_path,
+        batched_extraction=batched_extraction
+    )
+    elapsed = time.perf_counter() - t0
+    usage = llm_token_usage["openai"]
+    return {"requests": llm_engine.stats["openai"]["requests"], "prompt_tokens": usage["prompt_tokens"],
+            "completion_tokens": usage["completion_tokens"], "spans": num_spans, "seconds": elapsed}
+
+async def run_extraction_benchmark_async(concurrency: int, latency: float, batch_omit_every: int) -> bool:
+    from mock_llm_server import MockLLMServer
+
+    global llm_engine, llm_response_cache
+    chapters_data = load_chapters()
+    if not chapters_data:
+        return False
+    llm_response_cache = None # Every request must reach the mock to be counted
+    with MockLLMServer(latency=latency, batch_omit_every=batch_omit_every) as server, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        init_llm_clients(server.openai_base_url, server.gemini_base_url)
+        try:
+            # Questions come from the mock as well and are not written to QUESTIONS_SME1_PATH
+            llm_engine = LLMEngine(concurrency=LLM_CONCURRENCY)
+            questions_per_chapter = await llm_engine.map(
+                lambda item: generate_chapter_questions(*item, len(chapters_data)), enumerate(chapters_data))
+            questions = []
+            for chap, chapter_questions in zip(chapters_data, questions_per_chapter):
+                for q_text in chapter_questions:
+                    questions.append({"qid": f"q_bench{len(questions):03d}", "question": q_text,
+                                      "docid": chap["docid"], "group": "g1"})
+            print(f"\n--- Answer extraction benchmark: {len(questions)} questions over {len(chapters_data)} chapters, "
+                  f"{latency:.2f}s mock latency, concurrency {concurrency}, "
+                  f"batched answers omit every {batch_omit_every or 'no'} question ---")
+            results = {}
+            for batched in (False, True):
+                output_path = Path(tmp_dir) / f"annotations_{'batched' if batched else 'per_question'}.json"
+                results[batched] = await run_extraction_pass(chapters_data, questions, output_path, batched, concurrency)
+                results[batched]["output"] = output_path.read_bytes()
+        finally:
+            await client_openai.close()
+
+    print(f"\n{'mode':<26} {'requests':>8} {'prompt tok':>11} {'compl. tok':>11} {'spans':>6} {'time':>8}")
+    for batched, label in ((False, "one request per question"), (True, "--batched_extraction")):
+        r = results[batched]
+        print(f"{label:<26} {r['requests']:>8} {r['prompt_tokens']:>11} {r['completion_tokens']:>11} "
+              f"{r['spans']:>6} {r['seconds']:>7.2f}s")
+    identical = results[False]["output"] == results[True]["output"]
+    print("✔ Both modes produced identical annotations" if identical else "❌ The two modes produced different annotations")
+    return identical
+
+async def main_async(run_sme1: bool, run_sme2: bool, concurrency: int, openai_rpm: float, gemini_rpm: float,
+                     max_retries: int, openai_base_url: Optional[str], gemini_base_url: Optional[str],
+                     use_llm_cache: bool, refresh_llm_cache: bool, resume: bool, batched_extraction: bool,
+                     pipelined: bool):
+    global llm_engine, llm_response_cache
+    llm_engine = LLMEngine(concurrency=concurrency, max_retries=max_retries,
+                           requests_per_minute={"openai": openai_rpm, "gemini": gemini_rpm})
+    llm_response_cache = LLMResponseCache(LLM_CACHE_PATH, refresh=refresh_llm_cache) if use_llm_cache else None
+    init_llm_clients(openai_base_url, gemini_base_url)
+    print(f"⚙️  Up to {concurrency} concurrent LLM requests per provider (OpenAI {openai_rpm:g}/min, Gemini {gemini_rpm:g}/min, {max_retries} retries)")
+    try:
+        await run_generation(run_sme1, run_sme2, resume, batched_extraction, pipelined)
+    finally:
+        llm_engine.report()
+        report_token_usage()
+        if llm_response_cache is not None:
+            llm_response_cache.report()
+            llm_response_cache.close()
+        if client_openai is not None:
+            await client_openai.close()
+
+def main(run_sme1: bool, run_sme2: bool, concurrency: int = LLM_CONCURRENCY,
+         openai_rpm: float = OPENAI_REQUESTS_PER_MINUTE, gemini_rpm: float = GEMINI_REQUESTS_PER_MINUTE,
+         max_retries: int = LLM_MAX_RETRIES, openai_base_url: Optional[str] = None, gemini_base_url: Optional[str] = None,
+         use_llm_cache: bool = True, refresh_llm_cache: bool = False, resume: bool = False,
+         batched_extraction: bool = False, pipelined: bool = False):
+    asyncio.run(main_async(run_sme1, run_sme2, concurrency, openai_rpm, gemini_rpm, max_retries,
+                           openai_base_url, gemini_base_url, use_llm_cache, refresh_llm_cache, resume,
+                           batched_extraction, pipelined))
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Generate synthetic QA annotations using one or two SMEs.")
     parser.add_argument("--run_sme1", action="store_true", help="Run SME1 (OpenAI) question and annotation generation pass.")
     parser.add_argument("--run_sme2", action="store_true", help="Run SME2 (Google Gemini) annotation generation pass. Uses questions from SME1.")
+    parser.add_argument("--concurrency", type=int, default=LLM_CONCURRENCY, help="Maximum LLM requests in flight at once per provider (1 = sequential).")
+    parser.add_argument("--openai_rpm", type=float, default=OPENAI_REQUESTS_PER_MINUTE, help="OpenAI requests per minute (token-bucket rate limit).")
+    parser.add_argument("--gemini_rpm", type=float, default=GEMINI_REQUESTS_PER_MINUTE, help="Gemini requests per minute (token-bucket rate limit).")
+    parser.add_argument("--max_retries", type=int, default=LLM_MAX_RETRIES, help="Retries per request on 429/5xx/connection errors, with exponential backoff.")
+    parser.add_argument("--openai_base_url", default=None, help="Override the OpenAI API base URL (e.g. the mock server: http://127.0.0.1:8765/v1).")
+    parser.add_argument("--gemini_base_url", default=None, help="Override the Gemini API base URL (e.g. the mock server: http://127.0.0.1:8765).")
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted run: reuse questions_sme1.json and skip questions already in the annotation journals.")
+    parser.add_argument("--batched_extraction", action="store_true", help="Ask all questions about a chapter in one answer-extraction request (falls back to one request per question).")
+    parser.add_argument("--pipelined", action="store_true", help="With --run_sme1 --run_sme2: start both SMEs' answer extraction for each chapter as soon as its questions are generated.")
+    parser.add_argument("--no_llm_cache", action="store_true", help="Bypass the on-disk LLM response cache entirely.")
+    parser.add_argument("--refresh_llm_cache", action="store_true", help="Ignore cached responses, call the APIs and overwrite the cache entries.")
+    parser.add_argument("--benchmark_batched_extraction", action="store_true", help="Compare SME1 answer extraction with and without --batched_extraction against an in-process mock server, then exit.")
+    parser.add_argument("--benchmark_latency", type=float, default=0.3, help="Seconds the benchmark's mock server waits before each response.")
+    parser.add_argument("--benchmark_batch_omit_every", type=int, default=0, help="The benchmark's mock leaves every Nth question out of batched answers (0 = never).")
     
     args = parser.parse_args()
 
+    if args.benchmark_batched_extraction:
+        sys.exit(0 if asyncio.run(run_extraction_benchmark_async(
+            args.concurrency, args.benchmark_latency, args.benchmark_batch_omit_every)) else 1)
     if not args.run_sme1 and not args.run_sme2:
         print("No SME pass selected. Use --run_sme1 and/or --run_sme2.")
         print("Example: python sc_qrels/generate_synthetic_queries.py --run_sme1 --run_sme2")
     else:
-        normalized_doc_cache = {}
-        main(run_sme1=args.run_sme1, run_sme2=args.run_sme2)
\ No newline at end of file
+        main(run_sme1=args.run_sme1, run_sme2=args.run_sme2, concurrency=args.concurrency,
+             openai_rpm=args.openai_rpm, gemini_rpm=args.gemini_rpm, max_retries=args.max_retries,
+             openai_base_url=args.openai_base_url, gemini_base_url=args.gemini_base_url,
+             use_llm_cache=not args.no_llm_cache, refresh_llm_cache=args.refresh_llm_cache, resume=args.resume,
+             batched_extraction=args.batched_extraction, pipelined=args.pipelined)
\ No newline at end of file
@@ -0,0 +1,234 @@
+# sc_qrels/llm_engine.py
+"""Concurrent, rate-limited LLM calls with retries, for the annotation generator.
+
+``LLMEngine.call(provider, request)`` awaits one API request under three limits:
+
+- a per-provider concurrency limit (an ``asyncio.Semaphore`` each), so at
+  most ``concurrency`` requests are in flight to any one provider while
+  requests to different providers (e.g. the SME1 and SME2 passes of a
+  pipelined run) do not wait for each other
+- a per-provider token bucket (requests per minute with a small burst), so
+  a provider's rate limit is respected however many coroutines are waiting
+- exponential backoff with jitter on 429/5xx and connection errors,
+  honouring a ``Retry-After`` header when the provider sends one
+
+Requests that still fail, or fail with a non-retryable error (e.g. 400), are
+logged and return None. This matches the generator's synchronous helpers,
+which returned None instead of raising. ``LLMEngine.map`` runs a coroutine per
+item and returns the results in input order, however the calls complete.
+
+The engine knows nothing about OpenAI or Gemini beyond duck-typing their
+exceptions (``status_code`` / ``code`` and ``response.headers``).
+
+Usage:
+    python sc_qrels/llm_engine.py --benchmark   # sequential vs. concurrent against the local mock server
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 6
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+# Transport-level failures (no HTTP status) worth retrying, matched by class name
+# so the engine does not have to import the SDKs: openai's APIConnectionError /
+# APITimeoutError and httpx's TransportError family.
+TRANSIENT_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "TransportError"}
+
+
+def error_status(exc: BaseException) -> Optional[int]:
+    """HTTP status of an SDK error: openai uses ``status_code``, google-genai uses ``code``."""
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    status = error_status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None  # HTTP-date form; fall back to exponential backoff
+    return None
+
+
+class TokenBucket:
+    """Allows ``requests_per_minute`` on average with bursts of up to ``burst`` requests."""
+
+    def __init__(self, requests_per_minute: float, burst: Optional[int] = None):
+        if requests_per_minute <= 0:
+            raise ValueError(f"requests_per_minute must be positive, got {requests_per_minute}")
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, min(10, int(self.rate))))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        # The lock queues waiters, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+
+class LLMEngine:
+    """Runs LLM requests concurrently under per-provider concurrency and rate limits, with retries."""
+
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        requests_per_minute: Optional[Dict[str, float]] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE_SECONDS,
+        backoff_max: float = BACKOFF_MAX_SECONDS,
+    ):
+        if concurrency < 1:
+            raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphores: Dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(concurrency))
+        self._buckets = {provider: TokenBucket(rpm) for provider, rpm in (requests_per_minute or {}).items() if rpm}
+        self.stats: Dict[str, Counter] = defaultdict(Counter)
+
+    def backoff_delay(self, attempt: int, exc: BaseException) -> float:
+        retry_after = retry_after_seconds(exc)
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        # "Full jitter" keeps retries of a burst of 429s from arriving together again
+        return random.uniform(0.5, 1.0) * min(self.backoff_max, self.backoff_base * 2 ** attempt)
+
+    async def call(self, provider: str, request: Callable[[], Awaitable[T]], description: str = "") -> Optional[T]:
+        """Awaits ``request()`` with limits and retries; returns None if it ultimately fails."""
+        label = description or provider
+        stats = self.stats[provider]
+        bucket = self._buckets.get(provider)
+        semaphore = self._semaphores[provider]
+        for attempt in range(self.max_retries + 1):
+            async with semaphore:
+                if bucket is not None:
+                    await bucket.acquire()
+                stats["requests"] += 1
+                try:
+                    result = await request()
+                except Exception as e:
+                    error = e
+                else:
+                    stats["succeeded"] += 1
+                    return result
+
+            status = error_status(error)
+            if not is_retryable(error) or attempt == self.max_retries:
+                stats["failed"] += 1
+                tries = f" after {attempt + 1} attempts" if attempt else ""
+                print(f"❌ Error calling {label}{tries}: {error}", file=sys.stderr)
+                return None
+            delay = self.backoff_delay(attempt, error)
+            stats["retries"] += 1
+            if status == 429:
+                stats["rate_limited"] += 1
+            print(f"    ⏳ {label}: {status or type(error).__name__}, retry {attempt + 1}/{self.max_retries} in {delay:.1f}s",
+                  file=sys.stderr)
+            await asyncio.sleep(delay)  # Outside the semaphore, so other requests keep the slot busy
+        return None
+
+    async def map(self, func: Callable[[R], Awaitable[T]], items: Iterable[R]) -> List[T]:
+        """Runs ``func(item)`` for every item concurrently; results are in input order."""
+        return list(await asyncio.gather(*(func(item) for item in items)))
+
+    def report(self) -> None:
+        for provider, stats in sorted(self.stats.items()):
+            print(f"📊 {provider}: {stats['requests']} requests, {stats['succeeded']} succeeded, "
+                  f"{stats['retries']} retries ({stats['rate_limited']} rate-limited), {stats['failed']} failed")
+
+
+# ---------------------------------------------------------------------------
+# Benchmark against the local mock server
+# ---------------------------------------------------------------------------
+async def _run_echo_requests(engine: LLMEngine, client, num_requests: int) -> List[Optional[str]]:
+    async def one(i: int) -> Optional[str]:
+        async def request():
+            resp = await client.chat.completions.create(
+                model="mock-model", messages=[{"role": "user", "content": f"echo:{i}"}], temperature=0.0)
+            return resp.choices[0].message.content
+        return await engine.call("openai", request, description=f"mock OpenAI (echo {i})")
+    return await engine.map(one, range(num_requests))
+
+
+def run_benchmark(num_requests: int, concurrency: int, latency: float, rate_limit_every: int, error_rate: float) -> bool:
+    """Sends the same echo requests sequentially and concurrently; checks results keep input order."""
+    from openai import AsyncOpenAI
+    from mock_llm_server import MockLLMServer
+
+    print(f"--- LLM engine benchmark: {num_requests} requests, {latency:.2f}s latency, "
+          f"429 every {rate_limit_every} requests, {error_rate:.0%} 503s ---")
+    expected = [f'{{"echo": "echo:{i}"}}' for i in range(num_requests)]
+    ok = True
+    with MockLLMServer(latency=latency, rate_limit_every=rate_limit_every, error_rate=error_rate, seed=0) as server:
+        for label, limit in (("sequential", 1), ("concurrent", concurrency)):
+
+            async def run():
+                client = AsyncOpenAI(base_url=server.openai_base_url, api_key="mock", max_retries=0)
+                engine = LLMEngine(concurrency=limit, backoff_base=0.05, backoff_max=0.5)
+                t0 = time.perf_counter()
+                results = await _run_echo_requests(engine, client, num_requests)
+                elapsed = time.perf_counter() - t0
+                await client.close()
+                return engine, results, elapsed
+
+            engine, results, elapsed = asyncio.run(run())
+            in_order = results == expected
+            ok = ok and in_order
+            print(f"  {label:<11} (concurrency {limit:>2}) {elapsed:>7.2f}s  "
+                  f"{'✔ results in input order' if in_order else '❌ results missing or out of order'}")
+            engine.report()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the LLM engine against the local mock server.")
+    parser.add_argument("--benchmark", action="store_true", help="Run sequential vs. concurrent requests against the mock server.")
+    parser.add_argument("--num_requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds the mock server waits before each response.")
+    parser.add_argument("--rate_limit_every", type=int, default=7, help="The mock server answers every Nth request with 429.")
+    parser.add_argument("--error_rate", type=float, default=0.05, help="Fraction of mock responses that are 503s.")
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        parser.print_help()
+        sys.exit(0)
+    sys.exit(0 if run_benchmark(args.num_requests, args.concurrency, args.latency, args.rate_limit_every, args.error_rate) else 1)
@@ -0,0 +1,139 @@
+# sc_qrels/llm_response_cache.py
+"""On-disk cache of raw LLM responses for the annotation generator.
+
+Entries are keyed by (provider, model, temperature, sha256 of the prompt), so
+rerunning ``generate_synthetic_queries.py`` with unchanged prompts (the
+temperature-0 answer-extraction prompts in particular) costs no API calls.
+Only responses that parsed and validated are stored, so a malformed answer is
+requested again on the next run.
+
+The cache is a single SQLite file, like embedding_cache.py. ``refresh=True``
+ignores stored entries for reading but still overwrites them with fresh
+responses; ``invalidate()`` deletes entries for a provider and/or model.
+
+Usage:
+    python sc_qrels/llm_response_cache.py                                 # entry counts per provider/model
+    python sc_qrels/llm_response_cache.py --invalidate --provider gemini  # drop all Gemini responses
+"""
+
+import argparse
+import hashlib
+import sqlite3
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Optional
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE_PATH = BASE_DIR / "data" / "processed" / "llm_response_cache.sqlite"
+
+
+def prompt_sha256(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def temperature_key(temperature: Optional[float]) -> str:
+    """None means the provider's default temperature, which is distinct from any explicit value."""
+    return "default" if temperature is None else repr(float(temperature))
+
+
+class LLMResponseCache:
+    """SQLite-backed cache of response texts keyed by (provider, model, temperature, prompt hash)."""
+
+    def __init__(self, path: Path = DEFAULT_CACHE_PATH, refresh: bool = False):
+        self.path = Path(path)
+        self.refresh = refresh
+        self.stats: Dict[str, Counter] = defaultdict(Counter)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=60)
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   provider      TEXT NOT NULL,
+                   model         TEXT NOT NULL,
+                   temperature   TEXT NOT NULL,
+                   prompt_sha256 TEXT NOT NULL,
+                   response      TEXT NOT NULL,
+                   created       REAL NOT NULL,
+                   last_used     REAL NOT NULL,
+                   PRIMARY KEY (provider, model, temperature, prompt_sha256)
+               )"""
+        )
+        self.conn.commit()
+
+    def get(self, provider: str, model: str, temperature: Optional[float], prompt: str) -> Optional[str]:
+        """Cached response text, or None on a miss (always a miss with ``refresh=True``)."""
+        row = None
+        key = (provider, model, temperature_key(temperature), prompt_sha256(prompt))
+        if not self.refresh:
+            row = self.conn.execute(
+                "SELECT response FROM responses WHERE provider = ? AND model = ? AND temperature = ? AND prompt_sha256 = ?",
+                key,
+            ).fetchone()
+        if row is None:
+            self.stats[provider]["misses"] += 1
+            return None
+        self.stats[provider]["hits"] += 1
+        self.conn.execute(
+            "UPDATE responses SET last_used = ? WHERE provider = ? AND model = ? AND temperature = ? AND prompt_sha256 = ?",
+            (time.time(), *key),
+        )
+        self.conn.commit()
+        return row[0]
+
+    def put(self, provider: str, model: str, temperature: Optional[float], prompt: str, response: str) -> None:
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (provider, model, temperature, prompt_sha256, response, created, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (provider, model, temperature_key(temperature), prompt_sha256(prompt), response, now, now),
+        )
+        self.conn.commit()
+        self.stats[provider]["stored"] += 1
+
+    def invalidate(self, provider: Optional[str] = None, model: Optional[str] = None) -> int:
+        """Deletes entries matching provider and/or model (all entries if both are None)."""
+        clauses, params = [], []
+        if provider is not None:
+            clauses.append("provider = ?")
+            params.append(provider)
+        if model is not None:
+            clauses.append("model = ?")
+            params.append(model)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        deleted = self.conn.execute(f"DELETE FROM responses{where}", params).rowcount
+        self.conn.commit()
+        return deleted
+
+    def counts(self) -> Dict[tuple, int]:
+        rows = self.conn.execute("SELECT provider, model, COUNT(*) FROM responses GROUP BY provider, model ORDER BY provider, model")
+        return {(provider, model): count for provider, model, count in rows}
+
+    def report(self, label: str = "LLM response cache") -> None:
+        for provider, stats in sorted(self.stats.items()):
+            print(f"  🗄️  {label} [{provider}]: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['stored']} stored ({self.path.name})", file=sys.stderr)
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the LLM response cache.")
+    parser.add_argument("--cache_path", type=Path, default=DEFAULT_CACHE_PATH)
+    parser.add_argument("--invalidate", action="store_true", help="Delete cached responses (filtered by --provider/--model).")
+    parser.add_argument("--provider", default=None, help="Restrict --invalidate to one provider (openai, gemini).")
+    parser.add_argument("--model", default=None, help="Restrict --invalidate to one model name.")
+    args = parser.parse_args()
+
+    cache = LLMResponseCache(args.cache_path)
+    if args.invalidate:
+        deleted = cache.invalidate(provider=args.provider, model=args.model)
+        print(f"✔ Deleted {deleted} cached responses from {args.cache_path}")
+    counts = cache.counts()
+    if not counts:
+        print(f"ℹ️ {args.cache_path} holds no responses")
+    for (provider, model), count in counts.items():
+        print(f"  {provider:<8} {model:<32} {count:>6} responses")
+    cache.close()
@@ -0,0 +1,267 @@
+# sc_qrels/mock_llm_server.py
+"""Local stand-in for the OpenAI and Gemini HTTP APIs used by generate_synthetic_queries.py.
+
+Serves the two endpoints the SDKs call, with the same JSON shapes:
+
+- ``POST /v1/chat/completions``                    OpenAI chat completions
+  (client ``base_url``: ``http://127.0.0.1:<port>/v1``)
+- ``POST /v1beta/models/<model>:generateContent``  Gemini generateContent
+  (client ``base_url``: ``http://127.0.0.1:<port>``)
+
+Answers are deterministic and derived from the prompt itself:
+- question-generation prompts get questions about sentences of the embedded document
+- answer-extraction prompts get one verbatim sentence of the embedded document,
+  so ``locate_span`` finds it
+- batched answer-extraction prompts (numbered ``Question <i>:`` lines) get a
+  ``{"results": {"<i>": ...}}`` object with the same sentence per question as
+  the single-question prompt; ``batch_omit_every`` leaves out every Nth entry
+  to exercise the per-question fallback
+- any other prompt is echoed back as ``{"echo": <prompt>}``
+
+Gemini replies are wrapped in a json code fence, as the real model often does.
+For exercising the retry logic, every ``rate_limit_every``-th request is
+answered with 429 (with ``Retry-After``), a fraction ``error_rate`` with 503,
+and every response is delayed by ``latency`` seconds. Token usage in the
+responses is estimated as characters / 4.
+
+Usage:
+    python sc_qrels/mock_llm_server.py --port 8765 --latency 0.5
+    python sc_qrels/generate_synthetic_queries.py --run_sme1 --run_sme2 \\
+        --openai_base_url http://127.0.0.1:8765/v1 --gemini_base_url http://127.0.0.1:8765
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+DEFAULT_PORT = 8765
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+DOCUMENT_BLOCK = re.compile(r'Document: """(.*)"""', re.S)
+QUESTION_LINE = re.compile(r'^Question: "(.*)"\s*$', re.M)
+NUMBERED_QUESTION_LINE = re.compile(r'^Question (\d+): "(.*)"\s*$', re.M)
+
+
+# ---------------------------------------------------------------------------
+# Canned responses
+# ---------------------------------------------------------------------------
+def approximate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def document_sentences(prompt: str) -> list:
+    """Sentences of the last document embedded in the prompt (the few-shot documents come first)."""
+    documents = DOCUMENT_BLOCK.findall(prompt)
+    if not documents:
+        return []
+    sentences = [s.strip() for s in SENTENCE_BOUNDARY.split(documents[-1].strip()) if s.strip()]
+    # Medium-length single-line sentences are the ones a real model would quote
+    usable = [s for s in sentences if 20 <= len(s) <= 300 and '"' not in s]
+    return usable or sentences
+
+
+def pick_sentence(sentences: list, key: str) -> str:
+    digest = int(hashlib.sha256(key.encode("utf-8")).hexdigest(), 16)
+    return sentences[digest % len(sentences)]
+
+
+def answer_for_prompt(prompt: str, batch_omit_every: int = 0) -> dict:
+    if "generate between" in prompt and '"questions"' in prompt:
+        sentences = document_sentences(prompt)
+        low = int(re.search(r"generate between (\d+)", prompt).group(1))
+        picked = sentences[:: max(1, len(sentences) // low)][:low] if sentences else []
+        return {"questions": [f"What happens when the text says: {' '.join(s.split()[:8])}?" for s in picked]}
+
+    sentences = document_sentences(prompt)
+    numbered_questions = NUMBERED_QUESTION_LINE.findall(prompt)
+    if numbered_questions and sentences:
+        return {"results": {
+            index: {"answers": [pick_sentence(sentences, question)], "logic": "COMPLETE_SPAN"}
+            for position, (index, question) in enumerate(numbered_questions, start=1)
+            if not (batch_omit_every and position % batch_omit_every == 0)
+        }}
+
+    questions = QUESTION_LINE.findall(prompt)
+    if questions and sentences:
+        return {"answers": [pick_sentence(sentences, questions[-1])], "logic": "COMPLETE_SPAN"}
+    return {"echo": prompt}
+
+
+def openai_response(model: str, prompt: str, content: str, request_number: int) -> dict:
+    prompt_tokens, completion_tokens = approximate_tokens(prompt), approximate_tokens(content)
+    return {
+        "id": f"chatcmpl-mock-{request_number}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def gemini_response(model: str, prompt: str, content: str) -> dict:
+    text = f"```json\n{content}\n```"
+    prompt_tokens, completion_tokens = approximate_tokens(prompt), approximate_tokens(text)
+    return {
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+        "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens,
+                          "totalTokenCount": prompt_tokens + completion_tokens},
+        "modelVersion": model,
+    }
+
+
+# ---------------------------------------------------------------------------
+# HTTP server
+# ---------------------------------------------------------------------------
+class MockLLMRequestHandler(BaseHTTPRequestHandler):
+    server: "MockLLMHTTPServer"
+
+    def log_message(self, format, *args):  # Keep the generator's output readable
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "Request body is not valid JSON", "code": 400}})
+            return
+
+        gemini_match = re.match(r"^/v1beta/models/([^/:]+):generateContent", self.path)
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            provider, model = "openai", body.get("model", "")
+            prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        elif gemini_match:
+            provider, model = "gemini", gemini_match.group(1)
+            prompt = "\n".join(part.get("text", "") for content in body.get("contents", [])
+                               for part in content.get("parts", []))
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path}", "code": 404}})
+            return
+
+        request_number, fault = self.server.next_request()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if fault is not None:
+            status, message, status_name = fault
+            headers = {"Retry-After": f"{self.server.retry_after:g}"} if status == 429 else None
+            if provider == "openai":
+                error = {"message": message, "type": status_name.lower(), "code": status_name.lower()}
+            else:
+                error = {"code": status, "message": message, "status": status_name}
+            self._send_json(status, {"error": error}, headers)
+            return
+
+        content = json.dumps(answer_for_prompt(prompt, self.server.batch_omit_every), ensure_ascii=False)
+        if provider == "openai":
+            self._send_json(200, openai_response(model, prompt, content, request_number))
+        else:
+            self._send_json(200, gemini_response(model, prompt, content))
+
+
+class MockLLMHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # The default listen backlog of 5 refuses bursts of concurrent requests
+
+    def __init__(self, address: Tuple[str, int], latency: float = 0.0, rate_limit_every: int = 0,
+                 error_rate: float = 0.0, retry_after: float = 0.1, seed: Optional[int] = None,
+                 batch_omit_every: int = 0):
+        super().__init__(address, MockLLMRequestHandler)
+        self.batch_omit_every = batch_omit_every
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.request_count = 0
+        self.fault_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_request(self) -> Tuple[int, Optional[Tuple[int, str, str]]]:
+        """Numbers the request and decides whether it gets an injected error."""
+        with self._lock:
+            self.request_count += 1
+            n = self.request_count
+            fault = None
+            if self.rate_limit_every and n % self.rate_limit_every == 0:
+                fault = (429, "Rate limit reached (mock)", "RESOURCE_EXHAUSTED")
+            elif self.error_rate and self._random.random() < self.error_rate:
+                fault = (503, "Service unavailable (mock)", "UNAVAILABLE")
+            self.fault_count += fault is not None
+            return n, fault
+
+
+class MockLLMServer:
+    """Runs the mock server on a background thread; use as a context manager."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **server_options):
+        self.httpd = MockLLMHTTPServer((host, port), **server_options)
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    @property
+    def gemini_base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve mock OpenAI and Gemini endpoints on localhost.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response.")
+    parser.add_argument("--rate_limit_every", type=int, default=0, help="Answer every Nth request with 429 (0 = never).")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests answered with 503.")
+    parser.add_argument("--retry_after", type=float, default=0.1, help="Retry-After seconds sent with 429s.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the 503 injection.")
+    parser.add_argument("--batch_omit_every", type=int, default=0, help="Leave every Nth question out of batched answers (0 = never).")
+    args = parser.parse_args()
+
+    httpd = MockLLMHTTPServer((args.host, args.port), latency=args.latency, rate_limit_every=args.rate_limit_every,
+                              error_rate=args.error_rate, retry_after=args.retry_after, seed=args.seed,
+                              batch_omit_every=args.batch_omit_every)
+    host, port = httpd.server_address[:2]
+    print(f"🧪 Mock LLM server on http://{host}:{port}")
+    print(f"   OpenAI base URL: http://{host}:{port}/v1")
+    print(f"   Gemini base URL: http://{host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n✔ Served {httpd.request_count} requests ({httpd.fault_count} injected errors)", file=sys.stderr)
+    finally:
+        httpd.server_close()
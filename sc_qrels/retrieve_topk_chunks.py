@@ -1,20 +1,34 @@
 # sc_qrels/retrieve_topk_chunks.py
 
+import argparse
 import json
+import sys
 import numpy as np
 from pathlib import Path
 from tqdm import tqdm
 import torch
 from transformers import AutoTokenizer, AutoModel
 from utils import get_torch_device
+from dense_retrieval import topk_blocked
+from embedding_cache import EmbeddingCache
+from embedding_store import as_torch_tensor, load_embedding_store, store_exists
 
 # Configuration
-EMBED_PATH = Path("data/processed/chunk_embeddings.npz")
+EMBED_PREFIX = Path("data/processed/chunk_embeddings") # Memory-mapped store written by embed_chunks.py
+LEGACY_EMBED_PATH = Path("data/processed/chunk_embeddings.npz")
 QUESTIONS_PATH = Path("data/processed/questions.json")
 OUT_PATH = Path("data/processed/retrievals.jsonl")
 
 MODEL_NAME = "BAAI/bge-large-en-v1.5"
 TOP_K = 20
+MAX_LENGTH = 512 # Tokenizer's model_max_length; also part of the embedding cache key
+QUESTION_BATCH_SIZE = 32
+QUERY_BLOCK_SIZE = 256 # Queries scored per matmul block; caps the score matrix at QUERY_BLOCK_SIZE x num_chunks
+
+parser = argparse.ArgumentParser(description="Retrieve the top-k chunks for every question from the chunk embedding store.")
+parser.add_argument("--query_block_size", type=int, default=QUERY_BLOCK_SIZE,
+                    help="Questions scored per matmul block; peak score-matrix memory is block size x number of chunks.")
+args = parser.parse_args()
 
 # Load device and model
 device = get_torch_device()
@@ -29,42 +43,67 @@ def mean_pooling(output, mask):
     return (token_emb * mask).sum(1) / mask.sum(1)
 
 # Load chunk embeddings
-chunk_data = np.load(EMBED_PATH)
-chunk_ids = chunk_data["ids"]
-chunk_docids = chunk_data["docids"]
-chunk_vecs = chunk_data["embeddings"]  # shape: (num_chunks, 1024)
-chunk_vecs = torch.tensor(chunk_vecs, dtype=torch.float32).to(device)
+if store_exists(EMBED_PREFIX):
+    # Memory-mapped: no decompression, pages are read on demand and shared across processes
+    chunk_ids, chunk_docids, chunk_matrix, header = load_embedding_store(EMBED_PREFIX, mmap=True)
+    chunk_vecs = as_torch_tensor(chunk_matrix)  # zero-copy view of the map, shape: (num_chunks, 1024)
+    if device.type != "cpu":
+        chunk_vecs = chunk_vecs.to(device)
+    elif chunk_vecs.dtype != torch.float32:
+        chunk_vecs = chunk_vecs.float()  # half-precision matmul on CPU is slow; upcast once
+    chunks_normalized = header["normalized"]
+    print(f"✔ Opened {header['num_vectors']} {header['dtype']} chunk embeddings from {EMBED_PREFIX}.npy (mmap)")
+else:
+    chunk_data = np.load(LEGACY_EMBED_PATH)
+    chunk_ids = chunk_data["ids"]
+    chunk_docids = chunk_data["docids"]
+    chunk_vecs = torch.tensor(chunk_data["embeddings"], dtype=torch.float32).to(device)  # shape: (num_chunks, 1024)
+    chunks_normalized = False
+    print(f"✔ Loaded chunk embeddings from legacy {LEGACY_EMBED_PATH}")
 
-# Normalize chunk embeddings
-chunk_vecs = torch.nn.functional.normalize(chunk_vecs, p=2, dim=1)
+# Normalize chunk embeddings (stores written by embed_chunks.py are already L2-normalized)
+if not chunks_normalized:
+    chunk_vecs = torch.nn.functional.normalize(chunk_vecs, p=2, dim=1)
 
 # Load questions
 questions = json.loads(QUESTIONS_PATH.read_text(encoding="utf-8"))
+if not questions:
+    OUT_PATH.write_text("", encoding="utf-8")
+    print(f"⚠️ No questions found in {QUESTIONS_PATH}. Wrote an empty retrieval file to {OUT_PATH}.", file=sys.stderr)
+    sys.exit(0)
 
-# Output: one JSONL line per question
-with OUT_PATH.open("w", encoding="utf-8") as fout:
-    for q in tqdm(questions, desc="🔎 Retrieving"):
-        qid, question = q["qid"], q["question"]
-
-        # Tokenize and embed the question
-        encoded = tokenizer(question, return_tensors="pt", truncation=True, padding=True).to(device)
+def embed_questions(texts):
+    """Embeds question texts in batches and returns a (num_texts, hidden) NumPy array."""
+    q_vec_batches = []
+    for i in tqdm(range(0, len(texts), QUESTION_BATCH_SIZE), desc="🧠 Embedding questions"):
+        batch_texts = texts[i : i + QUESTION_BATCH_SIZE]
+        encoded = tokenizer(batch_texts, return_tensors="pt", truncation=True, max_length=MAX_LENGTH, padding=True).to(device)
         with torch.no_grad():
             output = model(**encoded)
             q_vec = mean_pooling(output, encoded["attention_mask"])
-            q_vec = torch.nn.functional.normalize(q_vec, p=2, dim=1)  # shape: (1, 1024)
+            q_vec_batches.append(torch.nn.functional.normalize(q_vec, p=2, dim=1).cpu())  # shape: (batch, 1024)
+    return torch.cat(q_vec_batches, dim=0).numpy()
+
+# Embed all questions, going through the model only for texts not in the shared cache
+embedding_cache = EmbeddingCache(MODEL_NAME, pooling="mean", max_length=MAX_LENGTH)
+q_vecs = torch.from_numpy(embedding_cache.embed([q["question"] for q in questions], embed_questions)).to(device)
+embedding_cache.report()
 
-        # Cosine similarity with all chunk vectors
-        scores = torch.matmul(q_vec, chunk_vecs.T).squeeze(0)  # shape: (num_chunks,)
-        topk = torch.topk(scores, k=TOP_K)
+# Cosine similarity of all questions against all chunk vectors, one query block at a time
+top_scores, top_indices = topk_blocked(q_vecs, chunk_vecs, k=TOP_K, block_size=args.query_block_size)
 
-        for rank, (score, idx) in enumerate(zip(topk.values.tolist(), topk.indices.tolist())):
-            record = {
-                "qid": qid,
-                "docid": chunk_docids[idx],
-                "chunk_id": chunk_ids[idx],
-                "rank": rank + 1,
-                "score": float(score)
-            }
-            fout.write(json.dumps(record) + "\n")
+# Output: one JSONL line per retrieved chunk, written in one pass
+lines = []
+for q, scores_row, indices_row in zip(questions, top_scores.tolist(), top_indices.tolist()):
+    for rank, (score, idx) in enumerate(zip(scores_row, indices_row)):
+        record = {
+            "qid": q["qid"],
+            "docid": str(chunk_docids[idx]),
+            "chunk_id": str(chunk_ids[idx]),
+            "rank": rank + 1,
+            "score": float(score)
+        }
+        lines.append(json.dumps(record) + "\n")
+OUT_PATH.write_text("".join(lines), encoding="utf-8")
 
 print(f"\n✔ Top-{TOP_K} retrievals saved to: {OUT_PATH}")
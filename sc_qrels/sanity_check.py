@@ -1,10 +1,11 @@
 # sc_qrels/sanity_check.py
 import json
 import pathlib
-import re
 import sys
 from collections import defaultdict
 
+from document_store import get_default_store
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Paths
 # ─────────────────────────────────────────────────────────────────────────────
@@ -30,14 +31,7 @@ except Exception as e:
 question_id_to_docid_map = {q["qid"]: q["docid"] for q in questions_sme1}
 all_question_ids = set(question_id_to_docid_map.keys())
 
-# ─────────────────────────────────────────────────────────────────────────────
-# Normalize function (must match generate_synthetic_queries.py)
-# ─────────────────────────────────────────────────────────────────────────────
-def normalize_text(text: str) -> str:
-    text = text.replace("’", "'").replace("‘", "'")
-    text = text.replace("”", '"').replace("“", '"') # CORRECTED LINE
-    text = text.replace("—", "-").replace("–", "-")
-    return re.sub(r"\s+", " ", text).strip()
+document_store = get_default_store(DOCS_DIR)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Function to Validate Annotations for a Single SME
@@ -77,19 +71,17 @@ def validate_sme_annotations(annotations_file_path: pathlib.Path, sme_id_str: st
 
         sme_qids_with_spans.add(qid) 
 
-        doc_path = DOCS_DIR / f"{docid_for_q}.json"
-        if not doc_path.exists():
+        # Normalized once per document in the shared store, not re-read per question
+        if docid_for_q not in document_store:
             if not any(v[0] == qid and v[2] == "DOC_NOT_FOUND" for v in sme_violations):
                  sme_violations.append((qid, docid_for_q, "DOC_NOT_FOUND"))
             continue 
 
         try:
-            doc = json.loads(doc_path.read_text(encoding="utf-8"))
-            orig_doc_text = doc.get("text", "")
-            if not orig_doc_text:
+            norm_doc_text = document_store.get(docid_for_q)
+            if not norm_doc_text:
                  sme_violations.append((qid, docid_for_q, "DOC_EMPTY_OR_NO_TEXT_FIELD"))
                  continue
-            norm_doc_text = normalize_text(orig_doc_text)
         except Exception as e:
             sme_violations.append((qid, docid_for_q, f"DOC_LOAD_OR_NORMALIZE_ERROR: {e}"))
             continue
@@ -1,10 +1,12 @@
 # sc_qrels/sanity_check_chunks.py
 import json
 import pathlib
-import re
 import sys
 import random
 
+from chunk_manifest import REQUIRED_FIELDS, discover_manifests, load_manifest
+from document_store import get_default_store
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Paths
 # ─────────────────────────────────────────────────────────────────────────────
@@ -21,48 +23,78 @@ CHECK_LAST_N_CHUNKS = 2
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-# Normalize function (MUST BE IDENTICAL to chunk_documents.py and others)
+# Normalized documents (shared document store, see document_store.py)
 # ─────────────────────────────────────────────────────────────────────────────
-# Cache for normalized document text to avoid re-reading and re-normalizing the same doc multiple times
-normalized_doc_cache_chunk_check: dict = {}
-
-def normalize_text_for_chunk_check(text: str) -> str:
-    text = text.replace('’', "'").replace('‘', "'")
-    text = text.replace('”', '"').replace('“', '"')
-    text = text.replace('—', '-').replace('–', '-')
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
-
 def get_normalized_doc_for_check(doc_id: str) -> str | None:
-    if doc_id in normalized_doc_cache_chunk_check:
-        return normalized_doc_cache_chunk_check[doc_id]
-
-    doc_path = DOCS_DIR / f"{doc_id}.json"
-    if not doc_path.exists():
-        print(f"    ERROR: Document file not found: {doc_path}", file=sys.stderr)
+    document_store = get_default_store(DOCS_DIR)
+    if doc_id not in document_store:
+        print(f"    ERROR: No document with docid {doc_id} in {DOCS_DIR}", file=sys.stderr)
         return None
     try:
-        with open(doc_path, "r", encoding="utf-8") as f:
-            doc_content = json.load(f)
-        original_text = doc_content.get("text")
-        if not original_text:
+        normalized_text = document_store.get(doc_id)
+        if not normalized_text:
             print(f"    ERROR: Document {doc_id} has no 'text' field or is empty.", file=sys.stderr)
             return None
-        
-        normalized_text = normalize_text_for_chunk_check(original_text)
-        normalized_doc_cache_chunk_check[doc_id] = normalized_text
         return normalized_text
     except Exception as e:
         print(f"    ERROR: Could not load or normalize document {doc_id}: {e}", file=sys.stderr)
         return None
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Line-by-line structure check (JSONL manifests)
+# ─────────────────────────────────────────────────────────────────────────────
+def read_manifest_lines(manifest_file_path: pathlib.Path) -> tuple[list[tuple[int, dict]], int]:
+    """Parses a JSONL manifest line by line, reporting every bad line and moving on.
+
+    load_manifest stops at the first malformed line and casts start/end with
+    int(), so "12" or 12.5 would pass; here a line with invalid JSON, missing
+    fields or non-integer offsets is reported with its line number and skipped.
+    Returns the (line number, record) pairs that passed and the number of bad lines.
+    """
+    numbered_records = []
+    bad_lines = 0
+    with open(manifest_file_path, "r", encoding="utf-8") as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                chunk = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"  ERROR: Line {line_num}: Invalid JSON ({e}).", file=sys.stderr)
+                bad_lines += 1
+                continue
+            if not isinstance(chunk, dict):
+                print(f"  ERROR: Line {line_num}: Expected a JSON object, got {type(chunk).__name__}.", file=sys.stderr)
+                bad_lines += 1
+                continue
+            missing_fields = [field for field in REQUIRED_FIELDS if field not in chunk]
+            if missing_fields:
+                print(f"  ERROR: Line {line_num}, Chunk ID {chunk.get('chunk_id', 'N/A')}: "
+                      f"Missing fields: {', '.join(missing_fields)}", file=sys.stderr)
+                bad_lines += 1
+                continue
+            # bool is a subclass of int, but true/false are not offsets
+            non_integer = [field for field in ("start", "end")
+                           if not isinstance(chunk[field], int) or isinstance(chunk[field], bool)]
+            if non_integer:
+                print(f"  ERROR: Line {line_num}, Chunk ID {chunk['chunk_id']}: Non-integer offsets: "
+                      + ", ".join(f"{field}={chunk[field]!r}" for field in non_integer), file=sys.stderr)
+                bad_lines += 1
+                continue
+            if "text" in chunk and not isinstance(chunk["text"], str):
+                print(f"  ERROR: Line {line_num}, Chunk ID {chunk['chunk_id']}: 'text' is not a string.", file=sys.stderr)
+                bad_lines += 1
+                continue
+            numbered_records.append((line_num, chunk))
+    return numbered_records, bad_lines
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Main Validation Logic
 # ─────────────────────────────────────────────────────────────────────────────
 def main():
     print("--- Starting Chunk Manifest Sanity Check ---")
     overall_violations = 0
-    manifest_files = sorted(CHUNK_MANIFESTS_DIR.glob("*.jsonl"))
+    manifest_files = discover_manifests(CHUNK_MANIFESTS_DIR)
 
     if not manifest_files:
         print(f"No chunk manifest files found in {CHUNK_MANIFESTS_DIR}. Exiting.", file=sys.stderr)
@@ -71,24 +103,26 @@ def main():
     for manifest_file_path in manifest_files:
         print(f"\n📄 Validating manifest: {manifest_file_path.name}")
         violations_in_current_file = 0
-        chunks_in_file = []
         try:
-            with open(manifest_file_path, "r", encoding="utf-8") as f:
-                for line_num, line in enumerate(f, 1):
-                    try:
-                        chunk = json.loads(line)
-                        chunks_in_file.append({"data": chunk, "line_num": line_num})
-                    except json.JSONDecodeError:
-                        print(f"  ERROR: Line {line_num}: Invalid JSON.", file=sys.stderr)
-                        violations_in_current_file += 1
+            if manifest_file_path.suffix == ".jsonl":
+                # Checked line by line, so every bad line is reported, not just the first
+                numbered_records, bad_lines = read_manifest_lines(manifest_file_path)
+                violations_in_current_file += bad_lines
+                get_numbered_chunk = numbered_records.__getitem__
+                num_chunks = len(numbered_records)
+                print(f"  Loaded {num_chunks} chunks from {manifest_file_path.name} ({bad_lines} bad lines).")
+            else:
+                # A .cols bundle is typed columns, so only the sampled records need decoding
+                manifest = load_manifest(manifest_file_path)
+                get_numbered_chunk = lambda i, manifest=manifest: (i + 1, manifest.record(i, include_text=manifest.has_text))
+                num_chunks = len(manifest)
+                print(f"  Loaded {num_chunks} chunks from {manifest_file_path.name}.")
         except Exception as e:
             print(f"  ERROR: Could not read or process file {manifest_file_path}: {e}", file=sys.stderr)
             overall_violations +=1 # Count as a major violation
             continue
         
-        print(f"  Loaded {len(chunks_in_file)} chunks from {manifest_file_path.name}.")
-        if not chunks_in_file:
-            continue
+        chunks_in_file = range(num_chunks)
 
         # --- Determine which chunks to sample for detailed text check ---
         chunks_to_check_indices = set()
@@ -107,66 +141,52 @@ def main():
         
         print(f"  Performing detailed text check on {len(chunks_to_check_indices)} sampled chunks...")
 
-        for chunk_idx, chunk_item in enumerate(chunks_in_file):
-            chunk = chunk_item["data"]
-            line_num = chunk_item["line_num"]
-            
-            # 1. Check for required fields
-            required_fields = ["original_doc_id", "chunk_id", "start", "end", "text"]
-            missing_fields = [field for field in required_fields if field not in chunk]
-            if missing_fields:
-                print(f"  ERROR: Line {line_num}, Chunk ID {chunk.get('chunk_id', 'N/A')}: Missing fields: {', '.join(missing_fields)}", file=sys.stderr)
-                violations_in_current_file += 1
-                continue # Skip further checks for this malformed chunk
-
+        # Only sampled chunks get the expensive document loading, normalization and text decoding
+        for chunk_idx in sorted(chunks_to_check_indices):
+            line_num, chunk = get_numbered_chunk(chunk_idx)
             doc_id = chunk["original_doc_id"]
             chunk_id = chunk["chunk_id"]
             start_offset = chunk["start"]
             end_offset = chunk["end"]
-            stored_chunk_text = chunk["text"]
-
-            # Only do the expensive document loading and normalization for sampled chunks
-            if chunk_idx in chunks_to_check_indices:
-                normalized_doc = get_normalized_doc_for_check(doc_id)
-                if normalized_doc is None: # Error already printed by get_normalized_doc_for_check
-                    violations_in_current_file += 1
-                    continue
-
-                # 2. Offset bounds check
-                if not (isinstance(start_offset, int) and isinstance(end_offset, int) and \
-                        0 <= start_offset <= end_offset <= len(normalized_doc)):
-                    print(f"  ERROR: Line {line_num}, Chunk ID {chunk_id}: Invalid offsets. "
-                          f"Start: {start_offset}, End: {end_offset}, DocLen: {len(normalized_doc)}", file=sys.stderr)
-                    violations_in_current_file += 1
-                    continue
-                
-                # 3. Reconstruct text from normalized document and compare
-                reconstructed_text = normalized_doc[start_offset:end_offset]
-                # The text stored in the chunk manifest should be exactly this slice,
-                # without extra stripping, as it represents the segment.
-                if reconstructed_text != stored_chunk_text:
-                    print(f"  ERROR: Line {line_num}, Chunk ID {chunk_id}: Text mismatch.", file=sys.stderr)
-                    print(f"    Stored     : '{stored_chunk_text[:100]}...' (len {len(stored_chunk_text)})", file=sys.stderr)
-                    print(f"    Reconstructed: '{reconstructed_text[:100]}...' (len {len(reconstructed_text)})", file=sys.stderr)
-                    # For very detailed debugging of a mismatch:
-                    # if violations_in_current_file < 3: # Limit extensive debug output
-                    #     for i in range(min(len(stored_chunk_text), len(reconstructed_text))):
-                    #         if stored_chunk_text[i] != reconstructed_text[i]:
-                    #             print(f"      First diff at char {i}: Stored='{stored_chunk_text[i]}' (ord {ord(stored_chunk_text[i])}), Recon='{reconstructed_text[i]}' (ord {ord(reconstructed_text[i])})")
-                    #             break
-                    #     if len(stored_chunk_text) != len(reconstructed_text):
-                    #         print(f"      Length difference is also an issue.")
-                    violations_in_current_file += 1
+            stored_chunk_text = chunk.get("text")
+
+            normalized_doc = get_normalized_doc_for_check(doc_id)
+            if normalized_doc is None: # Error already printed by get_normalized_doc_for_check
+                violations_in_current_file += 1
+                continue
+
+            # 1. Offset bounds check (fields and integer types were checked when reading)
+            if not (0 <= start_offset <= end_offset <= len(normalized_doc)):
+                print(f"  ERROR: Line {line_num}, Chunk ID {chunk_id}: Invalid offsets. "
+                      f"Start: {start_offset}, End: {end_offset}, DocLen: {len(normalized_doc)}", file=sys.stderr)
+                violations_in_current_file += 1
+                continue
+            
+            # 2. Reconstruct text from normalized document and compare
+            if stored_chunk_text is None:
+                continue # Offset-only manifest: the text *is* this slice, nothing stored to compare
+            reconstructed_text = normalized_doc[start_offset:end_offset]
+            # The text stored in the chunk manifest should be exactly this slice,
+            # without extra stripping, as it represents the segment.
+            if reconstructed_text != stored_chunk_text:
+                print(f"  ERROR: Line {line_num}, Chunk ID {chunk_id}: Text mismatch.", file=sys.stderr)
+                print(f"    Stored     : '{stored_chunk_text[:100]}...' (len {len(stored_chunk_text)})", file=sys.stderr)
+                print(f"    Reconstructed: '{reconstructed_text[:100]}...' (len {len(reconstructed_text)})", file=sys.stderr)
+                # For very detailed debugging of a mismatch:
+                # if violations_in_current_file < 3: # Limit extensive debug output
+                #     for i in range(min(len(stored_chunk_text), len(reconstructed_text))):
+                #         if stored_chunk_text[i] != reconstructed_text[i]:
+                #             print(f"      First diff at char {i}: Stored='{stored_chunk_text[i]}' (ord {ord(stored_chunk_text[i])}), Recon='{reconstructed_text[i]}' (ord {ord(reconstructed_text[i])})")
+                #             break
+                #     if len(stored_chunk_text) != len(reconstructed_text):
+                #         print(f"      Length difference is also an issue.")
+                violations_in_current_file += 1
 
         if violations_in_current_file == 0:
             print(f"  ✔ All checks passed for {manifest_file_path.name} (based on sampled chunks).")
         else:
             print(f"  ❌ Found {violations_in_current_file} issues in {manifest_file_path.name}.")
             overall_violations += violations_in_current_file
-        
-        # Clear cache for next manifest file if memory is a concern, 
-        # or keep it if docids often repeat across manifests (less likely for chunk manifests of different strategies)
-        # normalized_doc_cache_chunk_check.clear() 
 
 
     print("\n--- Chunk Manifest Sanity Check Finished ---")
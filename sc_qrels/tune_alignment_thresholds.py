@@ -6,6 +6,11 @@ import itertools # For cartesian product of thresholds
 import re # For normalization if needed again
 import numpy as np # For averaging
 import sys
+import time
+import argparse
+
+from align_spans_to_chunks import build_chunk_interval_index, iter_overlapping_chunks
+from chunk_manifest import iter_doc_groups
 
 # --- Configuration ---
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -16,6 +21,16 @@ ANNOTATIONS_DEV_FILE = PROCESSED_DATA_DIR / "annotations_merged_final.json" # Pa
 # Choose ONE chunk manifest for tuning
 CHUNK_MANIFEST_DEV_FILE = PROCESSED_DATA_DIR / "chunk_manifests" / "chunks_SENT.jsonl" # Example
 
+SME_THRESHOLD_GRID = [0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95]
+CHUNK_THRESHOLD_GRID = [0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.5]
+# Ranges used when a dense grid is requested with --grid_points
+DENSE_SME_THRESHOLD_RANGE = (0.5, 1.0)
+DENSE_CHUNK_THRESHOLD_RANGE = (0.05, 1.0)
+# Per-threshold-pair lines are only printed for grids up to this size
+MAX_GRID_POINTS_TO_PRINT = 100
+# Pareto frontier of (number of alignments, F_cover) written by --exact
+THRESHOLD_FRONTIER_OUTPUT_FILE = PROCESSED_DATA_DIR / "alignment_threshold_frontier.tsv"
+
 # --- Helper: Load and prepare dev data (spans and chunks for specific topics) ---
 # This part will require you to have a list of QIDs for your development set.
 # For simplicity, this example assumes ANNOTATIONS_DEV_FILE and CHUNK_MANIFEST_DEV_FILE 
@@ -31,14 +46,9 @@ def load_dev_spans(file_path):
                 spans_by_docid_qid[(ann["docid"], ann["qid"])].append(ann)
     return spans_by_docid_qid
 
-def load_dev_chunks(file_path):
-    chunks_by_docid = defaultdict(list)
-    with open(file_path, "r", encoding="utf-8") as f:
-        for line in f:
-            chunk = json.loads(line)
-            if chunk["start"] < chunk["end"]: # Valid chunk
-                chunks_by_docid[chunk["original_doc_id"]].append(chunk)
-    return chunks_by_docid
+def iter_dev_chunk_groups(file_path):
+    # Streams (docid, valid chunks) one document at a time; offsets and ids are all tuning needs
+    return iter_doc_groups(file_path, valid_only=True)
 
 # --- Calculate Overlap and Lengths (from align_spans_to_chunks.py) ---
 def calculate_overlap_and_lengths(
@@ -52,19 +62,210 @@ def calculate_overlap_and_lengths(
     l_overlap = float(max(0, overlap_end - overlap_start))
     return l_span, l_chunk, l_overlap
 
+# --- Overlap Pairs (computed once, shared by every grid point) ---
+def compute_overlap_coverages(dev_spans_map, dev_chunk_groups) -> tuple[np.ndarray, np.ndarray]:
+    """Computes coverage_sme and coverage_chunk for every overlapping span-chunk pair.
+
+    The pairs do not depend on the thresholds, so they are built once and every
+    grid point is then scored with vectorized masks over these two arrays.
+    dev_chunk_groups yields (docid, chunks) one document at a time, so only one
+    document's chunk index is alive at once.
+    """
+    spans_by_docid = defaultdict(list)
+    for (docid, qid), doc_qid_spans in dev_spans_map.items():
+        spans_by_docid[docid].extend(doc_qid_spans)
+
+    coverages_sme = []
+    coverages_chunk = []
+    for docid, doc_chunks in dev_chunk_groups:
+        if docid not in spans_by_docid or not doc_chunks:
+            continue
+        chunk_index = build_chunk_interval_index(doc_chunks)
+        for sme_span in spans_by_docid[docid]:
+            s_start, s_end = sme_span["start"], sme_span["end"]
+            for chunk in iter_overlapping_chunks(chunk_index, s_start, s_end):
+                l_span, l_chunk, l_overlap = calculate_overlap_and_lengths(
+                    s_start, s_end, chunk["start"], chunk["end"]
+                )
+                if l_span == 0 or l_chunk == 0 or l_overlap == 0:
+                    continue
+                coverages_sme.append(l_overlap / l_span)
+                coverages_chunk.append(l_overlap / l_chunk)
+    return np.asarray(coverages_sme, dtype=np.float64), np.asarray(coverages_chunk, dtype=np.float64)
+
+def score_threshold_grid(coverage_sme: np.ndarray, coverage_chunk: np.ndarray,
+                         sme_grid: np.ndarray, chunk_grid: np.ndarray):
+    """Scores every (SME, chunk) threshold pair at once.
+
+    Returns (num_alignments, avg_sme_cov, avg_chunk_cov, f_cover_overall), each
+    shaped (len(sme_grid), len(chunk_grid)). Pair counts and coverage sums are
+    products of the per-axis threshold masks, so the whole grid costs three
+    matrix multiplications over the overlap pairs.
+    """
+    mask_sme = (coverage_sme[None, :] >= sme_grid[:, None]).astype(np.float64)       # (S, n)
+    mask_chunk = (coverage_chunk[None, :] >= chunk_grid[:, None]).astype(np.float64) # (C, n)
+
+    num_alignments = mask_sme @ mask_chunk.T
+    sum_sme_cov = (mask_sme * coverage_sme) @ mask_chunk.T
+    sum_chunk_cov = mask_sme @ (mask_chunk * coverage_chunk).T
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_sme_cov = np.where(num_alignments > 0, sum_sme_cov / num_alignments, 0.0)
+        avg_chunk_cov = np.where(num_alignments > 0, sum_chunk_cov / num_alignments, 0.0)
+        denom = avg_sme_cov + avg_chunk_cov
+        f_cover_overall = np.where(denom > 0, 2 * avg_sme_cov * avg_chunk_cov / denom, 0.0)
+    return num_alignments.astype(np.int64), avg_sme_cov, avg_chunk_cov, f_cover_overall
+
+# --- Exact Search over All Distinct Coverage Values ---
+def find_exact_threshold_frontier(coverage_sme: np.ndarray, coverage_chunk: np.ndarray) -> dict:
+    """Finds the exact F_cover_overall optimum and the (num alignments, F_cover) Pareto frontier.
+
+    Only thresholds equal to an observed coverage value can change which pairs
+    align, so every distinct (coverage_sme, coverage_chunk) threshold pair is
+    evaluated. Pairs are sorted once by descending coverage_chunk; for each
+    distinct SME threshold, cumulative sums over that order give the count and
+    coverage sums for every chunk threshold in one vectorized pass.
+
+    Returns a dict with the best thresholds and their scores under the same
+    tie-breaking as the grid search (higher F_cover, then more alignments),
+    plus a "frontier" list of non-dominated points sorted by alignment count.
+    """
+    n = len(coverage_sme)
+    order = np.argsort(-coverage_chunk, kind="stable")
+    cov_sme_sorted = coverage_sme[order]
+    cov_chunk_sorted = coverage_chunk[order]
+    # Last position of each run of equal coverage_chunk values = one distinct chunk threshold
+    group_ends = np.flatnonzero(np.r_[cov_chunk_sorted[1:] != cov_chunk_sorted[:-1], True])
+    chunk_thresholds = cov_chunk_sorted[group_ends]
+
+    # Best point seen for each possible alignment count (index = count)
+    best_f_by_count = np.full(n + 1, -1.0)
+    best_sme_thr_by_count = np.zeros(n + 1)
+    best_chunk_thr_by_count = np.zeros(n + 1)
+    best_avg_sme_by_count = np.zeros(n + 1)
+    best_avg_chunk_by_count = np.zeros(n + 1)
+
+    for thresh_sme in np.unique(coverage_sme):
+        mask = cov_sme_sorted >= thresh_sme
+        counts = np.cumsum(mask)[group_ends]
+        sum_sme = np.cumsum(np.where(mask, cov_sme_sorted, 0.0))[group_ends]
+        sum_chunk = np.cumsum(np.where(mask, cov_chunk_sorted, 0.0))[group_ends]
+
+        valid = counts > 0
+        counts, sum_sme, sum_chunk, thresholds = counts[valid], sum_sme[valid], sum_chunk[valid], chunk_thresholds[valid]
+        avg_sme = sum_sme / counts
+        avg_chunk = sum_chunk / counts
+        denom = avg_sme + avg_chunk
+        with np.errstate(divide="ignore", invalid="ignore"):
+            f_cover = np.where(denom > 0, 2 * avg_sme * avg_chunk / denom, 0.0)
+
+        # Repeated counts within a row select the same pairs, so any one of them will do
+        improved = f_cover > best_f_by_count[counts]
+        idx = counts[improved]
+        best_f_by_count[idx] = f_cover[improved]
+        best_sme_thr_by_count[idx] = thresh_sme
+        best_chunk_thr_by_count[idx] = thresholds[improved]
+        best_avg_sme_by_count[idx] = avg_sme[improved]
+        best_avg_chunk_by_count[idx] = avg_chunk[improved]
+
+    def point(count: int) -> dict:
+        return {
+            "num_alignments": int(count),
+            "f_cover_overall": float(best_f_by_count[count]),
+            "sme_threshold": float(best_sme_thr_by_count[count]),
+            "chunk_threshold": float(best_chunk_thr_by_count[count]),
+            "avg_sme_cov": float(best_avg_sme_by_count[count]),
+            "avg_chunk_cov": float(best_avg_chunk_by_count[count]),
+        }
+
+    # Walk counts from largest to smallest: a point is on the frontier if no
+    # larger alignment count reaches an F_cover at least as high.
+    frontier = []
+    running_best_f = -1.0
+    for count in range(n, 0, -1):
+        if best_f_by_count[count] > running_best_f:
+            running_best_f = best_f_by_count[count]
+            frontier.append(point(count))
+    frontier.reverse()
+
+    best = frontier[0] if frontier else None # Highest F_cover; ties already resolved toward more alignments
+    return {"best": best, "frontier": frontier}
+
+def run_exact_search():
+    print(f"Loading development spans from: {ANNOTATIONS_DEV_FILE}")
+    dev_spans_map = load_dev_spans(ANNOTATIONS_DEV_FILE)
+    print(f"Streaming development chunks from: {CHUNK_MANIFEST_DEV_FILE}")
+
+    if not dev_spans_map or not CHUNK_MANIFEST_DEV_FILE.exists():
+        print("Error: Could not load development data. Exiting.", file=sys.stderr)
+        return
+
+    coverage_sme, coverage_chunk = compute_overlap_coverages(dev_spans_map, iter_dev_chunk_groups(CHUNK_MANIFEST_DEV_FILE))
+    print(f"Computed {len(coverage_sme)} overlapping span-chunk pairs "
+          f"({len(np.unique(coverage_sme))} distinct SME coverages x {len(np.unique(coverage_chunk))} distinct chunk coverages).")
+
+    t0 = time.perf_counter()
+    result = find_exact_threshold_frontier(coverage_sme, coverage_chunk)
+    t_exact = time.perf_counter() - t0
+    print(f"Exact search finished in {t_exact:.3f}s.")
+
+    frontier = result["frontier"]
+    print(f"\n--- Pareto Frontier (NumAlignments vs F_cover_overall, {len(frontier)} points) ---")
+    for p in frontier:
+        print(f"  NumAlignments={p['num_alignments']:>5}, F_cover_overall={p['f_cover_overall']:.4f} "
+              f"<- Thresh_SME={p['sme_threshold']:.4f}, Thresh_Chunk={p['chunk_threshold']:.4f}")
+
+    if frontier:
+        with open(THRESHOLD_FRONTIER_OUTPUT_FILE, "w", encoding="utf-8") as f:
+            f.write("num_alignments\tf_cover_overall\tsme_threshold\tchunk_threshold\tavg_sme_cov\tavg_chunk_cov\n")
+            for p in frontier:
+                f.write(f"{p['num_alignments']}\t{p['f_cover_overall']:.6f}\t{p['sme_threshold']:.6f}\t"
+                        f"{p['chunk_threshold']:.6f}\t{p['avg_sme_cov']:.6f}\t{p['avg_chunk_cov']:.6f}\n")
+        print(f"✔ Saved frontier to: {THRESHOLD_FRONTIER_OUTPUT_FILE}")
+
+    best = result["best"]
+    print("\n--- Exact Search Finished ---")
+    if best is not None:
+        print(f"Best Thresholds Found:")
+        print(f"  SME Coverage Threshold : {best['sme_threshold']:.4f}")
+        print(f"  Chunk Coverage Threshold: {best['chunk_threshold']:.4f}")
+        print(f"  Resulting F_cover_overall: {best['f_cover_overall']:.4f}")
+        print(f"  With Avg Actual SME Coverage : {best['avg_sme_cov']:.4f}")
+        print(f"  With Avg Actual Chunk Coverage: {best['avg_chunk_cov']:.4f}")
+        print(f"  Number of Aligned Span-Chunk Pairs: {best['num_alignments']}")
+    else:
+        print("No suitable thresholds found (no alignments made).")
+
 # --- Main Grid Search Logic ---
-def find_best_thresholds():
+def find_best_thresholds(grid_points: int | None = None):
     print(f"Loading development spans from: {ANNOTATIONS_DEV_FILE}")
     dev_spans_map = load_dev_spans(ANNOTATIONS_DEV_FILE)
-    print(f"Loading development chunks from: {CHUNK_MANIFEST_DEV_FILE}")
-    dev_chunks_map = load_dev_chunks(CHUNK_MANIFEST_DEV_FILE)
+    print(f"Streaming development chunks from: {CHUNK_MANIFEST_DEV_FILE}")
 
-    if not dev_spans_map or not dev_chunks_map:
+    if not dev_spans_map or not CHUNK_MANIFEST_DEV_FILE.exists():
         print("Error: Could not load development data. Exiting.", file=sys.stderr)
         return
 
-    sme_threshold_grid = [0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95]
-    chunk_threshold_grid = [0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.5]
+    if grid_points:
+        sme_threshold_grid = np.linspace(*DENSE_SME_THRESHOLD_RANGE, grid_points)
+        chunk_threshold_grid = np.linspace(*DENSE_CHUNK_THRESHOLD_RANGE, grid_points)
+    else:
+        sme_threshold_grid = np.asarray(SME_THRESHOLD_GRID, dtype=np.float64)
+        chunk_threshold_grid = np.asarray(CHUNK_THRESHOLD_GRID, dtype=np.float64)
+
+    t0 = time.perf_counter()
+    coverage_sme, coverage_chunk = compute_overlap_coverages(dev_spans_map, iter_dev_chunk_groups(CHUNK_MANIFEST_DEV_FILE))
+    t_pairs = time.perf_counter() - t0
+    print(f"Computed {len(coverage_sme)} overlapping span-chunk pairs in {t_pairs:.3f}s.")
+
+    num_combinations = len(sme_threshold_grid) * len(chunk_threshold_grid)
+    print(f"\nStarting grid search over {num_combinations} threshold combinations...")
+
+    t0 = time.perf_counter()
+    num_grid, avg_sme_grid, avg_chunk_grid, f_cover_grid = score_threshold_grid(
+        coverage_sme, coverage_chunk, sme_threshold_grid, chunk_threshold_grid
+    )
+    t_grid = time.perf_counter() - t0
 
     best_f_cover_overall = -1.0
     best_thresholds = (None, None)
@@ -72,73 +273,36 @@ def find_best_thresholds():
     best_avg_chunk_cov = 0
     best_num_alignments = 0
 
-    print(f"\nStarting grid search over {len(sme_threshold_grid) * len(chunk_threshold_grid)} threshold combinations...")
+    print_each_point = num_combinations <= MAX_GRID_POINTS_TO_PRINT
+    for i, thresh_sme in enumerate(sme_threshold_grid):
+        for j, thresh_chunk in enumerate(chunk_threshold_grid):
+            num_aligned_pairs = int(num_grid[i, j])
+            avg_sme_cov = float(avg_sme_grid[i, j])
+            avg_chunk_cov = float(avg_chunk_grid[i, j])
+            f_cover_overall = float(f_cover_grid[i, j])
 
-    for thresh_sme in sme_threshold_grid:
-        for thresh_chunk in chunk_threshold_grid:
-            
-            current_alignments_sme_coverages = []
-            current_alignments_chunk_coverages = []
-            num_aligned_pairs = 0
-
-            for (docid, qid), doc_qid_spans in dev_spans_map.items():
-                if docid not in dev_chunks_map:
-                    continue
-                
-                doc_strategy_chunks = dev_chunks_map[docid]
-
-                for sme_span in doc_qid_spans:
-                    s_start, s_end = sme_span["start"], sme_span["end"]
-                    for chunk in doc_strategy_chunks:
-                        c_start, c_end = chunk["start"], chunk["end"]
-
-                        l_span, l_chunk, l_overlap = calculate_overlap_and_lengths(
-                            s_start, s_end, c_start, c_end
-                        )
-
-                        if l_span == 0 or l_chunk == 0 or l_overlap == 0:
-                            continue
-
-                        coverage_sme_actual = l_overlap / l_span
-                        coverage_chunk_actual = l_overlap / l_chunk
-
-                        if coverage_sme_actual >= thresh_sme and coverage_chunk_actual >= thresh_chunk:
-                            # This pair aligns with the current thresholds
-                            num_aligned_pairs += 1
-                            current_alignments_sme_coverages.append(coverage_sme_actual)
-                            current_alignments_chunk_coverages.append(coverage_chunk_actual)
-            
-            if not current_alignments_sme_coverages: # No alignments for this threshold pair
-                avg_sme_cov = 0
-                avg_chunk_cov = 0
-                f_cover_overall = 0.0
-            else:
-                avg_sme_cov = np.mean(current_alignments_sme_coverages)
-                avg_chunk_cov = np.mean(current_alignments_chunk_coverages)
-                
-                if (avg_sme_cov + avg_chunk_cov) == 0:
-                    f_cover_overall = 0.0
-                else:
-                    f_cover_overall = 2 * (avg_sme_cov * avg_chunk_cov) / (avg_sme_cov + avg_chunk_cov)
-
-            print(f"  Thresh_SME={thresh_sme:.2f}, Thresh_Chunk={thresh_chunk:.2f} -> "
-                  f"NumAlignments={num_aligned_pairs}, AvgSMEcov={avg_sme_cov:.4f}, "
-                  f"AvgChunkCov={avg_chunk_cov:.4f}, F_cover_overall={f_cover_overall:.4f}")
+            if print_each_point:
+                print(f"  Thresh_SME={thresh_sme:.2f}, Thresh_Chunk={thresh_chunk:.2f} -> "
+                      f"NumAlignments={num_aligned_pairs}, AvgSMEcov={avg_sme_cov:.4f}, "
+                      f"AvgChunkCov={avg_chunk_cov:.4f}, F_cover_overall={f_cover_overall:.4f}")
 
             if f_cover_overall > best_f_cover_overall:
                 best_f_cover_overall = f_cover_overall
-                best_thresholds = (thresh_sme, thresh_chunk)
+                best_thresholds = (float(thresh_sme), float(thresh_chunk))
                 best_avg_sme_cov = avg_sme_cov
                 best_avg_chunk_cov = avg_chunk_cov
                 best_num_alignments = num_aligned_pairs
             # Tie-breaking: if F_cover is similar, prefer more alignments or a better balance
             elif f_cover_overall == best_f_cover_overall:
                 if num_aligned_pairs > best_num_alignments : # Prefer more alignments if F_cover is same
-                     best_thresholds = (thresh_sme, thresh_chunk)
+                     best_thresholds = (float(thresh_sme), float(thresh_chunk))
                      best_avg_sme_cov = avg_sme_cov
                      best_avg_chunk_cov = avg_chunk_cov
                      best_num_alignments = num_aligned_pairs
 
+    if not print_each_point:
+        print(f"  (Per-pair results omitted for grids larger than {MAX_GRID_POINTS_TO_PRINT} points.)")
+    print(f"  Scored {num_combinations} threshold combinations in {t_grid:.3f}s.")
 
     print("\n--- Grid Search Finished ---")
     if best_thresholds[0] is not None:
@@ -153,4 +317,20 @@ def find_best_thresholds():
         print("No suitable thresholds found (no alignments made).")
 
 if __name__ == "__main__":
-    find_best_thresholds()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Grid-search the SME/chunk coverage thresholds used for span-to-chunk alignment.")
+    parser.add_argument(
+        "--grid_points",
+        type=int,
+        default=None,
+        help=f"Use a dense N x N grid over SME thresholds {DENSE_SME_THRESHOLD_RANGE} and chunk thresholds {DENSE_CHUNK_THRESHOLD_RANGE} instead of the default 7 x 8 grid."
+    )
+    parser.add_argument(
+        "--exact",
+        action="store_true",
+        help="Search every distinct observed coverage value instead of a grid and report the (num alignments, F_cover) Pareto frontier."
+    )
+    args = parser.parse_args()
+    if args.exact:
+        run_exact_search()
+    else:
+        find_best_thresholds(grid_points=args.grid_points)
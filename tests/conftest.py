@@ -0,0 +1,22 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The scripts in sc_qrels/ import each other as top-level modules (``from utils import ...``)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "sc_qrels"))
+
+
+@pytest.fixture
+def isolated_generator(monkeypatch, tmp_path):
+    """generate_synthetic_queries with no response cache, outputs and documents under tmp_path, and its globals restored afterwards."""
+    import generate_synthetic_queries as gsq
+
+    monkeypatch.setattr(gsq, "CHAPTER_DIR", tmp_path / "documents")
+    monkeypatch.setattr(gsq, "QUESTIONS_SME1_PATH", tmp_path / "questions_sme1.json")
+    monkeypatch.setattr(gsq, "llm_response_cache", None)
+    monkeypatch.setattr(gsq, "llm_engine", None)
+    monkeypatch.setattr(gsq, "client_openai", None)
+    monkeypatch.setattr(gsq, "client_gemini_legacy", None)
+    monkeypatch.setattr(gsq, "llm_cache_providers", dict(gsq.llm_cache_providers))
+    return gsq
@@ -0,0 +1,79 @@
+import random
+from collections import Counter
+
+import pytest
+
+from align_spans_to_chunks import (
+    align_doc_spans,
+    align_doc_spans_bruteforce,
+    build_chunk_interval_index,
+    iter_overlapping_chunks,
+)
+
+
+def make_random_doc(rng: random.Random, num_chunks: int, num_spans: int):
+    """Overlapping chunks of widely varied length, plus spans snapped to chunk boundaries."""
+    chunks = []
+    pos = 0
+    for i in range(num_chunks):
+        length = rng.choice([1, rng.randint(2, 40), rng.randint(40, 400), rng.randint(400, 3000)])
+        chunks.append({"chunk_id": f"C{i:05d}", "start": pos, "end": pos + length})
+        pos += rng.randint(0, length)  # 0 gives chunks sharing a start offset
+    doc_len = max(c["end"] for c in chunks)
+    boundaries = sorted({c["start"] for c in chunks} | {c["end"] for c in chunks})
+
+    spans = []
+    for i in range(num_spans):
+        kind = rng.randrange(4)
+        if kind == 0:  # both ends on chunk boundaries (including exactly one chunk)
+            start, end = sorted(rng.sample(boundaries, 2))
+        elif kind == 1:  # starts on a boundary
+            start = rng.choice(boundaries)
+            end = start + rng.randint(0, 500)
+        elif kind == 2:  # ends on a boundary
+            end = rng.choice(boundaries)
+            start = max(0, end - rng.randint(0, 500))
+        else:
+            start = rng.randint(0, doc_len)
+            end = start + rng.randint(0, 3000)
+        spans.append({"qid": f"q_{i:05d}", "start": start, "end": end})
+    return spans, chunks
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_indexed_alignment_matches_bruteforce(seed):
+    rng = random.Random(seed)
+    spans, chunks = make_random_doc(rng, num_chunks=rng.randint(1, 300), num_spans=200)
+    rng.shuffle(chunks)  # The index must not rely on manifest order
+
+    assert Counter(align_doc_spans(spans, chunks)) == Counter(align_doc_spans_bruteforce(spans, chunks))
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_interval_index_yields_exactly_the_overlapping_chunks(seed):
+    # Checked before the coverage thresholds, which would hide most missed chunks
+    rng = random.Random(seed)
+    spans, chunks = make_random_doc(rng, num_chunks=rng.randint(1, 300), num_spans=200)
+    chunk_index = build_chunk_interval_index(chunks)
+
+    for span in spans:
+        expected = {c["chunk_id"] for c in chunks if c["start"] < span["end"] and c["end"] > span["start"]}
+        found = [c["chunk_id"] for c in iter_overlapping_chunks(chunk_index, span["start"], span["end"])]
+        assert len(found) == len(set(found))
+        assert set(found) == expected
+
+
+def test_long_chunk_starting_far_left_of_span_is_found():
+    # Only the max-chunk-length bound of the bisect makes the first chunk reachable
+    chunks = [
+        {"chunk_id": "long", "start": 0, "end": 1000},
+        *({"chunk_id": f"short{i}", "start": 900 + i * 10, "end": 910 + i * 10} for i in range(10)),
+    ]
+    found = {c["chunk_id"] for c in iter_overlapping_chunks(build_chunk_interval_index(chunks), 990, 1000)}
+
+    assert found == {"long", "short9"}
+
+
+def test_empty_inputs():
+    assert align_doc_spans([], [{"chunk_id": "c", "start": 0, "end": 10}]) == []
+    assert align_doc_spans([{"qid": "q", "start": 0, "end": 10}], []) == []
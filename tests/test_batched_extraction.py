@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+import pytest
+
+import generate_synthetic_queries as gsq
+from mock_llm_server import MockLLMServer
+
+SENTENCES = [
+    "Alice was beginning to get very tired of sitting by her sister on the bank.",
+    "Once or twice she had peeped into the book her sister was reading.",
+    "So she was considering in her own mind what to do next.",
+    "Suddenly a White Rabbit with pink eyes ran close by her.",
+    "There was nothing so very remarkable in that, she thought.",
+    "The rabbit-hole went straight on like a tunnel for some way.",
+    "Down, down, down, would the fall never come to an end?",
+    "She found herself in a long, low hall lit by a row of lamps.",
+]
+QUESTIONS_PER_CHAPTER = 6
+
+pytestmark = pytest.mark.usefixtures("isolated_generator")
+
+
+@pytest.fixture
+def chapters_and_questions():
+    chapters = [
+        {"docid": f"alice:ch{n:02d}", "title": f"Chapter {n}", "text": " ".join(SENTENCES[n:] + SENTENCES[:n])}
+        for n in (1, 2)
+    ]
+    questions = [
+        {"qid": f"q_{chap['docid'][-2:]}{i}", "question": f"Question {i} about {chap['title']}?",
+         "docid": chap["docid"], "group": "g1"}
+        for chap in chapters for i in range(QUESTIONS_PER_CHAPTER)
+    ]
+    return chapters, questions
+
+
+def run_both_modes(server, chapters, questions, output_dir):
+    async def run():
+        gsq.init_llm_clients(server.openai_base_url, server.gemini_base_url)
+        try:
+            return {
+                batched: await gsq.run_extraction_pass(
+                    chapters, questions, output_dir / f"annotations_{batched}.json", batched, concurrency=4)
+                for batched in (False, True)
+            }
+        finally:
+            await gsq.client_openai.close()
+    return asyncio.run(run())
+
+
+def test_batched_extraction_matches_per_question_requests(tmp_path, chapters_and_questions):
+    chapters, questions = chapters_and_questions
+    with MockLLMServer() as server:
+        stats = run_both_modes(server, chapters, questions, tmp_path)
+
+    assert stats[False]["requests"] == len(questions)
+    assert stats[True]["requests"] == len(chapters)
+    assert stats[True]["prompt_tokens"] < stats[False]["prompt_tokens"] / 2
+    assert stats[True]["spans"] == stats[False]["spans"] == len(questions)
+    assert (tmp_path / "annotations_True.json").read_bytes() == (tmp_path / "annotations_False.json").read_bytes()
+
+
+def test_questions_omitted_from_batched_answers_are_asked_singly(tmp_path, chapters_and_questions, capsys):
+    chapters, questions = chapters_and_questions
+    # Positions 3 and 6 of each chapter's batch are left out of the batched answer
+    with MockLLMServer(batch_omit_every=3) as server:
+        stats = run_both_modes(server, chapters, questions, tmp_path)
+        assert server.httpd.request_count == len(questions) + len(chapters) * 3
+
+    assert stats[True]["requests"] == len(chapters) * (1 + 2)
+    assert capsys.readouterr().err.count("2 of 6 questions") == len(chapters)
+    assert stats[True]["spans"] == len(questions)
+    batched = json.loads((tmp_path / "annotations_True.json").read_text(encoding="utf-8"))
+    assert [span["qid"] for span in batched] == [q["qid"] for q in questions]
+    assert (tmp_path / "annotations_True.json").read_bytes() == (tmp_path / "annotations_False.json").read_bytes()
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+from nltk.tokenize.punkt import PunktSentenceTokenizer
+
+import chunk_documents
+from chunk_documents import (
+    PreparedDocument,
+    check_sentence_parity,
+    chunk_strategy_sentences,
+    chunk_strategy_sentences_by_search,
+)
+
+DOC_ID = "alice:ch01"
+TEXT = (
+    "Alice was beginning to get very tired of sitting by her sister on the bank. "
+    "Once or twice she had peeped into the book her sister was reading! "
+    "\"And what is the use of a book,\" thought Alice, \"without pictures or conversations?\" "
+    "So she was considering in her own mind what to do. "
+    "Down, down, down. Would the fall never come to an end?"
+)
+
+
+@pytest.fixture(autouse=True)
+def untrained_punkt(monkeypatch):
+    """Punkt with default parameters: the same algorithm, no downloaded model needed."""
+    monkeypatch.setattr(chunk_documents, "_sentence_tokenizer", PunktSentenceTokenizer())
+
+
+def write_manifest(path, records):
+    path.write_text("".join(json.dumps(r) + "\n" for r in records), encoding="utf-8")
+
+
+def test_span_tokenize_offsets_match_search_locator():
+    doc = PreparedDocument(DOC_ID, TEXT)
+    chunks = chunk_strategy_sentences(doc)
+
+    assert len(chunks) == 6
+    assert chunks == chunk_strategy_sentences_by_search(doc)
+    for chunk in chunks:
+        assert chunk["text"] == TEXT[chunk["start"]:chunk["end"]]
+
+
+def test_sentence_chunks_keep_sentence_numbering_past_repeats():
+    text = "The Queen said no. The Queen said no. Then she left."
+    chunks = chunk_strategy_sentences(PreparedDocument(DOC_ID, text))
+
+    assert [(c["chunk_id"], c["start"], c["end"]) for c in chunks] == [
+        (f"SENT-{DOC_ID}-0000", 0, 18),
+        (f"SENT-{DOC_ID}-0001", 19, 37),
+        (f"SENT-{DOC_ID}-0002", 38, 52),
+    ]
+
+
+@pytest.fixture
+def docs_dir(tmp_path):
+    docs_dir = tmp_path / "documents"
+    docs_dir.mkdir()
+    doc = {"docid": DOC_ID, "title": "Down the Rabbit-Hole", "text": TEXT}
+    (docs_dir / f"{DOC_ID}.json").write_text(json.dumps(doc), encoding="utf-8")
+    return docs_dir
+
+
+def test_parity_check_accepts_offset_only_manifest(tmp_path, docs_dir):
+    records = chunk_strategy_sentences(PreparedDocument(DOC_ID, TEXT))
+    manifest_path = tmp_path / "chunks_SENT.jsonl"
+    write_manifest(manifest_path, [{k: v for k, v in r.items() if k != "text"} for r in records])
+
+    assert check_sentence_parity(manifest_path, docs_dir)
+
+
+def test_parity_check_compares_offsets_not_text(tmp_path, docs_dir):
+    records = chunk_strategy_sentences(PreparedDocument(DOC_ID, TEXT))
+    manifest_path = tmp_path / "chunks_SENT.jsonl"
+
+    write_manifest(manifest_path, [{**r, "text": r["text"].upper()} for r in records])
+    assert check_sentence_parity(manifest_path, docs_dir)
+
+    records[2]["end"] += 1
+    write_manifest(manifest_path, records)
+    assert not check_sentence_parity(manifest_path, docs_dir)
+
+    write_manifest(manifest_path, records[:-1])
+    assert not check_sentence_parity(manifest_path, docs_dir)
+
+
+def test_parity_check_reports_missing_manifest(tmp_path, docs_dir):
+    assert not check_sentence_parity(tmp_path / "chunks_SENT.jsonl", docs_dir)
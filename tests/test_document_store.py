@@ -0,0 +1,62 @@
+import json
+import os
+
+import pytest
+
+from document_store import NormalizedDocumentStore
+
+
+def write_doc(docs_dir, file_name, **content):
+    (docs_dir / file_name).write_text(json.dumps(content), encoding="utf-8")
+
+
+@pytest.fixture
+def docs_dir(tmp_path):
+    docs_dir = tmp_path / "documents"
+    docs_dir.mkdir()
+    return docs_dir
+
+
+def test_documents_are_keyed_by_json_docid_not_file_name(docs_dir):
+    write_doc(docs_dir, "chapter-one.json", docid="alice:ch01", text="Down the Rabbit-Hole")
+    store = NormalizedDocumentStore(docs_dir)
+
+    assert store.doc_ids() == ["alice:ch01"]
+    assert store.doc_id_for_source("chapter-one.json") == "alice:ch01"
+    assert store.get("alice:ch01") == "Down the Rabbit-Hole"
+    with pytest.raises(KeyError):
+        store.get("chapter-one")
+
+    # Reopened with unchanged stamps, the index keeps the mapping
+    reopened = NormalizedDocumentStore(docs_dir)
+    assert not reopened.refresh()
+    assert reopened.doc_id_for_source("chapter-one.json") == "alice:ch01"
+
+
+def test_changed_docid_is_picked_up(docs_dir):
+    write_doc(docs_dir, "alice:ch01.json", docid="alice:ch01", text="Down the Rabbit-Hole")
+    store = NormalizedDocumentStore(docs_dir)
+    store.refresh()
+
+    write_doc(docs_dir, "alice:ch01.json", docid="alice:ch02", text="The Pool of Tears")
+    os.utime(docs_dir / "alice:ch01.json", ns=(0, 0))
+    assert store.refresh()
+    assert store.doc_ids() == ["alice:ch02"]
+    assert store.get("alice:ch02") == "The Pool of Tears"
+
+
+def test_missing_docid_is_an_error_entry(docs_dir):
+    write_doc(docs_dir, "alice:ch01.json", text="Down the Rabbit-Hole")
+    store = NormalizedDocumentStore(docs_dir)
+
+    assert store.doc_id_for_source("alice:ch01.json") == "alice:ch01"
+    with pytest.raises(ValueError, match="missing 'docid'"):
+        store.get("alice:ch01")
+
+
+def test_duplicate_docid_fails_loudly(docs_dir):
+    write_doc(docs_dir, "alice:ch01.json", docid="alice:ch01", text="Down the Rabbit-Hole")
+    write_doc(docs_dir, "copy.json", docid="alice:ch01", text="Down the Rabbit-Hole")
+
+    with pytest.raises(ValueError, match="both have docid 'alice:ch01'"):
+        NormalizedDocumentStore(docs_dir).refresh()
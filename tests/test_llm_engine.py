@@ -0,0 +1,123 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from openai import AsyncOpenAI
+
+from llm_engine import LLMEngine, TokenBucket, _run_echo_requests
+from mock_llm_server import MockLLMServer
+
+
+def expected_echoes(num_requests):
+    return [f'{{"echo": "echo:{i}"}}' for i in range(num_requests)]
+
+
+def run_echo_requests(server, engine, num_requests):
+    """Sends echo requests through the engine; returns (results, elapsed seconds)."""
+    async def run():
+        client = AsyncOpenAI(base_url=server.openai_base_url, api_key="mock", max_retries=0)
+        t0 = time.perf_counter()
+        results = await _run_echo_requests(engine, client, num_requests)
+        elapsed = time.perf_counter() - t0
+        await client.close()
+        return results, elapsed
+    return asyncio.run(run())
+
+
+def http_error(status):
+    return SimpleNamespace(status_code=status, response=SimpleNamespace(headers={}))
+
+
+def test_map_returns_results_in_input_order():
+    # Later items finish first
+    async def delayed(i):
+        await asyncio.sleep((10 - i) * 0.01)
+        return i
+
+    assert asyncio.run(LLMEngine().map(delayed, range(10))) == list(range(10))
+
+
+def test_concurrent_requests_keep_input_order_under_faults():
+    with MockLLMServer(latency=0.02, rate_limit_every=5, error_rate=0.2, retry_after=0.01, seed=1) as server:
+        engine = LLMEngine(concurrency=8, backoff_base=0.01, backoff_max=0.05)
+        results, _ = run_echo_requests(server, engine, 30)
+
+    assert results == expected_echoes(30)
+    assert engine.stats["openai"]["retries"] == server.httpd.fault_count > 0
+
+
+def test_429_is_retried_after_retry_after():
+    # A Retry-After of 0.3s must win over the 5s exponential backoff
+    with MockLLMServer(rate_limit_every=2, retry_after=0.3) as server:
+        engine = LLMEngine(concurrency=1, backoff_base=5.0, backoff_max=10.0)
+        results, elapsed = run_echo_requests(server, engine, 2)
+
+    assert results == expected_echoes(2)
+    stats = engine.stats["openai"]
+    assert (stats["requests"], stats["retries"], stats["rate_limited"], stats["failed"]) == (3, 1, 1, 0)
+    assert 0.3 <= elapsed < 2.0
+
+
+def test_503_is_retried_with_backoff():
+    with MockLLMServer(error_rate=0.5, seed=0) as server:
+        engine = LLMEngine(concurrency=4, max_retries=10, backoff_base=0.01, backoff_max=0.05)
+        results, _ = run_echo_requests(server, engine, 20)
+
+    assert results == expected_echoes(20)
+    stats = engine.stats["openai"]
+    assert stats["retries"] == server.httpd.fault_count > 0
+    assert stats["rate_limited"] == 0
+    assert stats["failed"] == 0
+
+
+def test_backoff_grows_exponentially_with_full_jitter():
+    engine = LLMEngine(backoff_base=0.1, backoff_max=1.0)
+    for attempt, ceiling in enumerate([0.1, 0.2, 0.4, 0.8, 1.0, 1.0]):
+        delays = [engine.backoff_delay(attempt, http_error(503)) for _ in range(50)]
+        assert all(0.5 * ceiling <= delay <= ceiling for delay in delays)
+
+
+def test_non_retryable_error_is_not_retried():
+    async def bad_request():
+        raise type("BadRequestError", (Exception,), {"status_code": 400})("bad request")
+
+    engine = LLMEngine(backoff_base=0.01)
+    assert asyncio.run(engine.call("openai", bad_request)) is None
+    assert engine.stats["openai"]["requests"] == 1
+    assert engine.stats["openai"]["failed"] == 1
+
+
+def test_token_bucket_paces_requests_after_the_burst():
+    async def acquire_times(bucket, n):
+        t0 = time.perf_counter()
+        times = []
+        for _ in range(n):
+            await bucket.acquire()
+            times.append(time.perf_counter() - t0)
+        return times
+
+    # 600 requests/minute is one every 0.1s
+    times = asyncio.run(acquire_times(TokenBucket(600, burst=1), 6))
+    assert times[0] < 0.05
+    assert all(0.08 <= b - a < 0.2 for a, b in zip(times, times[1:]))
+
+
+def test_engine_rate_limit_applies_per_provider():
+    # 1200 requests/minute: a burst of 10, then one every 0.05s
+    with MockLLMServer() as server:
+        engine = LLMEngine(concurrency=30, requests_per_minute={"openai": 1200})
+        results, elapsed = run_echo_requests(server, engine, 30)
+        assert results == expected_echoes(30)
+        assert engine.stats["openai"]["retries"] == 0
+        assert elapsed >= 0.9
+
+        unlimited = LLMEngine(concurrency=30, requests_per_minute={"gemini": 60})
+        _, unlimited_elapsed = run_echo_requests(server, unlimited, 30)
+        assert unlimited.stats["openai"]["retries"] == 0
+        assert unlimited_elapsed < 0.9
+
+
+def test_token_bucket_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
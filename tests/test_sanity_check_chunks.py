@@ -0,0 +1,38 @@
+import json
+
+from sanity_check_chunks import read_manifest_lines
+
+
+def chunk(i, **overrides):
+    record = {"original_doc_id": "alice:ch01", "chunk_id": f"C-{i:04d}", "start": i * 10, "end": i * 10 + 10}
+    record.update(overrides)
+    return json.dumps(record)
+
+
+def test_every_bad_line_is_reported_with_its_line_number(tmp_path, capsys):
+    lines = [
+        chunk(0),
+        "{not json",
+        chunk(2, start="20"),
+        chunk(3, end=40.5),
+        json.dumps({"original_doc_id": "alice:ch01", "start": 40, "end": 50}),
+        "",
+        chunk(6, start=True),
+        "[1, 2]",
+        chunk(8, text=None),
+        chunk(9, text="x" * 10),
+    ]
+    manifest_path = tmp_path / "chunks_TEST.jsonl"
+    manifest_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    numbered_records, bad_lines = read_manifest_lines(manifest_path)
+
+    assert [line_num for line_num, _ in numbered_records] == [1, 10]
+    assert bad_lines == 7
+    errors = capsys.readouterr().err.splitlines()
+    assert [error.split(":")[1].split(",")[0].strip() for error in errors] == [
+        f"Line {n}" for n in (2, 3, 4, 5, 7, 8, 9)
+    ]
+    assert "start='20'" in errors[1]
+    assert "end=40.5" in errors[2]
+    assert "Missing fields: chunk_id" in errors[3]
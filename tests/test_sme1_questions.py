@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+from llm_engine import LLMEngine
+from mock_llm_server import MockLLMServer
+
+TEXT = (
+    "Alice was beginning to get very tired of sitting by her sister on the bank. "
+    "Once or twice she had peeped into the book her sister was reading. "
+    "So she was considering in her own mind what to do next. "
+    "Suddenly a White Rabbit with pink eyes ran close by her. "
+    "There was nothing so very remarkable in that, she thought. "
+    "The rabbit-hole went straight on like a tunnel for some way. "
+    "Down, down, down, would the fall never come to an end? "
+    "She found herself in a long, low hall lit by a row of lamps."
+)
+CHAPTERS = [{"docid": f"alice:ch{n:02d}", "title": f"Chapter {n}", "text": TEXT} for n in (1, 2, 3)]
+
+
+def load_or_generate(gsq, resume):
+    """Runs load_or_generate_sme1_questions against the mock; returns the questions and each hand-off."""
+    handed_on = []
+
+    def on_chapter_questions(entries):
+        # Every qid handed on to the annotation passes must already be saved
+        saved_qids = {q["qid"] for q in json.loads(gsq.QUESTIONS_SME1_PATH.read_text(encoding="utf-8"))}
+        assert {q["qid"] for q in entries} <= saved_qids
+        handed_on.append(entries)
+
+    async def run(server):
+        gsq.init_llm_clients(server.openai_base_url, server.gemini_base_url)
+        gsq.llm_engine = LLMEngine()
+        try:
+            return await gsq.load_or_generate_sme1_questions(CHAPTERS, resume, on_chapter_questions)
+        finally:
+            await gsq.client_openai.close()
+
+    with MockLLMServer() as server:
+        questions = asyncio.run(run(server))
+    return questions, handed_on
+
+
+def test_questions_are_saved_before_they_are_handed_on(isolated_generator):
+    gsq = isolated_generator
+    questions, handed_on = load_or_generate(gsq, resume=False)
+
+    assert len(handed_on) == len(CHAPTERS)
+    assert [q["docid"] for q in questions] == [chap["docid"] for chap in CHAPTERS for _ in range(6)]
+    assert json.loads(gsq.QUESTIONS_SME1_PATH.read_text(encoding="utf-8")) == questions
+
+
+def test_resume_keeps_saved_qids_and_generates_only_missing_chapters(isolated_generator):
+    # As left by a pipelined run interrupted after the second chapter's questions arrived
+    gsq = isolated_generator
+    saved = [{"qid": f"q_saved{i}", "question": f"Saved question {i}?", "docid": "alice:ch02", "group": "g1"}
+             for i in range(3)]
+    gsq.QUESTIONS_SME1_PATH.write_text(json.dumps(saved), encoding="utf-8")
+
+    questions, handed_on = load_or_generate(gsq, resume=True)
+
+    assert handed_on[0] == saved
+    assert sorted(entries[0]["docid"] for entries in handed_on[1:]) == ["alice:ch01", "alice:ch03"]
+    assert [q["docid"] for q in questions] == ["alice:ch01"] * 6 + ["alice:ch02"] * 3 + ["alice:ch03"] * 6
+    assert questions[6:9] == saved
+    assert json.loads(gsq.QUESTIONS_SME1_PATH.read_text(encoding="utf-8")) == questions
+
+
+def test_without_resume_saved_questions_are_replaced(isolated_generator):
+    gsq = isolated_generator
+    gsq.QUESTIONS_SME1_PATH.write_text(json.dumps([{"qid": "q_old", "question": "Old?", "docid": "alice:ch02"}]),
+                                       encoding="utf-8")
+
+    questions, _ = load_or_generate(gsq, resume=False)
+
+    assert "q_old" not in {q["qid"] for q in questions}
+    assert len(questions) == 6 * len(CHAPTERS)